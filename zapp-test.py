@@ -76,7 +76,7 @@ class FakeSQLManager:
             'time_end': None,
             'error_message': None
         }
-        e = Execution(e_dict, self)
+        e = Execution.from_dict(e_dict, self)
         self.executions.append(e)
         self._last_id += 1
         return self._last_id - 1
@@ -113,11 +113,14 @@ class FakeSQLManager:
             'service_group': service_group,
             'error_message': None
         }
-        s = Service(s_dict, self)
+        s = Service.from_dict(s_dict, self)
         self.services.append(s)
         self._last_id += 1
         return self._last_id - 1
 
+    def services_new(self, execution_id, services):
+        return [self.service_new(execution_id, name, service_group, description) for name, service_group, description in services]
+
 
 def load_configuration(test_conf=None):
     if test_conf is None:
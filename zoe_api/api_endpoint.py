@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
 import logging
 import re
 
@@ -43,10 +44,31 @@ class APIEndpoint:
             raise zoe_api.exceptions.ZoeAuthException()
         return e
 
-    def execution_list(self, uid, role, **filters):
-        execs = self.sql.execution_list(**filters)
-        ret = [e for e in execs if e.user_id == uid or role == 'admin']
-        return ret
+    def execution_list(self, uid, role, summary=False, order_by=None, after_id=None, limit=None, **filters):
+        """
+        Returns the executions that match the filters, non-admin users can see only their own executions.
+        Filters on time columns, and time range filters, take UNIX timestamps.
+        :param summary: return ExecutionSummary objects, without the application description
+        """
+        if role != 'admin':
+            filters['user_id'] = uid
+        for k in filters:
+            if k not in zoe_lib.sql_manager.filter_names(zoe_lib.sql_manager.EXECUTION_COLUMNS):
+                raise zoe_api.exceptions.ZoeException('Unknown execution filter: {}'.format(k))
+            if k.startswith('time_'):
+                try:
+                    if isinstance(filters[k], (list, tuple)):
+                        filters[k] = [datetime.datetime.fromtimestamp(float(v)) for v in filters[k]]
+                    else:
+                        filters[k] = datetime.datetime.fromtimestamp(float(filters[k]))
+                except (TypeError, ValueError, OverflowError, OSError):
+                    raise zoe_api.exceptions.ZoeException('The {} filter should be a UNIX timestamp'.format(k))
+        if limit is not None and int(limit) < 0:
+            raise zoe_api.exceptions.ZoeException('The limit cannot be negative')
+        try:
+            return self.sql.execution_list(summary=summary, order_by=order_by, after_id=after_id, limit=limit, **filters)
+        except ValueError as e:
+            raise zoe_api.exceptions.ZoeException(str(e))
 
     def execution_start(self, uid, role, exec_name, application_description):
         try:
@@ -89,9 +111,8 @@ class APIEndpoint:
         if e.is_active():
             raise zoe_api.exceptions.ZoeException('Cannot delete a running execution, terminate it first')
         else:
-            status, message = self.master.execution_delete(exec_id)
+            status, message = self.master.execution_delete(exec_id)  # the master deletes it, also from its memory
             if status:
-                self.sql.execution_delete(exec_id)
                 return True, ''
             else:
                 raise zoe_api.exceptions.ZoeException(message)
@@ -112,6 +133,12 @@ class APIEndpoint:
         if service.user_id != uid and role != 'admin':
             raise zoe_api.exceptions.ZoeAuthException()
 
+    def scheduler_stats(self, uid, role):
+        success, data = self.master.scheduler_stats()
+        if not success:
+            raise zoe_api.exceptions.ZoeException(data)
+        return data
+
     def retry_submit_error_executions(self):
         waiting_execs = self.sql.execution_list(status=zoe_lib.sql_manager.Execution.SUBMIT_STATUS)
         if waiting_execs is None or len(waiting_execs) == 0:
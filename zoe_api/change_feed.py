@@ -0,0 +1,112 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Delivers the status changes of executions and services, notified by SQLManager through PostgreSQL, to subscribers in
+the API process.
+"""
+
+import json
+import logging
+import select
+import threading
+
+import psycopg2
+
+from zoe_lib.sql_manager import change_channel
+
+log = logging.getLogger(__name__)
+
+
+class ChangeFeed(threading.Thread):
+    """
+    Listens on the change channel of the deployment with a dedicated connection. Events are dictionaries with the
+    table ('execution' or 'service'), the id and execution_id of the row and its new status.
+
+    Callbacks are called in the thread of the feed and must not block. Notifications sent while the connection is down
+    are lost, subscribers that cannot miss a change should read the state again after waiting.
+    """
+    POLL_TIMEOUT = 5  # seconds, how often the stop flag is checked
+    RECONNECT_DELAY = 5
+
+    def __init__(self, conf):
+        super().__init__(name='change-feed', daemon=True)
+        self.dsn = 'dbname=' + conf.dbname + \
+            ' user=' + conf.dbuser + \
+            ' password=' + conf.dbpass + \
+            ' host=' + conf.dbhost + \
+            ' port=' + str(conf.dbport)
+        self.channel = change_channel(conf.deployment_name)
+        self._subscribers = {}  # subscription ID -> (execution ID or None for all events, callback)
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def subscribe(self, callback, execution_id=None) -> int:
+        """
+        :param callback: function called with each event
+        :param execution_id: receive only the events of this execution and of its services
+        :return: the subscription ID, to unsubscribe
+        """
+        with self._lock:
+            self._counter += 1
+            self._subscribers[self._counter] = (execution_id, callback)
+            return self._counter
+
+    def unsubscribe(self, subscription: int):
+        with self._lock:
+            self._subscribers.pop(subscription, None)
+
+    def dispatch(self, event: dict):
+        with self._lock:
+            callbacks = [callback for execution_id, callback in self._subscribers.values() if execution_id is None or execution_id == event['execution_id']]
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception:
+                log.exception('Error in a change feed subscriber')
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute('LISTEN "{}"'.format(self.channel))
+            log.info('Listening for changes on channel {}'.format(self.channel))
+            while not self.stop_event.is_set():
+                if select.select([conn], [], [], self.POLL_TIMEOUT) == ([], [], []):
+                    continue
+                conn.poll()
+                while len(conn.notifies) > 0:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        event = json.loads(notify.payload)
+                    except ValueError:
+                        log.error('Malformed change notification: {}'.format(notify.payload))
+                        continue
+                    self.dispatch(event)
+        finally:
+            conn.close()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self._listen()
+            except Exception:  # the feed must outlive any error, subscribers would wait for their timeout otherwise
+                log.exception('Change feed connection lost, reconnecting')
+                self.stop_event.wait(self.RECONNECT_DELAY)
+
+    def quit(self):
+        self.stop_event.set()
@@ -52,6 +52,8 @@ def load_configuration():
     argparser.add_argument('--dbpass', help='DB password', default='zoe')
     argparser.add_argument('--dbhost', help='DB hostname', default='localhost')
     argparser.add_argument('--dbport', type=int, help='DB port', default=5432)
+    argparser.add_argument('--dbpool-size', type=int, help='Maximum number of connections to the database', default=8)
+    argparser.add_argument('--dbpool-timeout', type=float, help='Seconds to wait for a free database connection before failing', default=30)
 
     opts = argparser.parse_args()
     if opts.debug:
@@ -13,13 +13,146 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
+
 import psycopg2
 import psycopg2.extras
 
 import zoe_api.exceptions
 from zoe_api.config import get_conf
+from zoe_lib.sql_manager import description_hash
+
+log = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000  # rows rewritten per transaction by data migrations
+
+
+def _has_column(cur, table, column):
+    cur.execute("SELECT EXISTS(SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s)", (table, column))
+    return cur.fetchone()[0]
+
+
+def _move_descriptions(cur):
+    """Moves the descriptions of existing executions and services to the description table, in batches."""
+    for table in ('execution', 'service'):
+        if not _has_column(cur, table, 'description'):
+            continue  # already migrated
+        last_id = 0
+        while True:
+            cur.execute("SELECT id, description FROM {} WHERE id > %s AND description_hash IS NULL ORDER BY id LIMIT %s".format(table), (last_id, MIGRATION_BATCH_SIZE))
+            rows = cur.fetchall()
+            if len(rows) == 0:
+                break
+            hashes = {row_id: description_hash(description) for row_id, description in rows}
+            bodies = {hashes[row_id]: description for row_id, description in rows}
+            cur.connection.autocommit = False  # one transaction per batch
+            try:
+                psycopg2.extras.execute_values(cur, "INSERT INTO description (hash, body) VALUES %s ON CONFLICT (hash) DO NOTHING", list(bodies.items()), template='(%s, %s::jsonb)')
+                psycopg2.extras.execute_values(cur, "UPDATE {0} SET description_hash = v.hash FROM (VALUES %s) AS v (id, hash) WHERE {0}.id = v.id".format(table), list(hashes.items()))
+                cur.connection.commit()
+            except psycopg2.Error:
+                cur.connection.rollback()
+                raise
+            finally:
+                cur.connection.autocommit = True
+            last_id = rows[-1][0]
+
 
-SQL_SCHEMA_VERSION = 0  # ---> Increment this value every time the schema changes !!! <---
+def _add_description_hash_checks(cur):
+    """
+    Rejects new rows without a description hash, without scanning the tables: the checks are added NOT VALID and
+    validated once the remaining descriptions have been moved, with a lock that does not block writes.
+    """
+    for table in ('execution', 'service'):
+        name = table + '_description_hash_not_null'
+        cur.execute("SELECT EXISTS(SELECT 1 FROM pg_constraint WHERE conname = %s AND conrelid = %s::regclass)", (name, table))
+        if not cur.fetchone()[0]:
+            cur.execute("ALTER TABLE {} ADD CONSTRAINT {} CHECK (description_hash IS NOT NULL) NOT VALID".format(table, name))
+
+
+def _create_index(name, definition):
+    """
+    A migration step that builds an index without locking out writes. An interrupted concurrent build leaves behind an
+    invalid index, that IF NOT EXISTS would keep: it is dropped and built again.
+    :param definition: the table and columns of the index, with an optional WHERE clause
+    """
+    def step(cur):
+        cur.execute("SELECT pg_index.indisvalid FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+                    "JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace WHERE pg_class.relname = %s AND pg_namespace.nspname = current_schema()", (name,))
+        row = cur.fetchone()
+        if row is not None and not row[0]:
+            log.warning('Index {} was left invalid by an interrupted migration, building it again'.format(name))
+            cur.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
+        cur.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {}'.format(name, definition))
+    return step
+
+
+# Numbered migrations, MIGRATIONS[n - 1] brings the schema from version n - 1 to version n. Each migration is a list of
+# statements run in autocommit mode, so that indexes can be built CONCURRENTLY without locking out the running Zoe, or
+# of functions called with a cursor, for data migrations and index builds.
+# Steps must be idempotent: a migration interrupted half-way is run again from the start.
+# ---> Append a migration here every time the schema changes, never modify an existing one !!! <---
+MIGRATIONS = [
+    # 1: indexes for the queries run by the scheduler, the API and Execution.services, pages of the executions of a user,
+    # ordered by ID, are read from the index on (user_id, id)
+    [
+        _create_index('execution_user_id_id_idx', "execution (user_id, id)"),
+        _create_index('execution_active_status_idx', "execution (status) WHERE status NOT IN ('terminated', 'error')"),
+        _create_index('execution_time_end_idx', "execution (time_end) WHERE time_end IS NOT NULL"),
+        _create_index('service_execution_id_idx', "service (execution_id)"),
+        _create_index('service_active_status_idx', "service (status) WHERE status <> 'inactive'")
+    ],
+    # 2: descriptions are stored once, in a table keyed by the hash of their content
+    [
+        "CREATE TABLE IF NOT EXISTS description (hash TEXT PRIMARY KEY, body JSONB NOT NULL)",
+        "ALTER TABLE execution ADD COLUMN IF NOT EXISTS description_hash TEXT NULL REFERENCES description",
+        "ALTER TABLE service ADD COLUMN IF NOT EXISTS description_hash TEXT NULL REFERENCES description",
+        "ALTER TABLE execution ALTER COLUMN description DROP NOT NULL",  # new rows have only the hash, the column is dropped by migration 4
+        "ALTER TABLE service ALTER COLUMN description DROP NOT NULL",
+        _move_descriptions
+    ],
+    # 3: archive tables for finished executions, partitioned by month of termination, see SQLManager.archive_executions()
+    [
+        """CREATE TABLE IF NOT EXISTS execution_archive (
+            id INT NOT NULL,
+            name TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            description_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            execution_manager_id TEXT NULL,
+            time_submit TIMESTAMP NOT NULL,
+            time_start TIMESTAMP NULL,
+            time_end TIMESTAMP NOT NULL,
+            error_message TEXT NULL
+            ) PARTITION BY RANGE (time_end)""",
+        """CREATE TABLE IF NOT EXISTS service_archive (
+            id INT NOT NULL,
+            status TEXT NOT NULL,
+            error_message TEXT NULL,
+            description_hash TEXT NOT NULL,
+            execution_id INT NOT NULL,
+            service_group TEXT NOT NULL,
+            name TEXT NOT NULL,
+            docker_id TEXT NULL,
+            time_end TIMESTAMP NOT NULL
+            ) PARTITION BY RANGE (time_end)"""
+    ],
+    # 4: every row has a description hash, the old description columns are dropped
+    [
+        _add_description_hash_checks,
+        _move_descriptions,  # rows inserted by masters that were not upgraded yet, new ones are rejected by the checks
+        "ALTER TABLE execution VALIDATE CONSTRAINT execution_description_hash_not_null",
+        "ALTER TABLE service VALIDATE CONSTRAINT service_description_hash_not_null",
+        "ALTER TABLE execution ALTER COLUMN description_hash SET NOT NULL",  # the validated check spares the table scan
+        "ALTER TABLE service ALTER COLUMN description_hash SET NOT NULL",
+        "ALTER TABLE execution DROP CONSTRAINT IF EXISTS execution_description_hash_not_null",
+        "ALTER TABLE service DROP CONSTRAINT IF EXISTS service_description_hash_not_null",
+        "ALTER TABLE execution DROP COLUMN IF EXISTS description",
+        "ALTER TABLE service DROP COLUMN IF EXISTS description"
+    ]
+]
+
+SQL_SCHEMA_VERSION = len(MIGRATIONS)
 
 
 def version_table(cur):
@@ -33,17 +166,15 @@ def schema(cur, deployment_name):
 
 
 def check_schema_version(cur, deployment_name):
+    """Returns the schema version of the deployment, or None if its tables do not exist yet."""
     cur.execute("SELECT version FROM public.versions WHERE deployment = %s", (deployment_name,))
     row = cur.fetchone()
     if row is None:
-        cur.execute("INSERT INTO public.versions (deployment, version) VALUES (%s, %s)", (deployment_name, SQL_SCHEMA_VERSION))
-        schema(cur, deployment_name)
-        return False  # Tables need to be created
+        return None
+    elif row[0] > SQL_SCHEMA_VERSION:
+        raise zoe_api.exceptions.ZoeException('SQL database schema version mismatch: need {}, found {}'.format(SQL_SCHEMA_VERSION, row[0]))
     else:
-        if row[0] == SQL_SCHEMA_VERSION:
-            return True
-        else:
-            raise zoe_api.exceptions.ZoeException('SQL database schema version mismatch: need {}, found {}'.format(SQL_SCHEMA_VERSION, row[0]))
+        return row[0]
 
 
 def create_tables(cur):
@@ -71,6 +202,24 @@ def create_tables(cur):
         )''')
 
 
+def migrate(cur, deployment_name, version):
+    """
+    Applies the migrations needed to bring the schema from the given version to SQL_SCHEMA_VERSION.
+    :param cur: a cursor of a connection in autocommit mode
+    :param deployment_name: the deployment whose version is updated
+    :param version: the current version of the schema
+    """
+    while version < SQL_SCHEMA_VERSION:
+        version += 1
+        log.info('Migrating the SQL schema to version {}'.format(version))
+        for step in MIGRATIONS[version - 1]:
+            if callable(step):
+                step(cur)
+            else:
+                cur.execute(step)
+        cur.execute("UPDATE public.versions SET version = %s WHERE deployment = %s", (version, deployment_name))
+
+
 def init():
     dsn = 'dbname=' + get_conf().dbname + \
         ' user=' + get_conf().dbuser + \
@@ -79,14 +228,30 @@ def init():
         ' port=' + str(get_conf().dbport)
 
     conn = psycopg2.connect(dsn)
+    conn.autocommit = True
     cur = conn.cursor()
 
     version_table(cur)
     cur.execute('SET search_path TO {},public'.format(get_conf().deployment_name))
-    if not check_schema_version(cur, get_conf().deployment_name):
-        create_tables(cur)
+    cur.execute("SELECT pg_advisory_lock(hashtext(%s))", ('zoe_schema_' + get_conf().deployment_name,))  # other API processes wait for the migrations
+    try:
+        version = check_schema_version(cur, get_conf().deployment_name)
+        if version is None:
+            conn.autocommit = False  # create the tables in one transaction, a failure must not leave half of them behind
+            try:
+                schema(cur, get_conf().deployment_name)
+                create_tables(cur)
+                cur.execute("INSERT INTO public.versions (deployment, version) VALUES (%s, %s)", (get_conf().deployment_name, 0))
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                raise
+            conn.autocommit = True
+            version = 0
+        migrate(cur, get_conf().deployment_name, version)
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", ('zoe_schema_' + get_conf().deployment_name,))
 
-    conn.commit()
     cur.close()
     conn.close()
     return
@@ -19,11 +19,14 @@ from flask import Flask
 from tornado.wsgi import WSGIContainer
 from tornado.httpserver import HTTPServer
 from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.web import Application, FallbackHandler
 
 import zoe_api.config as config
 import zoe_api.db_init
 import zoe_api.api_endpoint
+from zoe_api.change_feed import ChangeFeed
 import zoe_api.rest_api
+from zoe_api.rest_api.wait import ExecutionWaitHandler
 import zoe_api.web
 
 log = logging.getLogger("zoe_api")
@@ -56,7 +59,14 @@ def zoe_web_main() -> int:
     app.register_blueprint(zoe_api.rest_api.api_init(api_endpoint))
     app.register_blueprint(zoe_api.web.web_init())
 
-    http_server = HTTPServer(WSGIContainer(app))
+    change_feed = ChangeFeed(args)
+    change_feed.start()
+
+    tornado_app = Application([
+        (zoe_api.rest_api.API_PATH + r'/execution/(\d+)/wait', ExecutionWaitHandler, {'api_endpoint': api_endpoint, 'change_feed': change_feed}),
+        (r'.*', FallbackHandler, {'fallback': WSGIContainer(app)})
+    ])
+    http_server = HTTPServer(tornado_app)
     http_server.listen(args.listen_port, args.listen_address)
     ioloop = IOLoop.instance()
 
@@ -67,3 +77,5 @@ def zoe_web_main() -> int:
         ioloop.start()
     except KeyboardInterrupt:
         print("CTRL-C detected, terminating")
+    finally:
+        change_feed.quit()
@@ -98,3 +98,9 @@ class APIManager:
             'service_id': service_id
         }
         return self._request_reply(msg)
+
+    def scheduler_stats(self):
+        msg = {
+            'command': 'scheduler_stats'
+        }
+        return self._request_reply(msg)
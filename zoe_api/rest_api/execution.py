@@ -17,6 +17,7 @@ from flask_restful import Resource, request
 from werkzeug.exceptions import BadRequest
 
 from zoe_api.rest_api.utils import catch_exceptions, get_auth
+from zoe_api.rest_api.query import PAGING_PARAMETERS, RESERVED_FILTERS
 import zoe_api.exceptions
 import zoe_api.api_endpoint
 
@@ -57,14 +58,35 @@ class ExecutionCollectionAPI(Resource):
     @catch_exceptions
     def get(self):
         """
-        Returns a list of all active executions.
+        Returns the executions of the calling user, or of all users for admins. The query string can filter, sort and
+        paginate them, for example ?status=running&status=scheduled&order_by=-id&limit=50&after_id=1234
+        Executions are summarized, without their application description, unless full=true is given.
 
         :return:
         """
         uid, role = get_auth(request)
 
-        execs = self.api_endpoint.execution_list(uid, role)
-        return [e.serialize() for e in execs]
+        full = request.args.get('full', 'false').lower() in ('1', 'true', 'yes')
+        filters = {}
+        for k in request.args:
+            if k == 'full':
+                continue
+            if k in RESERVED_FILTERS:
+                raise zoe_api.exceptions.ZoeRestAPIException('{} cannot be used as a query filter'.format(k))
+            values = request.args.getlist(k)
+            if k in PAGING_PARAMETERS and len(values) > 1:
+                raise zoe_api.exceptions.ZoeRestAPIException('{} can be given only once'.format(k))
+            if k == 'id' or PAGING_PARAMETERS.get(k) is int:
+                try:
+                    values = [int(v) for v in values]
+                except ValueError:
+                    raise zoe_api.exceptions.ZoeRestAPIException('{} must be an integer'.format(k))
+            filters[k] = values[0] if len(values) == 1 else values
+
+        if full:
+            return [e.serialize() for e in self.api_endpoint.execution_list(uid, role, **filters)]
+        else:
+            return [e.serialize_summary() for e in self.api_endpoint.execution_list(uid, role, summary=True, **filters)]
 
     @catch_exceptions
     def post(self):
@@ -20,6 +20,9 @@ from zoe_api.exceptions import ZoeRestAPIException
 import zoe_api.api_endpoint
 from zoe_api.rest_api.utils import catch_exceptions, get_auth
 
+PAGING_PARAMETERS = {'order_by': str, 'after_id': int, 'limit': int}  # passed to the execution query with the filters
+RESERVED_FILTERS = ('uid', 'role', 'summary')  # arguments of APIEndpoint.execution_list() that are not filters
+
 
 class QueryAPI(Resource):
     def __init__(self, api_endpoint: zoe_api.api_endpoint.APIEndpoint):
@@ -47,13 +50,19 @@ class QueryAPI(Resource):
             raise ZoeRestAPIException('query filters should be a dictionary of {attribute: requested_value} entries')
 
         if what == 'stats_scheduler':
-            # TODO
-            ret = None
+            ret = self.api_endpoint.scheduler_stats(uid, role)
         elif what == 'execution':
-            if role != 'admin':
-                filters['user_id'] = uid
-            execs = self.api_endpoint.execution_list(uid, role, **filters)
-            return [x.serialize() for x in execs]
+            filters = dict(filters)
+            for key, kind in PAGING_PARAMETERS.items():
+                if key in filters and (not isinstance(filters[key], kind) or isinstance(filters[key], bool)):
+                    raise ZoeRestAPIException('query parameter {} should be of type {}'.format(key, kind.__name__))
+            for key in RESERVED_FILTERS:
+                if key in filters:
+                    raise ZoeRestAPIException('{} cannot be used as a query filter'.format(key))
+            if data.get('full', False):
+                return [x.serialize() for x in self.api_endpoint.execution_list(uid, role, **filters)]
+            else:
+                return [x.serialize_summary() for x in self.api_endpoint.execution_list(uid, role, summary=True, **filters)]
         else:
             raise ZoeRestAPIException('unknown query {}'.format(what))
 
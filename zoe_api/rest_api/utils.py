@@ -52,8 +52,12 @@ def get_auth(request):
     if not auth:
         raise ZoeRestAPIException('missing or wrong authentication information', 401, {'WWW-Authenticate': 'Basic realm="Login Required"'})
 
+    return check_credentials(auth.username, auth.password)
+
+
+def check_credentials(username, password):
     authenticator = LDAPAuthenticator()
-    uid, role = authenticator.auth(auth.username, auth.password)
+    uid, role = authenticator.auth(username, password)
     if uid is None:
         raise ZoeRestAPIException('missing or wrong authentication information', 401, {'WWW-Authenticate': 'Basic realm="Login Required"'})
 
@@ -0,0 +1,105 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Long polling of execution status changes. It is a native Tornado handler and not a Flask resource: waiting requests must
+not block the IO loop that runs the WSGI application.
+"""
+
+import base64
+import datetime
+import logging
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.locks import Event
+import tornado.web
+
+from zoe_api.exceptions import ZoeRestAPIException, ZoeNotFoundException, ZoeAuthException, ZoeException
+from zoe_api.rest_api.utils import check_credentials
+
+log = logging.getLogger(__name__)
+
+
+class ExecutionWaitHandler(tornado.web.RequestHandler):
+    """
+    GET <API_PATH>/execution/<id>/wait?status=<status>&timeout=<seconds> replies with the execution as soon as its status
+    is different from the given one, or when the timeout expires.
+    """
+    MAX_TIMEOUT = 60
+
+    def initialize(self, api_endpoint, change_feed):
+        """
+        :type api_endpoint: zoe_api.api_endpoint.APIEndpoint
+        :type change_feed: zoe_api.change_feed.ChangeFeed
+        """
+        self.api_endpoint = api_endpoint
+        self.change_feed = change_feed
+
+    def _get_auth(self):
+        header = self.request.headers.get('Authorization', '')
+        if not header.startswith('Basic '):
+            raise ZoeRestAPIException('missing or wrong authentication information', 401, {'WWW-Authenticate': 'Basic realm="Login Required"'})
+        try:
+            username, _, password = base64.b64decode(header[len('Basic '):]).decode('utf-8').partition(':')
+        except ValueError:
+            raise ZoeRestAPIException('missing or wrong authentication information', 401, {'WWW-Authenticate': 'Basic realm="Login Required"'})
+        return check_credentials(username, password)
+
+    def _reply_error(self, message, status_code, headers=None):
+        self.set_status(status_code)
+        if headers is not None:
+            for name, value in headers.items():
+                self.set_header(name, value)
+        self.write({'message': message})
+
+    @gen.coroutine
+    def get(self, execution_id):
+        io_loop = IOLoop.current()
+        try:
+            uid, role = yield io_loop.run_in_executor(None, self._get_auth)  # LDAP and database calls block, they run in the thread pool of the loop
+            execution_id = int(execution_id)
+            known_status = self.get_argument('status', None)
+            try:
+                timeout = min(float(self.get_argument('timeout', self.MAX_TIMEOUT)), self.MAX_TIMEOUT)
+            except ValueError:
+                raise ZoeRestAPIException('timeout must be a number')
+
+            changed = Event()
+            subscription = self.change_feed.subscribe(lambda event: io_loop.add_callback(changed.set), execution_id)
+            try:
+                deadline = io_loop.time() + timeout
+                execution = yield io_loop.run_in_executor(None, self.api_endpoint.execution_by_id, uid, role, execution_id)  # read after subscribing, not to miss changes
+                while execution.status == known_status and io_loop.time() < deadline:
+                    try:
+                        yield changed.wait(timeout=datetime.timedelta(seconds=deadline - io_loop.time()))
+                    except gen.TimeoutError:
+                        break
+                    changed.clear()
+                    execution = yield io_loop.run_in_executor(None, self.api_endpoint.execution_by_id, uid, role, execution_id)
+            finally:
+                self.change_feed.unsubscribe(subscription)
+            self.write(execution.serialize())
+        except ZoeRestAPIException as e:
+            self._reply_error(e.message, e.status_code, e.headers)
+        except ZoeNotFoundException as e:
+            self._reply_error(e.message, 404)
+        except ZoeAuthException as e:
+            self._reply_error(e.message, 401)
+        except ZoeException as e:
+            self._reply_error(e.message, 400)
+        except Exception as e:
+            log.exception(str(e))
+            self._reply_error(str(e), 500)
@@ -87,13 +87,12 @@ def execution_inspect(execution_id):
     e = config.api_endpoint.execution_by_id(uid, role, execution_id)
 
     services_info = {}
-    if e.service_list is not None:
-        for s in e.service_list:
-            services_info[s.id] = config.api_endpoint.service_inspect(uid, role, s)
+    for s in e.services:
+        services_info[s.id] = config.api_endpoint.service_inspect(uid, role, s)
 
     template_vars = {
         "e": e,
-        "services": e.service_list,
+        "services": e.services,
         "services_info": services_info
     }
     return render_template('execution_inspect.html', **template_vars)
@@ -26,6 +26,8 @@ from zoe_api.web.utils import get_auth, catch_exceptions
 
 guest_id_pattern = re.compile('^\w+$')
 
+HOME_EXECUTIONS = 50  # most recent executions listed in the home page of a user
+
 
 @catch_exceptions
 def index():
@@ -38,7 +40,7 @@ def home_user():
     assert isinstance(config.api_endpoint, zoe_api.api_endpoint.APIEndpoint)
 
     if role == 'user' or role == 'admin':
-        executions = config.api_endpoint.execution_list(uid, role)
+        executions = config.api_endpoint.execution_list(uid, role, summary=True, order_by='-id', limit=HOME_EXECUTIONS)
 
         template_vars = {
             'executions': executions,
@@ -49,7 +49,8 @@ def app_get_cmd(args):
     if len(data) == 0:
         print("no such execution")
     else:
-        execution = data[0]
+        exec_api = ZoeExecutionsAPI(utils.zoe_url(), utils.zoe_user(), utils.zoe_pass())
+        execution = exec_api.execution_get(data[0]['id'])  # listings do not include the description
         json.dump(execution['description'], sys.stdout, sort_keys=True, indent=4)
 
 
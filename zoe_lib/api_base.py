@@ -58,14 +58,15 @@ class ZoeAPIBase:
         self.password = password
 
     @retry(ZoeAPIException)
-    def _rest_get(self, path):
+    def _rest_get(self, path, params=None):
         """
         :type path: str
+        :param params: query string arguments
         :rtype: (dict, int)
         """
         url = self.url + '/api/' + ZOE_API_VERSION + path
         try:
-            r = requests.get(url, auth=(self.user, self.password))
+            r = requests.get(url, auth=(self.user, self.password), params=params)
         except requests.exceptions.Timeout:
             raise ZoeAPIException('HTTP connection timeout')
         except requests.exceptions.HTTPError:
@@ -45,13 +45,15 @@ class ZoeExecutionsAPI(ZoeAPIBase):
         else:
             raise ZoeAPIException(data['message'])
 
-    def list(self):
+    def list(self, **filters):
         """
         Returns a list of all executions for the calling user, all of them if the user is admin.
 
+        :param filters: column values, lists of values or time ranges (time_submit_after=<UNIX timestamp>), and the
+            order_by, after_id and limit pagination arguments. Executions are summarized unless full=True is given.
         :return:
         """
-        data, status_code = self._rest_get('/execution')
+        data, status_code = self._rest_get('/execution', filters)
         if status_code == 200:
             return data
         else:
@@ -73,6 +75,22 @@ class ZoeExecutionsAPI(ZoeAPIBase):
         else:
             return None
 
+    def execution_wait(self, execution_id, status, timeout=60):
+        """
+        Waits until the status of an execution is different from the given one, or the timeout expires.
+
+        :param execution_id: the execution to wait for
+        :param status: the last known status of the execution
+        :param timeout: maximum number of seconds to wait, the server may wait less
+        :return: the execution
+        :rtype: dict
+        """
+        data, status_code = self._rest_get('/execution/' + str(execution_id) + '/wait', {'status': status, 'timeout': timeout})
+        if status_code == 200:
+            return data
+        else:
+            raise ZoeAPIException(data['message'])
+
     def execution_start(self, name, application_description):
         """
         Submit an application to the master to start a new execution.
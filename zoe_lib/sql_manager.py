@@ -13,17 +13,93 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import datetime
+import hashlib
+import json
+import logging
 
 import psycopg2
 import psycopg2.extras
 
 from zoe_master.config import get_conf
+from zoe_lib.sql_pool import ConnectionPool, CONNECTION_ERRORS
+
+log = logging.getLogger(__name__)
 
 psycopg2.extensions.register_adapter(dict, psycopg2.extras.Json)
 
 
+EXECUTION_COLUMNS = ('id', 'name', 'user_id', 'status', 'execution_manager_id', 'time_submit', 'time_start', 'time_end', 'error_message')
+EXECUTION_ORDER_COLUMNS = ('id', 'name', 'user_id', 'status', 'time_submit')  # NOT NULL columns, keyset pagination compares them as rows
+SERVICE_COLUMNS = ('id', 'status', 'error_message', 'execution_id', 'service_group', 'name', 'docker_id')
+EXECUTION_STORED_COLUMNS = ('id', 'name', 'user_id', 'description_hash', 'status', 'execution_manager_id', 'time_submit', 'time_start', 'time_end', 'error_message')
+SERVICE_STORED_COLUMNS = ('id', 'status', 'error_message', 'description_hash', 'execution_id', 'service_group', 'name', 'docker_id')
+
+# Finished executions are moved, with their services, to the execution_archive and service_archive tables, partitioned
+# by month of time_end. Queries that can match archived rows read from the union of the live and archive tables.
+ARCHIVED_STATUSES = ('terminated', 'error')
+EXECUTION_WITH_ARCHIVE = '(SELECT {0} FROM execution UNION ALL SELECT {0} FROM execution_archive) AS execution'.format(', '.join(EXECUTION_STORED_COLUMNS))
+EXECUTION_ARCHIVE = 'execution_archive AS execution'
+SERVICE_ARCHIVE = 'service_archive AS service'
+
+# application and service descriptions are stored once in the description table, keyed by the hash of their content
+# the columns the models are built from, in order, the description is read as text and decoded on first access
+EXECUTION_FIELDS = ('id', 'name', 'user_id', 'status', 'time_submit', 'time_start', 'time_end', 'error_message', 'description')
+SERVICE_FIELDS = ('id', 'name', 'status', 'error_message', 'execution_id', 'service_group', 'docker_id', 'description')
+EXECUTION_SELECT = 'SELECT ' + ', '.join('execution.' + c for c in EXECUTION_FIELDS[:-1]) + ', description.body::text ' \
+    'FROM {} JOIN description ON description.hash = execution.description_hash'
+SERVICE_SELECT = 'SELECT ' + ', '.join('service.' + c for c in SERVICE_FIELDS[:-1]) + ', description.body::text ' \
+    'FROM {} JOIN description ON description.hash = service.description_hash'
+INSERT_DESCRIPTIONS = 'INSERT INTO description (hash, body) VALUES {} ON CONFLICT (hash) DO NOTHING'
+EXECUTION_SUMMARY_PROJECTION = 'id, name, user_id, status, time_submit, time_start, time_end, ' \
+    '(SELECT count(*) FROM service WHERE service.execution_id = execution.id) AS service_count'
+EXECUTION_SUMMARY_PROJECTION_WITH_ARCHIVE = 'id, name, user_id, status, time_submit, time_start, time_end, ' \
+    '(SELECT count(*) FROM service WHERE service.execution_id = execution.id) + ' \
+    '(SELECT count(*) FROM service_archive WHERE service_archive.execution_id = execution.id AND service_archive.time_end = execution.time_end) AS service_count'
+TIME_RANGE_FILTERS = {'_after': '>=', '_before': '<'}  # suffixes of the time range filters on timestamp columns
+
+
+def filter_names(columns) -> set:
+    """The names of the filters accepted for a table with the given columns."""
+    names = set(columns)
+    for column in columns:
+        if column.startswith('time_'):
+            names.update(column + suffix for suffix in TIME_RANGE_FILTERS)
+    return names
+
+
+def change_channel(deployment_name: str) -> str:
+    """The channel of the PostgreSQL notifications sent when executions and services change status."""
+    return 'zoe_changes_' + deployment_name
+
+
+def description_hash(description: dict) -> str:
+    """The key of a description in the description table, the SHA-256 of its canonical JSON encoding."""
+    return hashlib.sha256(json.dumps(description, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+STALE_PREPARED_STATEMENT_ERRORS = ('26000', '42P05', '0A000')  # invalid_sql_statement_name, duplicate_prepared_statement, cached plan must not change result type
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """A connection that remembers which statements have been prepared in its session."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.stale = False  # the statements prepared in the session are deallocated before preparing new ones
+
+
 class SQLManager:
+    """
+    Access to the Zoe state in PostgreSQL. It can be shared by many threads: each operation leases a connection from a
+    pool for the duration of its transaction. Operations that fail because the connection broke are retried once on
+    a new connection, unless they insert rows.
+
+    The schema search path is set once per connection, when it is opened. Connections are in autocommit mode, so that
+    operations made of a single statement cost a single round trip, the hot ones are prepared on each connection the
+    first time they are used.
+    """
     def __init__(self, conf):
         self.user = conf.dbuser
         self.password = conf.dbpass
@@ -31,135 +107,447 @@ class SQLManager:
         self.port = conf.dbport
         self.dbname = conf.dbname
         self.schema = conf.deployment_name
-        self.conn = None
-        self._connect()
-
-    def _connect(self):
         dsn = 'dbname=' + self.dbname + \
               ' user=' + self.user + \
               ' password=' + self.password + \
               ' host=' + self.host + \
-              ' port=' + str(self.port)
-
-        self.conn = psycopg2.connect(dsn)
-
-    def _cursor(self):
-        cur = self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute('SET search_path TO {},public'.format(self.schema))
-        return cur
-
-    def execution_list(self, only_one=False, **kwargs):
-        cur = self._cursor()
-        q_base = 'SELECT * FROM execution'
-        if len(kwargs) > 0:
-            q = q_base + " WHERE "
-            filter_list = []
-            args_list = []
-            for k, v in kwargs.items():
+              ' port=' + str(self.port) + \
+              " options='-c search_path=" + self.schema + ",public'"
+        self.pool = ConnectionPool(dsn, conf.dbpool_size, conf.dbpool_timeout, connect=self._connect)
+        self.archive_partitions = set()  # months for which the archive partitions are known to exist
+        self.change_channel = change_channel(self.schema)
+
+    @staticmethod
+    def _connect(dsn):
+        conn = psycopg2.connect(dsn, connection_factory=PreparingConnection)
+        conn.autocommit = True
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self, atomic=False):
+        """
+        :param atomic: run the statements in a transaction, not needed for operations made of a single statement
+        """
+        with self.pool.connection() as conn:
+            if atomic:
+                conn.autocommit = False
+            try:
+                yield conn.cursor()
+                if atomic:
+                    conn.commit()
+            except psycopg2.Error as e:
+                if e.pgcode in STALE_PREPARED_STATEMENT_ERRORS:
+                    conn.prepared.clear()
+                    conn.stale = True
+                raise
+            finally:
+                if atomic and not conn.closed:
+                    try:
+                        conn.rollback()  # a no-op if it has been committed
+                        conn.autocommit = True
+                    except CONNECTION_ERRORS:
+                        pass  # the pool will discard it
+
+    def _run(self, operation, retry=True, atomic=False):
+        """
+        Runs operation(cursor) and returns its result.
+        :param retry: if the connection breaks, run the operation again on a new connection
+        :param atomic: run the operation in a transaction
+        """
+        try:
+            with self._transaction(atomic) as cur:
+                return operation(cur)
+        except psycopg2.Error as e:
+            if not retry or not (isinstance(e, CONNECTION_ERRORS) or e.pgcode in STALE_PREPARED_STATEMENT_ERRORS):
+                raise
+            log.warning('Database error, retrying: {}'.format(e))
+        with self._transaction(atomic) as cur:
+            return operation(cur)
+
+    @staticmethod
+    def _execute_prepared(cur, name, statement, args):
+        """
+        Executes a statement, preparing it first if it is the first time it is used on this connection.
+        :param name: name of the prepared statement
+        :param statement: SQL text, with $1, $2, ... placeholders
+        """
+        if cur.connection.stale:  # for example the columns of a table changed, the plans must be made again
+            cur.execute('DEALLOCATE ALL')
+            cur.connection.stale = False
+        if name not in cur.connection.prepared:
+            cur.execute('PREPARE {} AS {}'.format(name, statement))
+            cur.connection.prepared.add(name)
+        cur.execute('EXECUTE {} ({})'.format(name, ', '.join(['%s'] * len(args))), args)
+
+    def _update_statement(self, table, row_id, kwargs):
+        """
+        Builds an update of some columns of a row, with a statement prepared for each combination of columns.
+        Status changes are notified to the listeners of the change channel in the same statement.
+        :return: the name of the prepared statement, its SQL text and its arguments
+        """
+        columns = sorted(kwargs.keys())
+        name = 'update_{}_{}'.format(table, '_'.join(columns))
+        set_q = ', '.join('{} = ${}'.format(column, idx + 1) for idx, column in enumerate(columns))
+        statement = 'UPDATE {} SET {} WHERE id = ${}'.format(table, set_q, len(columns) + 1)
+        args = [kwargs[column] for column in columns] + [row_id]
+        if 'status' in kwargs:
+            statement = 'WITH u AS ({} RETURNING id, {}, status) '.format(statement, 'id AS execution_id' if table == 'execution' else 'execution_id') + \
+                "SELECT pg_notify(${}, json_build_object('table', '{}', 'id', u.id, 'execution_id', u.execution_id, 'status', u.status)::text) FROM u".format(len(columns) + 2, table)
+            args.append(self.change_channel)
+        return name, statement, args
+
+    def _update(self, table, row_id, kwargs):
+        name, statement, args = self._update_statement(table, row_id, kwargs)
+        self._run(lambda cur: self._execute_prepared(cur, name, statement, args))
+
+    def update_many(self, updates: list):
+        """
+        Applies many updates in one transaction, in order. They are idempotent, so the whole batch is retried if the
+        connection breaks.
+        :param updates: list of (table, row ID, {column: value}) tuples, table is 'execution' or 'service'
+        """
+        statements = [self._update_statement(table, row_id, kwargs) for table, row_id, kwargs in updates]
+
+        def op(cur):
+            for name, statement, args in statements:
+                self._execute_prepared(cur, name, statement, args)
+        self._run(op, atomic=len(statements) > 1)
+
+    def pool_stats(self) -> dict:
+        """Usage of the connection pool, including the time threads spent waiting for a connection."""
+        return self.pool.stats()
+
+    @staticmethod
+    def _where(columns, kwargs):
+        """
+        Builds a WHERE clause that matches all the given filters:
+        - column=value: the column is equal to the value
+        - column=[value, ...]: the column is equal to one of the values
+        - time_column_after=t, time_column_before=t: the time is in the range [after, before)
+        Raises ValueError for filters on unknown columns.
+        """
+        if len(kwargs) == 0:
+            return '', []
+        allowed = filter_names(columns)
+        filter_list = []
+        args_list = []
+        for k, v in sorted(kwargs.items()):
+            if k not in allowed:
+                raise ValueError('unknown filter: {}'.format(k))
+            if k not in columns:
+                suffix = next(s for s in TIME_RANGE_FILTERS if k.endswith(s))
+                filter_list.append('{} {} %s'.format(k[:-len(suffix)], TIME_RANGE_FILTERS[suffix]))
+            elif isinstance(v, (list, tuple, set)):
+                filter_list.append('{} = ANY(%s)'.format(k))
+                v = list(v)
+            else:
                 filter_list.append('{} = %s'.format(k))
-                args_list.append(v)
-            q += ', '.join(filter_list)
-            query = cur.mogrify(q, args_list)
-        else:
-            query = cur.mogrify(q_base)
+            args_list.append(v)
+        return ' WHERE ' + ' AND '.join(filter_list), args_list
 
-        cur.execute(query)
+    @staticmethod
+    def _order(order_by, after_id, limit, relation='execution'):
+        """
+        Builds the ORDER BY and LIMIT clauses of a page of executions, and the condition that skips the previous pages.
+        :param order_by: column name, prefixed with '-' for descending order, ties are broken by ID
+        :param after_id: ID of the last execution of the previous page
+        :param limit: maximum number of executions in the page
+        :param relation: the table, or union of tables, the executions are read from
+        """
+        descending = order_by.startswith('-')
+        column = order_by.lstrip('-')
+        if column not in EXECUTION_ORDER_COLUMNS:
+            raise ValueError('cannot order by {}'.format(column))
+        direction = ' DESC' if descending else ''
+        comparison = '<' if descending else '>'
+        if after_id is None:
+            keyset, args_list = None, []
+        elif column == 'id':
+            keyset, args_list = 'id {} %s'.format(comparison), [after_id]
+        else:
+            keyset = '({0}, id) {1} (SELECT {0}, id FROM {2} WHERE id = %s)'.format(column, comparison, relation)
+            args_list = [after_id]
+        if column == 'id':
+            order = ' ORDER BY id' + direction
+        else:
+            order = ' ORDER BY {0}{1}, id{1}'.format(column, direction)
+        if limit is not None:
+            order += ' LIMIT %s'
+        return keyset, args_list, order
+
+    @staticmethod
+    def _may_be_archived(kwargs):
+        """False if the filters exclude the statuses of archived executions."""
+        if 'status' not in kwargs:
+            return True
+        statuses = kwargs['status'] if isinstance(kwargs['status'], (list, tuple, set)) else [kwargs['status']]
+        return any(status in ARCHIVED_STATUSES for status in statuses)
+
+    def execution_list(self, only_one=False, include_services=False, summary=False, order_by=None, after_id=None, limit=None, **kwargs):
+        """
+        Returns the executions that match all the given filters, see _where() for their syntax. Archived executions are
+        included, unless the filters exclude them: lists read from the live and archive tables at once, while the
+        archive is searched for a single execution only if it is not found in the live table.
+        :param only_one: return the first matching execution, or None
+        :param include_services: load the services of all the executions with one additional query
+        :param summary: return ExecutionSummary objects, that do not load the application description
+        :param order_by: column to sort by, prefixed by '-' for descending order
+        :param after_id: keyset pagination, return the executions that follow this one in the requested order
+        :param limit: maximum number of executions to return
+        """
         if only_one:
-            row = cur.fetchone()
-            if row is None:
-                return None
-            return Execution(row, self)
+            relations = ['execution', EXECUTION_ARCHIVE] if self._may_be_archived(kwargs) else ['execution']
         else:
+            relations = [EXECUTION_WITH_ARCHIVE] if self._may_be_archived(kwargs) else ['execution']
+        queries = [self._execution_query(relation, summary, order_by, after_id, limit, kwargs) for relation in relations]
+        model = ExecutionSummary if summary else Execution
+
+        def op(cur):
+            for query, args_list in queries:
+                if query == EXECUTION_SELECT.format('execution') + ' WHERE id = %s':
+                    self._execute_prepared(cur, 'execution_by_id', EXECUTION_SELECT.format('execution') + ' WHERE id = $1', args_list)
+                else:
+                    cur.execute(query, args_list)
+                if only_one:
+                    row = cur.fetchone()
+                    executions = [model(row, self)] if row is not None else []
+                else:
+                    executions = [model(x, self) for x in cur]
+                if len(executions) > 0:
+                    break
+            if include_services:
+                self._attach_services(cur, executions)
+            if only_one:
+                return executions[0] if len(executions) > 0 else None
+            return executions
+        return self._run(op)
+
+    def _execution_query(self, relation, summary, order_by, after_id, limit, kwargs):
+        where, args_list = self._where(EXECUTION_COLUMNS, kwargs)
+        if summary:
+            projection = EXECUTION_SUMMARY_PROJECTION_WITH_ARCHIVE if relation == EXECUTION_WITH_ARCHIVE else EXECUTION_SUMMARY_PROJECTION
+            query = 'SELECT {} FROM {}'.format(projection, relation) + where
+        else:
+            query = EXECUTION_SELECT.format(relation) + where
+        if order_by is not None or after_id is not None or limit is not None:
+            keyset, keyset_args, order = self._order(order_by if order_by is not None else 'id', after_id, limit, relation)
+            if keyset is not None:
+                query += (' AND ' if len(where) > 0 else ' WHERE ') + keyset
+                args_list += keyset_args
+            query += order
+            if limit is not None:
+                args_list.append(limit)
+        return query, args_list
+
+    def _attach_services(self, cur, executions):
+        if len(executions) == 0:
+            return
+        by_execution = {e.id: [] for e in executions}
+        cur.execute(SERVICE_SELECT.format('service') + ' WHERE execution_id = ANY(%s) ORDER BY id', (list(by_execution.keys()),))
+        for row in cur:
+            service = Service(row, self)
+            by_execution[service.execution_id].append(service)
+        archived = [exec_id for exec_id, services in by_execution.items() if len(services) == 0]
+        if len(archived) > 0:
+            cur.execute(SERVICE_SELECT.format(SERVICE_ARCHIVE) + ' WHERE execution_id = ANY(%s) ORDER BY id', (archived,))
+            for row in cur:
+                service = Service(row, self)
+                by_execution[service.execution_id].append(service)
+        for e in executions:
+            e._services = by_execution[e.id]
+
+    def load_services(self, executions: list):
+        """Loads the services of many executions with a single query, replacing the ones they have cached."""
+        self._run(lambda cur: self._attach_services(cur, executions))
+
+    def execution_list_ended_after(self, time_end: datetime.datetime):
+        """Returns the executions that were started and ended after the given time."""
+        def op(cur):
+            cur.execute(EXECUTION_SELECT.format(EXECUTION_WITH_ARCHIVE) + ' WHERE time_start IS NOT NULL AND time_end >= %s', (time_end,))
             return [Execution(x, self) for x in cur]
+        return self._run(op)
 
     def execution_update(self, exec_id, **kwargs):
-        cur = self._cursor()
-        arg_list = []
-        value_list = []
-        for k, v in kwargs.items():
-            arg_list.append('{} = %s'.format(k))
-            value_list.append(v)
-        set_q = ", ".join(arg_list)
-        value_list.append(exec_id)
-        q_base = 'UPDATE execution SET ' + set_q + ' WHERE id=%s'
-        query = cur.mogrify(q_base, value_list)
-        cur.execute(query)
-        self.conn.commit()
+        self._update('execution', exec_id, kwargs)
 
     def execution_new(self, name, user_id, description):
-        cur = self._cursor()
         status = Execution.SUBMIT_STATUS
         time_submit = datetime.datetime.now()
-        query = cur.mogrify('INSERT INTO execution (id, name, user_id, description, status, time_submit) VALUES (DEFAULT, %s,%s,%s,%s,%s) RETURNING id', (name, user_id, description, status, time_submit))
-        cur.execute(query)
-        self.conn.commit()
-        return cur.fetchone()[0]
+        d_hash = description_hash(description)
+
+        def op(cur):
+            cur.execute('WITH d AS (' + INSERT_DESCRIPTIONS.format('(%s, %s::jsonb)') + ') '
+                        'INSERT INTO execution (id, name, user_id, description_hash, status, time_submit) VALUES (DEFAULT, %s,%s,%s,%s,%s) RETURNING id',
+                        (d_hash, description, name, user_id, d_hash, status, time_submit))
+            return cur.fetchone()[0]
+        return self._run(op, retry=False)
 
     def execution_delete(self, execution_id):
-        cur = self._cursor()
-        query = "DELETE FROM service WHERE execution_id = %s"
-        cur.execute(query, (execution_id,))
-        query = "DELETE FROM execution WHERE id = %s"
-        cur.execute(query, (execution_id,))
-        self.conn.commit()
+        def op(cur):
+            cur.execute("DELETE FROM service WHERE execution_id = %s", (execution_id,))
+            cur.execute("DELETE FROM execution WHERE id = %s", (execution_id,))
+            cur.execute("DELETE FROM service_archive WHERE execution_id = %s", (execution_id,))
+            cur.execute("DELETE FROM execution_archive WHERE id = %s", (execution_id,))
+        self._run(op, atomic=True)
+
+    def _archive_partitions(self, cur, months):
+        """Creates the monthly partitions of the archive tables that do not exist yet."""
+        for month in sorted(months):
+            if month in self.archive_partitions:
+                continue
+            next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+            suffix = month.strftime('%Y_%m')
+            cur.execute("CREATE TABLE IF NOT EXISTS execution_archive_{0} PARTITION OF execution_archive FOR VALUES FROM (%s) TO (%s)".format(suffix), (month, next_month))
+            cur.execute("CREATE INDEX IF NOT EXISTS execution_archive_{0}_id_idx ON execution_archive_{0} (id)".format(suffix))
+            cur.execute("CREATE INDEX IF NOT EXISTS execution_archive_{0}_user_id_id_idx ON execution_archive_{0} (user_id, id)".format(suffix))
+            cur.execute("CREATE TABLE IF NOT EXISTS service_archive_{0} PARTITION OF service_archive FOR VALUES FROM (%s) TO (%s)".format(suffix), (month, next_month))
+            cur.execute("CREATE INDEX IF NOT EXISTS service_archive_{0}_id_idx ON service_archive_{0} (id)".format(suffix))
+            cur.execute("CREATE INDEX IF NOT EXISTS service_archive_{0}_execution_id_idx ON service_archive_{0} (execution_id)".format(suffix))
+
+    def archive_executions(self, ended_before: datetime.datetime, batch_size: int) -> int:
+        """
+        Moves a batch of finished executions, and their services, to the archive tables, in one transaction.
+        :param ended_before: archive the executions that ended before this time
+        :param batch_size: maximum number of executions to move
+        :return: the number of executions archived
+        """
+        service_columns = ', '.join(SERVICE_STORED_COLUMNS)
+        moved_service_columns = ', '.join('moved.' + c for c in SERVICE_STORED_COLUMNS)
+        execution_columns = ', '.join(EXECUTION_STORED_COLUMNS)
+
+        def op(cur):
+            cur.execute("SELECT id, time_end FROM execution WHERE status = ANY(%s) AND time_end < %s ORDER BY time_end LIMIT %s FOR UPDATE SKIP LOCKED",
+                        (list(ARCHIVED_STATUSES), ended_before, batch_size))
+            rows = cur.fetchall()
+            if len(rows) == 0:
+                return 0, set()
+            ids = [exec_id for exec_id, time_end in rows]
+            months = {datetime.datetime(time_end.year, time_end.month, 1) for exec_id, time_end in rows}
+            self._archive_partitions(cur, months)
+            cur.execute("WITH moved AS (DELETE FROM service WHERE execution_id = ANY(%s) RETURNING {0}) "
+                        "INSERT INTO service_archive ({0}, time_end) SELECT {1}, execution.time_end FROM moved JOIN execution ON execution.id = moved.execution_id".format(service_columns, moved_service_columns), (ids,))
+            cur.execute("WITH moved AS (DELETE FROM execution WHERE id = ANY(%s) RETURNING {0}) "
+                        "INSERT INTO execution_archive ({0}) SELECT {0} FROM moved".format(execution_columns), (ids,))
+            return len(ids), months
+        count, months = self._run(op, atomic=True)
+        self.archive_partitions.update(months)  # only once the transaction that created them has been committed
+        return count
 
     def service_list(self, only_one=False, **kwargs):
-        cur = self._cursor()
-        q_base = 'SELECT * FROM service'
-        if len(kwargs) > 0:
-            q = q_base + " WHERE "
-            filter_list = []
-            args_list = []
-            for k, v in kwargs.items():
-                filter_list.append('{} = %s'.format(k))
-                args_list.append(v)
-            q += ', '.join(filter_list)
-            query = cur.mogrify(q, args_list)
-        else:
-            query = cur.mogrify(q_base)
-
-        cur.execute(query)
-        if only_one:
-            row = cur.fetchone()
-            if row is None:
-                return None
-            return Service(row, self)
-        else:
-            return [Service(x, self) for x in cur]
+        """Returns the services that match all the given filters, the archive is searched if none is found by ID or execution ID."""
+        where, args_list = self._where(SERVICE_COLUMNS, kwargs)
+
+        def op(cur):
+            if where == ' WHERE id = %s':
+                self._execute_prepared(cur, 'service_by_id', SERVICE_SELECT.format('service') + ' WHERE id = $1', args_list)
+            elif where == ' WHERE execution_id = %s':
+                self._execute_prepared(cur, 'services_by_execution', SERVICE_SELECT.format('service') + ' WHERE execution_id = $1', args_list)
+            else:
+                cur.execute(SERVICE_SELECT.format('service') + where, args_list)
+            services = [Service(x, self) for x in cur]
+            if len(services) == 0 and ('id' in kwargs or 'execution_id' in kwargs):
+                cur.execute(SERVICE_SELECT.format(SERVICE_ARCHIVE) + where, args_list)
+                services = [Service(x, self) for x in cur]
+            if only_one:
+                return services[0] if len(services) > 0 else None
+            return services
+        return self._run(op)
 
     def service_update(self, service_id, **kwargs):
-        cur = self._cursor()
-        arg_list = []
-        value_list = []
-        for k, v in kwargs.items():
-            arg_list.append('{} = %s'.format(k))
-            value_list.append(v)
-        set_q = ", ".join(arg_list)
-        value_list.append(service_id)
-        q_base = 'UPDATE service SET ' + set_q + ' WHERE id=%s'
-        query = cur.mogrify(q_base, value_list)
-        cur.execute(query)
-        self.conn.commit()
+        self._update('service', service_id, kwargs)
 
     def service_new(self, execution_id, name, service_group, description):
-        cur = self._cursor()
         status = 'created'
-        query = cur.mogrify('INSERT INTO service (id, status, error_message, execution_id, name, service_group, description) VALUES (DEFAULT, %s,NULL,%s,%s,%s,%s) RETURNING id', (status, execution_id, name, service_group, description))
-        cur.execute(query)
-        self.conn.commit()
-        return cur.fetchone()[0]
+        d_hash = description_hash(description)
+
+        def op(cur):
+            cur.execute('WITH d AS (' + INSERT_DESCRIPTIONS.format('(%s, %s::jsonb)') + ') '
+                        'INSERT INTO service (id, status, error_message, execution_id, name, service_group, description_hash) VALUES (DEFAULT, %s,NULL,%s,%s,%s,%s) RETURNING id',
+                        (d_hash, description, status, execution_id, name, service_group, d_hash))
+            return cur.fetchone()[0]
+        return self._run(op, retry=False)
+
+    def services_new(self, execution_id, services: list) -> list:
+        """
+        Creates many services of an execution with a single statement.
+        :param services: list of (name, service_group, description) tuples
+        :return: the IDs of the new services, in the same order
+        """
+        if len(services) == 0:
+            return []
+        status = 'created'
+
+        def op(cur):
+            hashes = {}  # each service description is stored once, it is the same for all the replicas of a group
+            description_values = []
+            values = []
+            for name, service_group, description in services:
+                if service_group not in hashes:
+                    hashes[service_group] = description_hash(description)
+                    description_values.append(cur.mogrify('(%s, %s::jsonb)', (hashes[service_group], description)).decode('utf-8'))
+                values.append(cur.mogrify('(DEFAULT, %s, NULL, %s, %s, %s, %s)', (status, execution_id, name, service_group, hashes[service_group])).decode('utf-8'))
+            cur.execute('WITH d AS (' + INSERT_DESCRIPTIONS.format(', '.join(description_values)) + ') '
+                        'INSERT INTO service (id, status, error_message, execution_id, name, service_group, description_hash) VALUES ' + ', '.join(values) + ' RETURNING id, service_group, name')
+            rows = cur.fetchall()
+            if len(rows) != len(services):
+                raise psycopg2.DataError('inserted {} services, expected {}'.format(len(rows), len(services)))
+            ids = {(service_group, name): service_id for service_id, service_group, name in rows}  # RETURNING does not guarantee the order of VALUES
+            return [ids[(service_group, name)] for name, service_group, description in services]
+        keys = set((service_group, name) for name, service_group, description in services)
+        if len(keys) != len(services):
+            raise ValueError('service names must be unique within a group')
+        return self._run(op, retry=False, atomic=True)
+
+
+def _decode_json(value):
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+def _decode_time(value):
+    if isinstance(value, (int, float)):  # UNIX timestamp
+        return datetime.datetime.fromtimestamp(value)
+    return value
+
+
+class _Lazy:
+    """A field stored raw in a slot and decoded the first time it is read."""
+    __slots__ = ('slot', 'decode')
+
+    def __init__(self, slot, decode):
+        self.slot = slot
+        self.decode = decode
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        raw = getattr(obj, self.slot)
+        value = self.decode(raw)
+        if value is not raw:
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
 
 
 class Base:
     """
+    Models are built from rows of a plain cursor, with the columns in the order given by the FIELDS attribute, or from
+    dictionaries with from_dict().
+
     :type sql_manager: SQLManager
     """
-    def __init__(self, d, sql_manager):
-        """
-        :type sql_manager: SQLManager
-        """
-        self.sql_manager = sql_manager
-        self.id = d['id']
+    __slots__ = ('sql_manager', 'id', '__weakref__')
+    FIELDS = ()
+
+    def __init__(self, row, sql_manager):
+        raise NotImplementedError
+
+    @classmethod
+    def from_dict(cls, d, sql_manager):
+        return cls(tuple(d[f] for f in cls.FIELDS), sql_manager)
 
     def serialize(self):
         raise NotImplementedError
@@ -171,6 +559,8 @@ class Execution(Base):
     :type time_start: datetime.datetime
     :type time_end: datetime.datetime
     """
+    __slots__ = ('name', 'user_id', '_status', 'error_message', '_time_submit', '_time_start', '_time_end', '_description', '_services')
+    FIELDS = EXECUTION_FIELDS
 
     SUBMIT_STATUS = "submitted"
     SCHEDULED_STATUS = "scheduled"
@@ -180,30 +570,15 @@ class Execution(Base):
     CLEANING_UP_STATUS = "cleaning up"
     TERMINATED_STATUS = "terminated"
 
-    def __init__(self, d, sql_manager):
-        super().__init__(d, sql_manager)
-
-        self.user_id = d['user_id']
-        self.name = d['name']
-        self.description = d['description']
-
-        if isinstance(d['time_submit'], datetime.datetime):
-            self.time_submit = d['time_submit']
-        else:
-            self.time_submit = datetime.datetime.fromtimestamp(d['time_submit'])
-
-        if isinstance(d['time_submit'], datetime.datetime):
-            self.time_start = d['time_start']
-        else:
-            self.time_start = datetime.datetime.fromtimestamp(d['time_start'])
+    description = _Lazy('_description', _decode_json)
+    time_submit = _Lazy('_time_submit', _decode_time)
+    time_start = _Lazy('_time_start', _decode_time)
+    time_end = _Lazy('_time_end', _decode_time)
 
-        if isinstance(d['time_submit'], datetime.datetime):
-            self.time_end = d['time_end']
-        else:
-            self.time_submit = datetime.datetime.fromtimestamp(d['time_start'])
-
-        self._status = d['status']
-        self.error_message = d['error_message']
+    def __init__(self, row, sql_manager):
+        self.sql_manager = sql_manager
+        self.id, self.name, self.user_id, self._status, self._time_submit, self._time_start, self._time_end, self.error_message, self._description = row
+        self._services = None
 
     def serialize(self):
         return {
@@ -218,12 +593,25 @@ class Execution(Base):
             'error_message': self.error_message
         }
 
+    def serialize_summary(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'name': self.name,
+            'status': self._status,
+            'time_submit': self.time_submit.timestamp(),
+            'time_start': None if self.time_start is None else self.time_start.timestamp(),
+            'time_end': None if self.time_end is None else self.time_end.timestamp(),
+            'service_count': len(self.services)  # like ExecutionSummary, without decoding the description
+        }
+
     def __eq__(self, other):
         return self.id == other.id
 
     def set_scheduled(self):
         self._status = self.SCHEDULED_STATUS
-        self.sql_manager.execution_update(self.id, status=self._status)
+        self.time_end = None  # it goes back in the queue after a preemption or a failed start
+        self.sql_manager.execution_update(self.id, status=self._status, time_end=self.time_end)
 
     def set_starting(self):
         self._status = self.STARTING_STATUS
@@ -258,7 +646,7 @@ class Execution(Base):
         self.sql_manager.execution_update(self.id, error_message=self.error_message)
 
     def is_active(self):
-        return self._status == 'scheduled' or self._status == 'running'
+        return self._status in (self.SCHEDULED_STATUS, self.STARTING_STATUS, self.RUNNING_STATUS)
 
     @property
     def status(self):
@@ -266,26 +654,58 @@ class Execution(Base):
 
     @property
     def services(self):
-        return self.sql_manager.service_list(execution_id=self.id)
+        """The services of this execution, loaded on first access and cached."""
+        if self._services is None:
+            self._services = self.sql_manager.service_list(execution_id=self.id)
+        return self._services
+
+    def invalidate_services(self):
+        """Forget the cached services, call it when services are created or changed through other objects."""
+        self._services = None
+
+
+class ExecutionSummary(Base):
+    """The columns of an execution shown in listings, without the application description. It is read-only."""
+    __slots__ = ('name', 'user_id', 'status', 'time_submit', 'time_start', 'time_end', 'service_count')
+    FIELDS = ('id', 'name', 'user_id', 'status', 'time_submit', 'time_start', 'time_end', 'service_count')
+
+    def __init__(self, row, sql_manager):
+        self.sql_manager = sql_manager
+        self.id, self.name, self.user_id, self.status, self.time_submit, self.time_start, self.time_end, self.service_count = row
+
+    def serialize_summary(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'name': self.name,
+            'status': self.status,
+            'time_submit': self.time_submit.timestamp(),
+            'time_start': None if self.time_start is None else self.time_start.timestamp(),
+            'time_end': None if self.time_end is None else self.time_end.timestamp(),
+            'service_count': self.service_count
+        }
+
+    def serialize(self):
+        return self.serialize_summary()
+
+    def __eq__(self, other):
+        return self.id == other.id
 
 
 class Service(Base):
+    __slots__ = ('name', 'status', 'error_message', 'execution_id', 'service_group', 'docker_id', '_description')
+    FIELDS = SERVICE_FIELDS
 
     TERMINATING_STATUS = "terminating"
     INACTIVE_STATUS = "inactive"
     ACTIVE_STATUS = "active"
     STARTING_STATUS = "starting"
 
-    def __init__(self, d, sql_manager):
-        super().__init__(d, sql_manager)
+    description = _Lazy('_description', _decode_json)
 
-        self.name = d['name']
-        self.status = d['status']
-        self.error_message = d['error_message']
-        self.execution_id = d['execution_id']
-        self.description = d['description']
-        self.service_group = d['service_group']
-        self.docker_id = d['docker_id']
+    def __init__(self, row, sql_manager):
+        self.sql_manager = sql_manager
+        self.id, self.name, self.status, self.error_message, self.execution_id, self.service_group, self.docker_id, self._description = row
 
     def serialize(self):
         return {
@@ -305,14 +725,29 @@ class Service(Base):
     def dns_name(self):
         return "{}-{}-{}".format(self.name, self.execution_id, get_conf().deployment_name)
 
+    @property
+    def replica_index(self):
+        """Services are replicas of a service description, named after it and numbered from 0."""
+        return int(self.name[len(self.service_group):])
+
+    @property
+    def is_essential(self):
+        return self.replica_index < int(self.description['essential_count'])
+
     def set_terminating(self):
-        self.sql_manager.service_update(self.id, status=self.TERMINATING_STATUS)
+        self.status = self.TERMINATING_STATUS
+        self.sql_manager.service_update(self.id, status=self.status)
 
     def set_inactive(self):
-        self.sql_manager.service_update(self.id, status=self.INACTIVE_STATUS, docker_id=None)
+        self.status = self.INACTIVE_STATUS
+        self.docker_id = None
+        self.sql_manager.service_update(self.id, status=self.status, docker_id=self.docker_id)
 
     def set_starting(self):
-        self.sql_manager.service_update(self.id, status=self.STARTING_STATUS)
+        self.status = self.STARTING_STATUS
+        self.sql_manager.service_update(self.id, status=self.status)
 
     def set_active(self, docker_id):
-        self.sql_manager.service_update(self.id, status=self.ACTIVE_STATUS, docker_id=docker_id)
+        self.status = self.ACTIVE_STATUS
+        self.docker_id = docker_id
+        self.sql_manager.service_update(self.id, status=self.status, docker_id=self.docker_id)
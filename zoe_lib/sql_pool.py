@@ -0,0 +1,170 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A thread-safe pool of PostgreSQL connections.
+"""
+
+import contextlib
+import logging
+import threading
+import time
+
+import psycopg2
+
+from zoe_lib.exceptions import ZoeException
+
+log = logging.getLogger(__name__)
+
+# errors after which a connection cannot be trusted anymore
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class ConnectionPool:
+    """
+    Leases connections to one thread at a time. Connections are created on demand up to a maximum size, threads that find
+    the pool exhausted wait for a connection to be returned.
+
+    Broken connections are discarded and replaced transparently: connections idle for more than HEALTH_CHECK_IDLE
+    seconds are checked with a trivial query before being leased.
+    """
+    HEALTH_CHECK_IDLE = 30  # seconds
+
+    def __init__(self, dsn: str, size: int, timeout: float, connect=psycopg2.connect):
+        """
+        :param dsn: libpq connection string
+        :param size: maximum number of open connections
+        :param timeout: seconds a thread waits for a free connection before giving up
+        :param connect: function that opens a new connection
+        """
+        self.dsn = dsn
+        self.size = size
+        self.timeout = timeout
+        self._connect = connect
+        self._idle = []  # list of (connection, time it was returned to the pool)
+        self._open_count = 0
+        self._cond = threading.Condition()
+        self.wait_count = 0
+        self.wait_time_total = 0
+        self.wait_time_max = 0
+        self.reconnects = 0
+
+    def _open(self):
+        return self._connect(self.dsn)
+
+    def _healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.time() - idle_since < self.HEALTH_CHECK_IDLE:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+        except CONNECTION_ERRORS:
+            return False
+        return True
+
+    def getconn(self):
+        """Leases a connection, opening a new one if needed. Raises ZoeException if none is available within the timeout."""
+        start = time.time()
+        with self._cond:
+            while len(self._idle) == 0 and self._open_count >= self.size:
+                remaining = self.timeout - (time.time() - start)
+                if remaining <= 0:
+                    raise ZoeException('Timeout waiting for a database connection')
+                self._cond.wait(remaining)
+            waited = time.time() - start
+            self.wait_count += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+            if len(self._idle) > 0:
+                conn, idle_since = self._idle.pop()
+            else:
+                conn, idle_since = None, None
+            self._open_count += 1 if conn is None else 0
+
+        if conn is not None and not self._healthy(conn, idle_since):
+            log.warning('Discarding a broken database connection')
+            self._close(conn)
+            self.reconnects += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._open_count -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def putconn(self, conn, broken=False):
+        """Returns a leased connection to the pool, broken connections are closed."""
+        if broken or conn.closed:
+            self._close(conn)
+            with self._cond:
+                self._open_count -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Leases a connection for the duration of a transaction: it is committed if the block completes, rolled back otherwise.
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except CONNECTION_ERRORS:
+                broken = True
+            raise
+        finally:
+            self.putconn(conn, broken)
+
+    def closeall(self):
+        with self._cond:
+            for conn, idle_since in self._idle:
+                self._close(conn)
+            self._open_count -= len(self._idle)
+            self._idle = []
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._open_count,
+                'idle': len(self._idle),
+                'wait_count': self.wait_count,
+                'wait_time_total': self.wait_time_total,
+                'wait_time_max': self.wait_time_max,
+                'reconnects': self.reconnects
+            }
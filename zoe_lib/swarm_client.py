@@ -126,6 +126,11 @@ class SwarmClient:
         else:
             log_config = docker.utils.LogConfig(type="json-file")
 
+        environment = options.environment
+        if options.node_constraint is not None:  # Swarm scheduling filters are passed as environment variables
+            environment = ['{}={}'.format(k, v) for k, v in environment.items()]
+            environment.append('constraint:node==' + options.node_constraint)
+
         try:
             host_config = self.cli.create_host_config(network_mode=options.network_name,
                                                       binds=options.get_volume_binds(),
@@ -135,7 +140,7 @@ class SwarmClient:
                                                       port_bindings=port_bindings,
                                                       log_config=log_config)
             cont = self.cli.create_container(image=image,
-                                             environment=options.environment,
+                                             environment=environment,
                                              network_disabled=False,
                                              host_config=host_config,
                                              detach=True,
@@ -286,6 +291,7 @@ class DockerContainerOptions:
         self.restart = True
         self.labels = []
         self.gelf_log_address = ''
+        self.node_constraint = None
 
     def add_env_variable(self, name, value):
         if value is not None:
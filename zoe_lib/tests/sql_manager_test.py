@@ -0,0 +1,140 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+
+import psycopg2
+import pytest
+
+from zoe_lib.sql_manager import SQLManager, Execution, EXECUTION_COLUMNS, description_hash
+from zoe_lib.sql_pool import ConnectionPool
+
+
+def test_where():
+    where, args = SQLManager._where(EXECUTION_COLUMNS, {'user_id': 'alice', 'status': ['running', 'scheduled'], 'time_submit_before': 10})
+    assert where == ' WHERE status = ANY(%s) AND time_submit < %s AND user_id = %s'
+    assert args == [['running', 'scheduled'], 10, 'alice']
+    assert SQLManager._where(EXECUTION_COLUMNS, {}) == ('', [])
+    with pytest.raises(ValueError):
+        SQLManager._where(EXECUTION_COLUMNS, {'description': 'x'})
+
+
+def test_order():
+    assert SQLManager._order('id', 5, 10) == ('id > %s', [5], ' ORDER BY id LIMIT %s')
+    keyset, args, order = SQLManager._order('-time_submit', 5, None)
+    assert keyset == '(time_submit, id) < (SELECT time_submit, id FROM execution WHERE id = %s)'
+    assert order == ' ORDER BY time_submit DESC, id DESC'
+    with pytest.raises(ValueError):
+        SQLManager._order('time_end', None, None)
+
+
+def test_description_hash(application_dict):
+    reordered = dict(reversed(list(application_dict.items())))
+    assert description_hash(reordered) == description_hash(application_dict)
+    assert description_hash(dict(application_dict, name='other')) != description_hash(application_dict)
+
+
+def test_lazy_fields(application_dict):
+    row = (1, 'test', 'alice', 'running', datetime.datetime(2016, 1, 1), None, None, None, json.dumps(application_dict))
+    execution = Execution(row, None)
+    assert not hasattr(execution, '__dict__')
+    assert isinstance(execution._description, str)
+    assert execution.description == application_dict
+    assert execution.description is execution.description  # decoded once
+
+    execution = Execution.from_dict(dict(zip(Execution.FIELDS, row), time_submit=1451606400, description=application_dict), None)
+    assert execution.time_submit == datetime.datetime.fromtimestamp(1451606400)
+    assert execution.time_start is None
+    assert execution.description is application_dict
+
+
+class ReversingCursor:
+    """Returns the rows of an INSERT ... RETURNING in reverse order, PostgreSQL does not guarantee it."""
+    def __init__(self, rows):
+        self.rows = rows
+
+    @staticmethod
+    def mogrify(template, args):
+        return template.encode('utf-8')
+
+    def execute(self, query):
+        pass
+
+    def fetchall(self):
+        return list(reversed(self.rows))
+
+
+def test_services_new_maps_ids_by_name():
+    sql = SQLManager.__new__(SQLManager)
+    rows = [(10, 'master', 'spark-master0'), (11, 'worker', 'spark-worker0'), (12, 'worker', 'spark-worker1')]
+    sql._run = lambda operation, retry, atomic: operation(ReversingCursor(rows))
+    services = [('spark-master0', 'master', {}), ('spark-worker0', 'worker', {}), ('spark-worker1', 'worker', {})]
+    assert sql.services_new(1, services) == [10, 11, 12]
+
+    sql._run = lambda operation, retry, atomic: operation(ReversingCursor(rows[:2]))
+    with pytest.raises(psycopg2.DataError):
+        sql.services_new(1, services)
+    with pytest.raises(ValueError):
+        sql.services_new(1, [('spark-worker0', 'worker', {}), ('spark-worker0', 'worker', {})])
+
+
+class CachedPlanError(psycopg2.NotSupportedError):
+    pgcode = '0A000'  # cached plan must not change result type, after a migration changed the columns of a table
+
+
+class PlanCachingConnection:
+    """Fails the first execution of a prepared statement, like PostgreSQL after a migration."""
+    def __init__(self):
+        self.closed = 0
+        self.prepared = set()
+        self.stale = False
+        self.plan_changed = True
+        self.queries = []
+        self.connection = self  # it is also its own cursor
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, args=None):
+        self.queries.append(query.split(' ')[0] + ' ' + query.split(' ')[1])
+        if query.startswith('EXECUTE') and self.plan_changed:
+            self.plan_changed = False
+            raise CachedPlanError()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_changed_plans_are_prepared_again():
+    sql = SQLManager.__new__(SQLManager)
+    sql.change_channel = 'changes'
+    conn = PlanCachingConnection()
+    sql.pool = ConnectionPool('', 1, 1, connect=lambda dsn: conn)
+    conn.prepared.add('update_execution_error_message')  # prepared before the migration
+    sql.execution_update(1, error_message='x')
+    assert conn.queries == ['EXECUTE update_execution_error_message', 'DEALLOCATE ALL', 'PREPARE update_execution_error_message', 'EXECUTE update_execution_error_message']
+    assert not conn.stale and conn.prepared == {'update_execution_error_message'}
+
+
+def test_summary_does_not_decode_the_description(application_dict):
+    row = (1, 'test', 'alice', 'running', datetime.datetime(2016, 1, 1), None, None, None, json.dumps(application_dict))
+    execution = Execution(row, None)
+    execution._services = ['master', 'worker0', 'worker1']
+    assert execution.serialize_summary()['service_count'] == 3
+    assert isinstance(execution._description, str)
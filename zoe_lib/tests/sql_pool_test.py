@@ -0,0 +1,83 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import psycopg2
+import pytest
+
+from zoe_lib.exceptions import ZoeException
+from zoe_lib.sql_pool import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        if self.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        self.commits += 1
+
+    def rollback(self):
+        if self.closed:
+            raise psycopg2.InterfaceError('connection already closed')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def test_connection_pool():
+    opened = []
+
+    def connect(dsn):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    pool = ConnectionPool('', size=2, timeout=0.1, connect=connect)
+    with pool.connection() as c1:
+        with pool.connection() as c2:
+            assert c1 is not c2
+            with pytest.raises(ZoeException):
+                pool.getconn()  # exhausted
+    assert c1.commits == 1 and len(opened) == 2
+
+    with pytest.raises(ValueError):
+        with pool.connection() as c:
+            raise ValueError()
+    assert c.rollbacks == 1 and not c.closed
+
+    # a connection that broke is replaced
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as c:
+            c.close()
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+    assert pool.stats()['open'] == 1
+    with pool.connection() as c:
+        assert not c.closed
+
+    # threads wait for a connection to be returned
+    conn = pool.getconn()
+    other = pool.getconn()
+    t = threading.Timer(0.05, pool.putconn, (other,))
+    t.start()
+    pool.timeout = 5
+    assert pool.getconn() is other
+    t.join()
+    assert pool.stats()['wait_time_max'] >= 0.04
+    pool.putconn(conn)
@@ -13,8 +13,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import time
-
 from zoe_lib.workspace import ZoeWorkspace
 from zoe_lib.executions import ZoeExecutionsAPI
 from zoe_lib.services import ZoeServiceAPI
@@ -52,8 +50,7 @@ class ZoeWorkFlow:
     def wait_termination(self, exec_id):
         execution = self.exec_api.execution_get(exec_id)
         while execution['status'] == 'submitted' or execution['status'] == 'running':
-            time.sleep(1)
-            execution = self.exec_api.execution_get(exec_id)
+            execution = self.exec_api.execution_wait(exec_id, execution['status'])
 
     def __enter__(self):
         self.start_workflow()
@@ -0,0 +1,66 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Periodically moves finished executions out of the live tables, into the monthly partitions of the archive tables.
+"""
+
+import datetime
+import logging
+import threading
+
+from zoe_lib.sql_manager import SQLManager
+
+log = logging.getLogger(__name__)
+
+
+class ExecutionArchiver(threading.Thread):
+    """Archives the executions that ended more than a retention period ago, in small transactions."""
+    def __init__(self, sql_manager: SQLManager, retention: float, interval: float, batch_size: int):
+        """
+        :param retention: days after which a terminated execution is archived
+        :param interval: seconds between archival runs
+        :param batch_size: executions moved in each transaction
+        """
+        super().__init__(name='archiver', daemon=True)
+        self.sql_manager = sql_manager
+        self.retention = retention
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stop_event = threading.Event()
+
+    def archive(self) -> int:
+        """Archives all the executions past the retention period, returns their number."""
+        ended_before = datetime.datetime.now() - datetime.timedelta(days=self.retention)
+        total = 0
+        while not self.stop_event.is_set():
+            count = self.sql_manager.archive_executions(ended_before, self.batch_size)
+            total += count
+            if count < self.batch_size:
+                break
+        if total > 0:
+            log.info('Archived {} executions that ended before {}'.format(total, ended_before))
+        return total
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.archive()
+            except Exception:
+                log.exception('Error archiving executions')
+            self.stop_event.wait(self.interval)
+
+    def quit(self):
+        self.stop_event.set()
@@ -52,12 +52,34 @@ def load_configuration(test_conf=None):
         argparser.add_argument('--gelf-address', help='Enable Docker GELF log output to this destination (ex. udp://1.2.3.4:1234)', default='')
         argparser.add_argument('--workspace-base-path', help='Path where user workspaces will be created by Zoe. Must be visible at this path on all Swarm hosts.', default='/mnt/zoe-workspaces')
         argparser.add_argument('--overlay-network-name', help='Name of the Swarm overlay network Zoe should use', default='zoe')
+        argparser.add_argument('--max-concurrent-starts', type=int, help='Maximum number of executions the scheduler starts at the same time', default=4)
+        argparser.add_argument('--max-parallel-spawns', type=int, help='Maximum number of services with the same startup order spawned at the same time for an execution', default=8)
+        argparser.add_argument('--max-parallel-removals', type=int, help='Maximum number of containers removed at the same time for an execution that is terminated', default=8)
+        argparser.add_argument('--max-concurrent-terminations', type=int, help='Maximum number of executions the scheduler terminates at the same time', default=4)
+        argparser.add_argument('--scheduler-policy', choices=['FIFO', 'PRIORITY', 'FAIR'], help='Order in which queued executions are started', default='FIFO')
+        argparser.add_argument('--priority-aging-rate', type=float, help='Priority points gained per second of waiting by queued executions (PRIORITY policy)', default=0.1)
+        argparser.add_argument('--fair-share-half-life', type=float, help='Half-life in seconds of the resource consumption of users (FAIR policy)', default=86400)
+        argparser.add_argument('--placement-policy', choices=['none', 'binpack', 'spread'], help='Admission control and placement of services on Swarm nodes, based on their memory requirements', default='none')
+        argparser.add_argument('--backfill', action='store_true', help='Enable EASY backfilling of batch executions (requires a placement policy)')
+        argparser.add_argument('--preemption', action='store_true', help='Terminate and requeue lower priority executions to make room for higher priority ones (requires a placement policy)')
+        argparser.add_argument('--preemption-priority-gap', type=int, help='Minimum priority difference between an execution and the executions it can preempt', default=128)
+        argparser.add_argument('--preemption-min-runtime', type=int, help='Executions that started less than this number of seconds ago cannot be preempted', default=30)
+        argparser.add_argument('--start-retry-max-attempts', type=int, help='Number of attempts at starting an execution that fails with temporary errors, before giving up', default=8)
+        argparser.add_argument('--start-retry-base-delay', type=float, help='Seconds to wait before retrying a failed start, doubled at each attempt', default=5)
 
         argparser.add_argument('--dbname', help='DB name', default='zoe')
         argparser.add_argument('--dbuser', help='DB user', default='zoe')
         argparser.add_argument('--dbpass', help='DB password', default='zoe')
         argparser.add_argument('--dbhost', help='DB hostname', default='localhost')
         argparser.add_argument('--dbport', type=int, help='DB port', default=5432)
+        argparser.add_argument('--dbpool-size', type=int, help='Maximum number of connections to the database', default=8)
+        argparser.add_argument('--dbpool-timeout', type=float, help='Seconds to wait for a free database connection before failing', default=30)
+        argparser.add_argument('--state-write-delay', type=float, help='Seconds during which state changes are grouped in one database transaction', default=0.005)
+        argparser.add_argument('--state-write-batch-size', type=int, help='Maximum number of state changes written in one database transaction', default=1000)
+        argparser.add_argument('--state-flush-timeout', type=float, help='Seconds to wait for pending state changes to be written before failing a query', default=60)
+        argparser.add_argument('--archive-retention', type=float, help='Days after which terminated executions are moved to the archive tables, 0 to disable archival', default=30)
+        argparser.add_argument('--archive-interval', type=float, help='Seconds between runs of the execution archiver', default=3600)
+        argparser.add_argument('--archive-batch-size', type=int, help='Number of executions moved to the archive in each transaction', default=500)
 
         opts = argparser.parse_args()
         if opts.debug:
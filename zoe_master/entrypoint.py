@@ -17,6 +17,7 @@
 
 import logging
 
+from zoe_master.archiver import ExecutionArchiver
 from zoe_master.scheduler import ZoeScheduler
 import zoe_master.config as config
 from zoe_master.master_api import APIManager
@@ -27,6 +28,7 @@ from zoe_master.execution_manager import restart_resubmit_scheduler
 from zoe_lib.metrics.influxdb import InfluxDBMetricSender
 from zoe_lib.metrics.base import BaseMetricSender
 from zoe_lib.sql_manager import SQLManager
+from zoe_master.state_store import StateStore
 
 log = logging.getLogger("main")
 LOG_FORMAT = '%(asctime)-15s %(levelname)s %(name)s (%(threadName)s): %(message)s'
@@ -52,7 +54,8 @@ def main():
     logging.getLogger("tornado").setLevel(logging.DEBUG)
 
     log.info("Initializing DB manager")
-    config.singletons['sql_manager'] = SQLManager(args)
+    config.singletons['sql_manager'] = StateStore(SQLManager(args), args.state_write_delay, args.state_write_batch_size, args.state_flush_timeout)
+    config.singletons['sql_manager'].load()
 
     log.info("Initializing workspace managers")
     fswk = ZoeFSWorkspace()
@@ -75,6 +78,10 @@ def main():
 
     restart_resubmit_scheduler()
 
+    if args.archive_retention > 0:
+        config.singletons['archiver'] = ExecutionArchiver(config.singletons['sql_manager'], args.archive_retention, args.archive_interval, args.archive_batch_size)
+        config.singletons['archiver'].start()
+
     log.info("Starting ZMQ API server...")
     config.singletons['api_server'] = APIManager()
 
@@ -86,4 +93,7 @@ def main():
         log.exception('fatal error')
     finally:
         config.scheduler.quit()
+        if 'archiver' in config.singletons:
+            config.singletons['archiver'].quit()
         config.singletons['api_server'].quit()
+        config.singletons['sql_manager'].quit()  # write the pending state changes
@@ -31,3 +31,7 @@ class ZoeStartExecutionRetryException(ZoeException):
 
 class ZoeStartExecutionFatalException(ZoeException):
     pass
+
+
+class ZoeStartExecutionCancelledException(ZoeException):
+    pass
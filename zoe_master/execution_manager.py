@@ -24,10 +24,13 @@ log = logging.getLogger(__name__)
 
 
 def _digest_application_description(execution: Execution):
+    services = []
     for service_descr in execution.description['services']:
         for counter in range(service_descr['total_count']):
             name = "{}{}".format(service_descr['name'], counter)
-            config.singletons['sql_manager'].service_new(execution.id, name, service_descr['name'], service_descr)
+            services.append((name, service_descr['name'], service_descr))
+    config.singletons['sql_manager'].services_new(execution.id, services)
+    execution.invalidate_services()
 
 
 def execution_submit(execution: Execution):
@@ -55,3 +58,4 @@ def restart_resubmit_scheduler():
 def execution_delete(execution: Execution):
     assert isinstance(config.scheduler, ZoeScheduler)
     config.scheduler.remove_execution(execution)
+    config.singletons['sql_manager'].execution_delete(execution.id)
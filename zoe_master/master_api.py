@@ -19,7 +19,7 @@ import time
 import zmq
 
 from zoe_master.exceptions import ZoeException
-import zoe_lib.sql_manager
+from zoe_master.state_store import StateStore
 from zoe_lib.swarm_client import SwarmClient
 
 import zoe_master.config as config
@@ -50,47 +50,57 @@ class APIManager:
         self.debug_has_replied = True
 
     def loop(self):
-        assert isinstance(config.singletons['sql_manager'], zoe_lib.sql_manager.SQLManager)
+        assert isinstance(config.singletons['sql_manager'], StateStore)
         while True:
             message = self.zmq_s.recv_json()
             self.debug_has_replied = False
             start_time = time.time()
-            if message['command'] == 'execution_start':
-                exec_id = message['exec_id']
-                execution = config.singletons['sql_manager'].execution_list(id=exec_id, only_one=True)
-                if execution is None:
-                    self._reply_error('Execution ID {} not found'.format(message['exec_id']))
-                else:
-                    execution.set_scheduled()
-                    self._reply_ok()
-                    zoe_master.execution_manager.execution_submit(execution)
-            elif message['command'] == 'execution_terminate':
-                exec_id = message['exec_id']
-                execution = config.singletons['sql_manager'].execution_list(id=exec_id, only_one=True)
-                if execution is None:
-                    self._reply_error('Execution ID {} not found'.format(message['exec_id']))
-                else:
-                    execution.set_cleaning_up()
+            try:
+                if message['command'] == 'execution_start':
+                    exec_id = message['exec_id']
+                    execution = config.singletons['sql_manager'].execution_list(id=exec_id, only_one=True)
+                    if execution is None:
+                        self._reply_error('Execution ID {} not found'.format(message['exec_id']))
+                    else:
+                        execution.set_scheduled()
+                        self._reply_ok()
+                        zoe_master.execution_manager.execution_submit(execution)
+                elif message['command'] == 'execution_terminate':
+                    exec_id = message['exec_id']
+                    execution = config.singletons['sql_manager'].execution_list(id=exec_id, only_one=True)
+                    if execution is None:
+                        self._reply_error('Execution ID {} not found'.format(message['exec_id']))
+                    else:
+                        execution.set_cleaning_up()
+                        self._reply_ok()
+                        zoe_master.execution_manager.execution_terminate(execution)
+                elif message['command'] == 'execution_delete':
+                    exec_id = message['exec_id']
+                    execution = config.singletons['sql_manager'].execution_list(id=exec_id, only_one=True)
+                    if execution is not None:
+                        zoe_master.execution_manager.execution_delete(execution)
                     self._reply_ok()
-                    zoe_master.execution_manager.execution_terminate(execution)
-            elif message['command'] == 'execution_delete':
-                exec_id = message['exec_id']
-                execution = config.singletons['sql_manager'].execution_list(id=exec_id, only_one=True)
-                if execution is not None:
-                    zoe_master.execution_manager.execution_delete(execution)
-                self._reply_ok()
-            elif message['command'] == 'service_inspect':
-                service_id = message['service_id']
-                service = config.singletons['sql_manager'].service_list(id=service_id, only_one=True)
-                if service is None:
-                    self._reply_error('no such service')
+                elif message['command'] == 'service_inspect':
+                    service_id = message['service_id']
+                    service = config.singletons['sql_manager'].service_list(id=service_id, only_one=True)
+                    if service is None:
+                        self._reply_error('no such service')
+                    else:
+                        swarm = SwarmClient(config.get_conf())
+                        info = swarm.inspect_container(service.docker_id)
+                        self._reply_ok(info)
+                elif message['command'] == 'scheduler_stats':
+                    stats = config.scheduler.stats_snapshot()
+                    stats['db_pool'] = config.singletons['sql_manager'].pool_stats()
+                    stats['state_pending_writes'] = config.singletons['sql_manager'].pending_writes()
+                    self._reply_ok(stats)
                 else:
-                    swarm = SwarmClient(config.get_conf())
-                    info = swarm.inspect_container(service.docker_id)
-                    self._reply_ok(info)
-            else:
-                log.error('Unknown command: {}'.format(message['command']))
-                self._reply_error('unknown command')
+                    log.error('Unknown command: {}'.format(message['command']))
+                    self._reply_error('unknown command')
+            except Exception as e:
+                log.exception('Error processing command {}'.format(message['command']))  # for example the database is not reachable
+                if not self.debug_has_replied:
+                    self._reply_error(str(e))
 
             if not self.debug_has_replied:
                 self._reply_error('bug')
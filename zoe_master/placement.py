@@ -0,0 +1,104 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Admission control and placement of services on Swarm nodes, based on the memory reserved by each service.
+"""
+
+import logging
+
+from zoe_lib.sql_manager import Service
+from zoe_master.stats import SwarmStats
+
+log = logging.getLogger(__name__)
+
+
+class ClusterState:
+    """
+    The free memory of each Swarm node, as seen by the scheduler.
+    """
+    def __init__(self, free_memory: dict):
+        self.free_memory = free_memory
+
+    @classmethod
+    def from_swarm_stats(cls, stats: SwarmStats):
+        free_memory = {}
+        for node in stats.nodes:
+            if node.status is not None and node.status != 'Healthy':
+                continue
+            free_memory[node.name] = node.memory_total - node.memory_reserved
+        return cls(free_memory)
+
+    def copy(self):
+        return ClusterState(dict(self.free_memory))
+
+    def reserve(self, placement: dict, memory: dict):
+        """
+        Subtract the memory of placed services from the node they have been placed on.
+        :param placement: service ID -> node name
+        :param memory: service ID -> reserved memory in bytes
+        """
+        for service_id, node in placement.items():
+            if node in self.free_memory:
+                self.free_memory[node] -= memory[service_id]
+
+    def release(self, placement: dict, memory: dict):
+        """The opposite of reserve()."""
+        for service_id, node in placement.items():
+            if node in self.free_memory:
+                self.free_memory[node] += memory[service_id]
+
+    @property
+    def total_free_memory(self):
+        return sum(self.free_memory.values())
+
+
+def service_memory(service: Service) -> int:
+    return int(service.description['required_resources']['memory'])
+
+
+def _choose_node(cluster: ClusterState, memory: int, policy: str):
+    candidates = [(free, node) for node, free in cluster.free_memory.items() if free >= memory]
+    if len(candidates) == 0:
+        return None
+    if policy == 'binpack':  # best fit: the node that will have the least free memory left
+        return min(candidates)[1]
+    else:  # spread, worst fit: the node with the most free memory
+        return max(candidates)[1]
+
+
+def place_services(services: list, cluster: ClusterState, policy: str):
+    """
+    Find a node for each service, essential services first and larger services first within each group.
+    On success the placed memory is reserved in the cluster state.
+    :param services: the services of an execution
+    :param cluster: the current state of the cluster, modified only if the essential services fit
+    :param policy: binpack or spread
+    :return: a dictionary service ID -> node name or None if some essential service does not fit. Non-essential services that do not fit are not included.
+    """
+    trial = cluster.copy()
+    placement = {}
+    memory = {s.id: service_memory(s) for s in services}
+    ordered = sorted(services, key=lambda s: (not s.is_essential, -memory[s.id]))
+    for service in ordered:
+        node = _choose_node(trial, memory[service.id], policy)
+        if node is None:
+            if service.is_essential:
+                return None
+            continue
+        placement[service.id] = node
+        trial.free_memory[node] -= memory[service.id]
+    cluster.reserve(placement, memory)
+    return placement
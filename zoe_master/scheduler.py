@@ -13,22 +13,122 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
 import logging
+import random
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from zoe_lib.sql_manager import Execution
+from zoe_lib.swarm_client import SwarmClient
 
-from zoe_master.exceptions import ZoeStartExecutionFatalException, ZoeStartExecutionRetryException
-from zoe_master.zapp_to_docker import execution_to_containers, terminate_execution
+import zoe_master.config as config
+from zoe_master.config import get_conf
+from zoe_master.exceptions import ZoeStartExecutionFatalException, ZoeStartExecutionRetryException, ZoeStartExecutionCancelledException
+from zoe_master.zapp_to_docker import execution_to_containers, terminate_execution, terminate_service, remove_containers
+from zoe_master.scheduler_policies.base import BaseSchedulerPolicy
+from zoe_master.scheduler_policies.fifo import FIFOPolicy
+from zoe_master.scheduler_policies.priority import PriorityPolicy, effective_priority
+from zoe_master.scheduler_policies.fair_share import FairSharePolicy
+from zoe_master.placement import ClusterState, place_services, service_memory
+from zoe_master.stats import SchedulerStats
+from zoe_master.timer_wheel import TimerWheel
 
 log = logging.getLogger(__name__)
 
 
+FAIR_SHARE_HISTORY_HALF_LIVES = 10  # older executions are not loaded, their usage has decayed to less than 0.1%
+
+
+def make_policy(name: str, now: float) -> BaseSchedulerPolicy:
+    """Instantiate the scheduler policy (the queue ordering) selected in the configuration."""
+    if name == 'FIFO':
+        return FIFOPolicy()
+    elif name == 'PRIORITY':
+        return PriorityPolicy(get_conf().priority_aging_rate)
+    elif name == 'FAIR':
+        policy = FairSharePolicy(get_conf().fair_share_half_life)
+        since = datetime.datetime.fromtimestamp(now - FAIR_SHARE_HISTORY_HALF_LIVES * policy.half_life)
+        policy.load_history(config.singletons['sql_manager'].execution_list_ended_after(since), now)
+        return policy
+    else:
+        raise ValueError('unknown scheduler policy {}'.format(name))
+
+
+class StartJob:
+    """An execution handed to the start pool. Once started, it is kept to track the resources held by the execution."""
+    def __init__(self, execution: Execution):
+        self.execution = execution
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.placement = None  # service ID -> node name, None if admission control is disabled
+        self.memory = {}  # service ID -> reserved memory
+        self.time_dispatched = None
+        self.time_started = None
+        self.charged = 0  # memory-seconds charged to the user when the execution started
+        self.expected_end = None  # None if the execution is interactive or its runtime cannot be estimated
+        self.services = None  # the essential services, spawned by the start job
+        self.elastic_pending = []  # non-essential services not spawned yet
+        self.elastic_active = []  # non-essential services spawned after the execution started
+
+
+class RuntimeEstimator:
+    """
+    Estimates the runtime of batch executions, as an exponential moving average of the runtimes observed for each application name.
+    """
+    def __init__(self, weight=0.3):
+        self.weight = weight
+        self.estimates = {}
+
+    def update(self, app_name: str, runtime: float):
+        if app_name in self.estimates:
+            self.estimates[app_name] = self.weight * runtime + (1 - self.weight) * self.estimates[app_name]
+        else:
+            self.estimates[app_name] = runtime
+
+    def estimate(self, app_name: str):
+        """Returns the estimated runtime in seconds, or None if no execution of this application has been observed."""
+        return self.estimates.get(app_name)
+
+
 class ZoeScheduler:
-    def __init__(self):
-        self.fifo_queue = []
+    BACKFILL_DEPTH = 50  # maximum number of queued executions considered for backfilling at each scheduler round
+    PREEMPTION_DEPTH = 50  # maximum number of queued executions considered for preemption at each scheduler round
+    RETRY_MAX_DELAY = 600  # seconds
+    LOOP_ERROR_DELAY = 5  # seconds
+    PROVISIONAL_RUNTIME = 600  # seconds charged at start for executions with no runtime estimate, corrected at termination
+
+    def __init__(self, clock=time.time):
+        """
+        :param clock: function returning the current time, the simulator replaces it with a virtual clock
+        """
+        self.clock = clock
+        self.queue = make_policy(get_conf().scheduler_policy, self.clock())
+        self.queue_lock = threading.Lock()
         self.trigger_semaphore = threading.Semaphore(0)
-        self.async_threads = []
+        self.termination_pool = ThreadPoolExecutor(max_workers=get_conf().max_concurrent_terminations)
+        self.terminating = {}  # execution ID -> future of the termination in progress
+        self.max_concurrent_starts = get_conf().max_concurrent_starts
+        self.start_pool = ThreadPoolExecutor(max_workers=self.max_concurrent_starts)
+        self.starting = {}  # execution ID -> StartJob for the starts in progress
+        self.placement_policy = get_conf().placement_policy
+        self.running = {}  # execution ID -> StartJob for the started executions
+        self.resizing = {}  # execution ID -> (future, placement, memory) for elastic services being spawned or terminated
+        self.backfill = get_conf().backfill and self.placement_policy != 'none'
+        self.preemption = get_conf().preemption and self.placement_policy != 'none'
+        self.preemption_priority_gap = get_conf().preemption_priority_gap
+        self.preemption_min_runtime = get_conf().preemption_min_runtime
+        self.preempted = {}  # execution ID -> queued execution it is being terminated for, it will be queued again
+        self.parked = {}  # execution ID -> preempted executions waiting for it to start before going back in the queue
+        self.preemptors = {}  # execution ID -> queued execution that preempted others, it starts first when they are gone
+        self.runtime_estimator = RuntimeEstimator()
+        self.retry_wheel = TimerWheel(clock=self.clock)  # executions waiting to retry a start after a temporary failure
+        self.retry_attempts = {}  # execution ID -> number of failed start attempts
+        self.retry_max_attempts = get_conf().start_retry_max_attempts
+        self.retry_base_delay = get_conf().start_retry_base_delay
+        self.queued_since = {}  # execution ID -> time it entered the queue
+        self.stats = SchedulerStats()
         self.loop_quit = False
         self.loop_th = threading.Thread(target=self.loop_start_th, name='scheduler')
         self.loop_th.start()
@@ -38,80 +138,567 @@ class ZoeScheduler:
 
     def incoming(self, execution: Execution):
         """
-        This method adds the execution to the end of the FIFO queue.
+        This method adds the execution to the queue, its position depends on the scheduler policy.
         :param execution: The execution
         :return:
         """
-        self.fifo_queue.append(execution)
+        self._load_services(execution)
+        with self.queue_lock:
+            self._enqueue(execution)
         self.trigger()
 
+    @staticmethod
+    def _load_services(execution: Execution):
+        """Queued executions must have their services loaded, they are placed while holding the queue lock, without database calls."""
+        return execution.services
+
+    def _enqueue(self, execution: Execution):
+        self.queue.push(execution)
+        self.queued_since[execution.id] = self.clock()
+        self.stats.queue_changed(execution, 1)
+
+    def _dequeue(self, execution: Execution):
+        """Removes an execution from the queue, returns the time it entered the queue or None if it was not queued."""
+        self._release_parked(execution.id)
+        if not self.queue.remove(execution):
+            return None
+        self.stats.queue_changed(execution, -1)
+        return self.queued_since.pop(execution.id)
+
+    def stats_snapshot(self) -> dict:
+        """Returns the scheduler statistics, cheap enough to be called every second."""
+        with self.queue_lock:
+            self.stats.timestamp = self.clock()
+            self.stats.count_waiting = len(self.queue)
+            self.stats.count_starting = len(self.starting)
+            self.stats.count_running = len(self.running)
+            self.stats.count_terminating = len(self.terminating)
+            self.stats.count_retry_waiting = len(self.retry_wheel)
+            return self.stats.to_dict()
+
     def terminate(self, execution: Execution) -> None:
         """
-        Inform the master that an execution has been terminated. This can be done asynchronously.
+        Inform the master that an execution has been terminated. The termination is queued to a pool of worker threads,
+        requests for an execution that is already being terminated are merged with the one in progress.
+        If the execution is being started, the start is cancelled and the termination waits for it to stop.
         :param execution: the terminated execution
         :return: None
         """
-        def async_termination():
-            terminate_execution(execution)
-            self.trigger()
+        with self.queue_lock:
+            self._submit_termination(execution)
+
+    def _submit_termination(self, execution: Execution, preempted_for=None):
+        """
+        :param execution: the execution to terminate
+        :param preempted_for: if the execution is preempted, the queued execution that needs its resources
+        """
+        if execution.id in self.terminating:
+            log.debug('Execution {} is already being terminated'.format(execution.id))
+            if preempted_for is None:
+                self.preempted.pop(execution.id, None)  # a user termination wins over a preemption in progress
+            return
+        self._dequeue(execution)
+        self.retry_wheel.cancel(execution.id)
+        self.retry_attempts.pop(execution.id, None)
+        start_job = self.starting.get(execution.id)
+        if start_job is not None:
+            start_job.cancel_event.set()
+            start_future = start_job.future
+        else:
+            start_future = None
+        running_job = self.running.pop(execution.id, None)
+        if running_job is not None:
+            running_job.cancel_event.set()
+        resize_job = self.resizing.get(execution.id)
+        resize_future = resize_job[0] if resize_job is not None else None
+        if preempted_for is not None:
+            self.preempted[execution.id] = preempted_for
+        self.terminating[execution.id] = self.termination_pool.submit(self._terminate_execution, execution, start_future, resize_future, running_job, self.clock())
 
+    def _terminate_execution(self, execution: Execution, start_future, resize_future, running_job, time_requested):
+        preempting = False
         try:
-            self.fifo_queue.remove(execution)
-        except ValueError:
-            pass
-        th = threading.Thread(target=async_termination, name='termination_{}'.format(execution.id))
-        th.start()
-        self.async_threads.append(th)
+            if start_future is not None:
+                wait([start_future])
+            if resize_future is not None:
+                wait([resize_future])
+            execution.invalidate_services()  # they may have been changed by the jobs, through a different Execution object
+            with self.queue_lock:
+                preempting = execution.id in self.preempted
+            if preempting:
+                remove_containers(execution)  # it is not terminated, it will go back in the queue
+            else:
+                terminate_execution(execution)
+            if running_job is not None:
+                runtime = self.clock() - running_job.time_started
+                if execution.description['will_end'] and execution.id not in self.preempted:
+                    self.runtime_estimator.update(execution.description['name'], runtime)
+                memory = sum(service_memory(s) for s in running_job.services + running_job.elastic_active)
+                with self.queue_lock:
+                    self.queue.account(execution, memory * runtime - running_job.charged, self.clock())
+        except Exception:
+            log.exception('Error terminating execution {}'.format(execution.id))
+        finally:
+            with self.queue_lock:
+                del self.terminating[execution.id]
+                self.stats.wait_time['termination'].observe(self.clock() - time_requested)
+                preempted_for = self.preempted.pop(execution.id, None)
+            if preempted_for is not None:
+                log.info('Execution {} has been preempted, it goes back in the queue'.format(execution.id))
+                execution.set_scheduled()
+                self._load_services(execution)
+                with self.queue_lock:
+                    if preempted_for in self.queue:
+                        # keep it out of the queue until the execution it made room for has started, it could get ahead of it
+                        self.parked.setdefault(preempted_for.id, []).append(execution)
+                    else:
+                        self._enqueue(execution)
+            elif preempting:
+                execution.set_terminated()  # the user terminated it while it was being preempted
+            self.trigger()
+
+    def _release_parked(self, exec_id):
+        """Put back in the queue the executions preempted to make room for an execution that left the queue."""
+        self.preemptors.pop(exec_id, None)
+        for execution in self.parked.pop(exec_id, []):
+            self._enqueue(execution)
 
     def remove_execution(self, execution: Execution):
+        with self.queue_lock:
+            self._dequeue(execution)
+            self.retry_wheel.cancel(execution.id)
+            self.retry_attempts.pop(execution.id, None)
+
+    def _start_execution(self, job: StartJob):
+        execution = job.execution
+        cancel_event = job.cancel_event
         try:
-            self.fifo_queue.remove(execution)
-        except ValueError:
-            pass
+            if not cancel_event.is_set():
+                execution.set_starting()
+            if job.services is None:
+                job.services = self._essential_services(execution)
+            execution_to_containers(execution, cancel_event, job.placement, job.services)
+        except ZoeStartExecutionCancelledException:
+            log.info('Start of execution {} has been cancelled'.format(execution.id))
+        except ZoeStartExecutionRetryException as ex:
+            log.warning('Temporary failure starting execution {}: {}'.format(execution.id, ex.message))
+            execution.set_error_message(ex.message)
+            remove_containers(execution)
+            self._start_failed()
+            if not cancel_event.is_set():
+                self._retry_later(execution)
+        except ZoeStartExecutionFatalException as ex:
+            log.error('Fatal error trying to start execution {}: {}'.format(execution.id, ex.message))
+            execution.set_error_message(ex.message)
+            remove_containers(execution)
+            self._start_failed()
+            execution.set_error()
+        except Exception as ex:
+            log.exception('Unexpected error trying to start execution {}'.format(execution.id))
+            execution.set_error_message(str(ex))
+            remove_containers(execution)
+            self._start_failed()
+            execution.set_error()
+        else:
+            if not cancel_event.is_set():
+                execution.set_running()
+                self._track_running(job)
+            with self.queue_lock:
+                self.retry_attempts.pop(execution.id, None)
+        finally:
+            with self.queue_lock:
+                del self.starting[execution.id]
+                self.stats.wait_time['start'].observe(self.clock() - job.time_dispatched)
+            self.trigger()
 
-    def loop_start_th(self):
-        while True:
-            ret = self.trigger_semaphore.acquire()
-            if not ret:  # Semaphore timeout, do some thread cleanup
-                counter = len(self.async_threads)
-                while counter > 0:
-                    if len(self.async_threads) == 0:
+    def _start_failed(self):
+        with self.queue_lock:
+            self.stats.starts_failed += 1
+
+    def _retry_later(self, execution: Execution):
+        """
+        Put an execution that failed to start because of a temporary error in the retry wheel, with an exponential backoff.
+        After too many attempts the execution is set in the error state.
+        """
+        with self.queue_lock:
+            attempts = self.retry_attempts.get(execution.id, 0) + 1
+            if attempts >= self.retry_max_attempts:
+                self.retry_attempts.pop(execution.id, None)
+                self.stats.retries_given_up += 1
+                give_up = True
+            else:
+                self.retry_attempts[execution.id] = attempts
+                self.stats.retries_total += 1
+                give_up = False
+        if give_up:
+            log.error('Execution {} failed to start {} times, giving up'.format(execution.id, attempts))
+            execution.set_error()
+            return
+
+        delay = min(self.retry_base_delay * 2 ** (attempts - 1), self.RETRY_MAX_DELAY)
+        delay *= random.uniform(0.5, 1.0)  # jitter, to avoid retrying all the executions failed for the same reason together
+        log.info('Execution {} will retry starting in {:.0f} seconds (attempt {})'.format(execution.id, delay, attempts + 1))
+        execution.set_scheduled()
+        self._load_services(execution)
+        with self.queue_lock:
+            if execution.id in self.retry_attempts:  # it may have been terminated in the meantime
+                self.retry_wheel.schedule(execution.id, delay, execution)
+
+    def _requeue_due_retries(self):
+        with self.queue_lock:
+            for execution in self.retry_wheel.advance():
+                self._enqueue(execution)
+
+    def _track_running(self, job: StartJob):
+        job.time_started = self.clock()
+        job.elastic_pending = [s for s in job.execution.services if not s.is_essential]
+        estimate = None
+        if job.execution.description['will_end']:
+            estimate = self.runtime_estimator.estimate(job.execution.description['name'])
+            if estimate is not None:
+                job.expected_end = job.time_started + estimate
+        with self.queue_lock:
+            if not job.cancel_event.is_set():
+                self.running[job.execution.id] = job
+                self.stats.started(job.time_started)
+                # charge the expected consumption now, so that the next executions of the same user do not all start before it is known
+                job.charged = sum(service_memory(s) for s in job.services) * (estimate if estimate is not None else self.PROVISIONAL_RUNTIME)
+                self.queue.account(job.execution, job.charged, job.time_started)
+
+    def _swarm_stats(self):
+        if self.placement_policy == 'none':
+            return None
+        try:
+            return SwarmClient(get_conf()).info()
+        except Exception:
+            log.exception('Cannot get the cluster state from Swarm, admission control is disabled until the next attempt')
+            return None
+
+    def _cluster_state(self, swarm_stats):
+        """Free memory per node, minus the memory placed by the starts in progress, that Swarm may not account for yet."""
+        if swarm_stats is None:
+            return None
+        cluster = ClusterState.from_swarm_stats(swarm_stats)
+        for job in self.starting.values():
+            if job.placement is not None:
+                cluster.reserve(job.placement, job.memory)
+        for future, placement, memory in self.resizing.values():
+            cluster.reserve(placement, memory)
+        return cluster
+
+    def _free_workers(self):
+        return self.max_concurrent_starts - len(self.starting) - len(self.resizing)
+
+    def _can_dispatch(self):
+        return len(self.queue) > 0 and self._free_workers() > 0
+
+    @staticmethod
+    def _essential_services(execution: Execution) -> list:
+        return [s for s in execution.services if s.is_essential]
+
+    def _submit_start(self, job: StartJob):
+        """Takes the execution out of the queue and hands it to the start pool, that sets it in the starting state."""
+        assert isinstance(job.execution, Execution)
+        job.time_dispatched = self.clock()
+        self.stats.wait_time['queue'].observe(job.time_dispatched - self._dequeue(job.execution))
+        job.future = self.start_pool.submit(self._start_execution, job)
+        self.starting[job.execution.id] = job
+
+    def _dispatch_starts(self):
+        """
+        Hand queued executions to the start pool, until the queue is empty, all workers are busy or, with admission control,
+        the essential services of the execution at the head of the queue do not fit in the cluster.
+        Only the essential services are started, when the queue is empty the elastic services of running executions
+        are spawned as long as there is room for them.
+        The queue lock is held while choosing the executions, without database calls: the services of queued executions
+        are already loaded and the start jobs write the new states.
+        """
+        with self.queue_lock:
+            if self._free_workers() <= 0 or (len(self.queue) == 0 and not self._has_pending_elastic()):
+                return
+        swarm_stats = self._swarm_stats()  # do not keep the queue locked during the Swarm API call
+        with self.queue_lock:
+            cluster = self._cluster_state(swarm_stats)
+            if cluster is not None and len(self.preemptors) > 0 and len(self.preempted) == 0:
+                self._start_preemptors(cluster)
+            while self._can_dispatch():
+                job = StartJob(self.queue.peek())
+                if cluster is not None:
+                    job.services = self._essential_services(job.execution)
+                    job.placement = place_services(job.services, cluster, self.placement_policy)
+                    if job.placement is None:
+                        log.debug('Execution {} does not fit in the cluster, it will wait'.format(job.execution.id))
+                        if self._shrink_elastic(job.execution, cluster):
+                            pass  # elastic services make room for the head first, they restart when the queue is empty
+                        elif self.preemption and self._preempt(cluster):
+                            pass
+                        elif self.backfill:
+                            self._backfill(job.execution, cluster)
                         break
-                    th = self.async_threads.pop(0)
-                    th.join(0.1)
-                    if th.isAlive():  # join failed
-                        self.async_threads.append(th)
-                    counter -= 1
+                    job.memory = {s.id: service_memory(s) for s in job.services}
+                self._submit_start(job)
+            if len(self.queue) == 0:
+                self._grow_elastic(cluster)
+
+    def _has_pending_elastic(self):
+        for job in self.running.values():
+            if len(job.elastic_pending) > 0:
+                return True
+        return False
+
+    def _grow_elastic(self, cluster):
+        """Spawn the pending elastic services of running executions, higher priority executions first."""
+        jobs = sorted(self.running.values(), key=lambda j: -int(j.execution.description['priority']))
+        for job in jobs:
+            if self._free_workers() <= 0:
+                break
+            if len(job.elastic_pending) == 0 or job.execution.id in self.resizing:
                 continue
-            if self.loop_quit:
+            if cluster is not None:
+                placement = place_services(job.elastic_pending, cluster, self.placement_policy)
+                services = [s for s in job.elastic_pending if s.id in placement]
+                if len(services) == 0:
+                    continue
+            else:
+                placement = None
+                services = list(job.elastic_pending)
+            memory = {s.id: service_memory(s) for s in services}
+            for service in services:
+                job.elastic_pending.remove(service)
+            future = self.start_pool.submit(self._grow_services, job, services, placement, memory)
+            self.resizing[job.execution.id] = (future, placement if placement is not None else {}, memory)
+
+    def _grow_services(self, job: StartJob, services: list, placement, memory: dict):
+        execution = job.execution
+        try:
+            execution_to_containers(execution, job.cancel_event, placement, services)
+        except ZoeStartExecutionCancelledException:
+            pass
+        except Exception as ex:
+            log.warning('Cannot spawn the elastic services of execution {}: {}'.format(execution.id, ex))
+            for service in services:
+                terminate_service(service)  # they will not be retried, to avoid looping against Swarm
+        else:
+            log.info('Spawned {} elastic services for execution {}'.format(len(services), execution.id))
+            with self.queue_lock:
+                job.elastic_active += services
+                if job.placement is not None and placement is not None:
+                    job.placement.update(placement)
+                    job.memory.update(memory)
+        finally:
+            with self.queue_lock:
+                del self.resizing[execution.id]
+            self.trigger()
+
+    def _shrink_elastic(self, head: Execution, cluster: ClusterState) -> bool:
+        """
+        Make room for the execution at the head of the queue by terminating elastic services of running executions with
+        a lower priority, executions with the same priority do not take replicas from each other. Services of lower
+        priority executions and with higher replica numbers go first.
+        :return: True if services are being terminated, the head will be considered again once they are gone
+        """
+        head_priority = int(head.description['priority'])
+        victims = []
+        for job in self.running.values():
+            if job.placement is None or job.execution.id in self.resizing:
+                continue
+            priority = int(job.execution.description['priority'])
+            if priority >= head_priority:
+                continue
+            for service in job.elastic_active:
+                if service.id in job.placement:
+                    victims.append((priority, -service.replica_index, service.id, job, service))
+        if len(victims) == 0:
+            return False
+        victims.sort(key=lambda v: v[:3])
+
+        head_services = self._essential_services(head)
+        trial = cluster.copy()
+        chosen = {}
+        for priority, neg_index, service_id, job, service in victims:
+            trial.release({service.id: job.placement[service.id]}, {service.id: job.memory[service.id]})
+            chosen.setdefault(job.execution.id, (job, []))[1].append(service)
+            if place_services(head_services, trial.copy(), self.placement_policy) is not None:
                 break
+        else:
+            return False
 
-            log.debug("Scheduler start loop has been triggered")
-            if len(self.fifo_queue) == 0:
+        for job, services in chosen.values():
+            log.info('Terminating {} elastic services of execution {} to make room for execution {}'.format(len(services), job.execution.id, head.id))
+            future = self.start_pool.submit(self._shrink_services, job, services)
+            self.resizing[job.execution.id] = (future, {}, {})
+        return True
+
+    def _shrink_services(self, job: StartJob, services: list):
+        try:
+            for service in services:
+                terminate_service(service)
+        except Exception:
+            log.exception('Error terminating elastic services of execution {}'.format(job.execution.id))
+        finally:
+            with self.queue_lock:
+                for service in services:
+                    job.elastic_active.remove(service)
+                    job.elastic_pending.append(service)
+                    if job.placement is not None:
+                        job.placement.pop(service.id, None)
+                        job.memory.pop(service.id, None)
+                del self.resizing[job.execution.id]
+            self.trigger()
+
+    def _preempt(self, cluster: ClusterState) -> bool:
+        """
+        Make room for a queued execution by terminating running executions with a lower priority, they are queued again
+        and will restart from scratch. The queued executions are considered in queue order, the first one that can
+        preempt enough executions to fit is started as soon as its victims are gone, even if it is not at the head, or
+        immediately if it fits already.
+        To avoid thrashing, an execution can preempt only executions whose effective priority (without aging) is lower by
+        at least preemption_priority_gap points, and executions that started less than preemption_min_runtime seconds ago
+        are not preempted.
+        :return: True if executions are being preempted
+        """
+        if len(self.preempted) > 0:
+            return True  # wait for the previous preemptions to free their resources before choosing more victims
+        now = self.clock()
+        running = [j for j in self.running.values() if j.placement is not None and j.execution.id not in self.resizing and now - j.time_started >= self.preemption_min_runtime]
+        if len(running) == 0:
+            return False
+        lowest_priority = min(effective_priority(j.execution) for j in running)
+        for candidate in self.queue.ordered()[:self.PREEMPTION_DEPTH]:
+            if effective_priority(candidate) < lowest_priority + self.preemption_priority_gap:
+                continue
+            victims = self._choose_victims(candidate, running, cluster, now)
+            if victims is None:
                 continue
+            self.preemptors[candidate.id] = candidate
+            for job in victims:
+                log.info('Preempting execution {} to make room for execution {}'.format(job.execution.id, candidate.id))
+                self._submit_termination(job.execution, preempted_for=candidate)
+                self.stats.preemptions_total += 1
+            if len(victims) == 0:
+                self._start_preemptors(cluster)
+            return True
+        return False
 
-            e = self.fifo_queue[0]
-            assert isinstance(e, Execution)
-            e.set_starting()
-            self.fifo_queue.pop(0)  # remove the execution form the queue
+    def _choose_victims(self, execution: Execution, running: list, cluster: ClusterState, now: float):
+        """
+        Batch executions are preferred as victims over interactive ones, then the ones that ran for the shortest time, to
+        waste as little work as possible.
+        :return: the list of StartJobs to preempt, or None if the execution cannot fit even preempting all the candidates
+        """
+        priority = effective_priority(execution)
+        candidates = [(not j.execution.description['will_end'], now - j.time_started, j.execution.id, j) for j in running if effective_priority(j.execution) + self.preemption_priority_gap <= priority]
+        candidates.sort(key=lambda c: c[:3])
 
-            try:
-                execution_to_containers(e)
-            except ZoeStartExecutionRetryException as ex:
-                log.warning('Temporary failure starting execution {}: {}'.format(e.id, ex.message))
-                e.set_error_message(ex.message)
-                terminate_execution(e)
-                e.set_scheduled()
-                self.fifo_queue.append(e)
-            except ZoeStartExecutionFatalException as ex:
-                log.error('Fatal error trying to start execution {}: {}'.format(e.id, ex.message))
-                e.set_error_message(ex.message)
-                terminate_execution(e)
-                e.set_error()
+        services = self._essential_services(execution)
+        if place_services(services, cluster.copy(), self.placement_policy) is not None:
+            return []  # it fits without preempting anything, but it is stuck behind the head of the queue
+        trial = cluster.copy()
+        victims = []
+        for interactive, runtime, exec_id, job in candidates:
+            trial.release(job.placement, job.memory)
+            victims.append(job)
+            if place_services(services, trial.copy(), self.placement_policy) is not None:
+                break
+        else:
+            return None
+
+        # victims chosen early may have become unnecessary once larger ones were added
+        for job in reversed(victims[:-1]):
+            trial.reserve(job.placement, job.memory)
+            if place_services(services, trial.copy(), self.placement_policy) is None:
+                trial.release(job.placement, job.memory)
+            else:
+                victims.remove(job)
+        return victims
+
+    def _start_preemptors(self, cluster: ClusterState):
+        """Start the executions that preempted others, out of queue order, once their victims have been terminated."""
+        for execution in list(self.preemptors.values()):
+            if self._free_workers() <= 0:
+                break
+            job = StartJob(execution)
+            job.services = self._essential_services(execution)
+            job.placement = place_services(job.services, cluster, self.placement_policy)
+            if job.placement is None:
+                continue  # the room has been taken in the meantime, it may preempt again
+            job.memory = {s.id: service_memory(s) for s in job.services}
+            self._submit_start(job)
+
+    def _head_reservation(self, head: Execution, cluster: ClusterState, now: float):
+        """
+        Find the time at which the execution at the head of the queue will fit, assuming running batch executions end as estimated.
+        :return: the reservation (shadow) time and the free memory that the head will leave at that time, or (inf, None) if the head never fits
+        """
+        services = self._essential_services(head)
+        future = cluster.copy()
+        ending = sorted([j for j in self.running.values() if j.expected_end is not None], key=lambda j: j.expected_end)
+        for job in ending:
+            future.release(job.placement, job.memory)
+            trial = future.copy()
+            if place_services(services, trial, self.placement_policy) is not None:
+                return max(job.expected_end, now), trial
+        return float('inf'), None
+
+    def _backfill(self, head: Execution, cluster: ClusterState):
+        """
+        EASY backfilling: the head of the queue does not fit, start batch executions queued behind it if they will not delay it.
+        A candidate can start if it fits now and either it is estimated to end before the head reservation, or it uses only
+        memory that the head will not need at its reservation time.
+        """
+        now = self.clock()
+        shadow_time, extra = self._head_reservation(head, cluster, now)
+        for candidate in self.queue.ordered()[1:self.BACKFILL_DEPTH + 1]:
+            if not self._can_dispatch():
+                break
+            if not candidate.description['will_end']:
+                continue
+            estimate = self.runtime_estimator.estimate(candidate.description['name'])
+            ends_in_time = estimate is not None and now + estimate <= shadow_time
+            if not ends_in_time and extra is None:
+                continue
+            services = self._essential_services(candidate)
+            if ends_in_time:
+                placement = place_services(services, cluster, self.placement_policy)
+            else:
+                limited = ClusterState({node: min(free, extra.free_memory.get(node, 0)) for node, free in cluster.free_memory.items()})
+                placement = place_services(services, limited, self.placement_policy)
+            if placement is None:
+                continue
+            job = StartJob(candidate)
+            job.services = services
+            job.placement = placement
+            job.memory = {s.id: service_memory(s) for s in services}
+            if not ends_in_time:
+                cluster.reserve(placement, job.memory)
+                extra.reserve(placement, job.memory)
+            log.info('Backfilling execution {} ahead of execution {}'.format(candidate.id, head.id))
+            self._submit_start(job)
+
+    def loop_start_th(self):
+        while True:
+            if len(self.retry_wheel) > 0:
+                self.trigger_semaphore.acquire(timeout=self.retry_wheel.tick)  # wake up at each tick to check for due retries
             else:
-                e.set_running()
+                self.trigger_semaphore.acquire()
+            if self.loop_quit:
+                break
+
+            log.debug("Scheduler start loop has been triggered")
+            try:
+                self._requeue_due_retries()
+                self._dispatch_starts()
+            except Exception:
+                log.exception('Error in the scheduler loop, retrying in {} seconds'.format(self.LOOP_ERROR_DELAY))  # for example the database is not reachable
+                time.sleep(self.LOOP_ERROR_DELAY)
+                self.trigger()
 
     def quit(self):
         self.loop_quit = True
         self.trigger()
         self.loop_th.join()
+        with self.queue_lock:
+            for job in self.starting.values():
+                job.cancel_event.set()
+        self.start_pool.shutdown(wait=True)
+        self.termination_pool.shutdown(wait=True)
@@ -0,0 +1,157 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Scheduler policies decide in which order the executions waiting in the scheduler queue are started.
+"""
+
+from zoe_lib.sql_manager import Execution
+
+
+class IndexedHeap:
+    """
+    A binary min-heap that keeps track of the position of each item, so that arbitrary items can be removed by ID in O(log n).
+    """
+    def __init__(self):
+        self._heap = []  # list of [key, item_id, item]
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item_id):
+        return item_id in self._positions
+
+    def push(self, key, item_id, item):
+        assert item_id not in self._positions
+        self._heap.append([key, item_id, item])
+        self._positions[item_id] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def peek(self):
+        if len(self._heap) == 0:
+            return None
+        return self._heap[0][2]
+
+    def peek_key(self):
+        if len(self._heap) == 0:
+            return None
+        return self._heap[0][0]
+
+    def pop(self):
+        if len(self._heap) == 0:
+            return None
+        return self._remove_at(0)
+
+    def remove(self, item_id):
+        """Removes the item with the given ID, returns it or None if it is not in the heap."""
+        if item_id not in self._positions:
+            return None
+        return self._remove_at(self._positions[item_id])
+
+    def ordered(self) -> list:
+        """Returns all items, sorted by key. It does not modify the heap."""
+        return [entry[2] for entry in sorted(self._heap, key=lambda x: x[0])]
+
+    def _remove_at(self, idx):
+        entry = self._heap[idx]
+        last = self._heap.pop()
+        del self._positions[entry[1]]
+        if idx < len(self._heap):
+            self._heap[idx] = last
+            self._positions[last[1]] = idx
+            self._sift_down(idx)
+            self._sift_up(idx)
+        return entry[2]
+
+    def _swap(self, i, j):
+        self._heap[i], self._heap[j] = self._heap[j], self._heap[i]
+        self._positions[self._heap[i][1]] = i
+        self._positions[self._heap[j][1]] = j
+
+    def _sift_up(self, idx):
+        while idx > 0:
+            parent = (idx - 1) // 2
+            if self._heap[idx][0] < self._heap[parent][0]:
+                self._swap(idx, parent)
+                idx = parent
+            else:
+                break
+
+    def _sift_down(self, idx):
+        size = len(self._heap)
+        while True:
+            smallest = idx
+            for child in (2 * idx + 1, 2 * idx + 2):
+                if child < size and self._heap[child][0] < self._heap[smallest][0]:
+                    smallest = child
+            if smallest == idx:
+                break
+            self._swap(idx, smallest)
+            idx = smallest
+
+
+class BaseSchedulerPolicy:
+    """
+    The queue of executions waiting to be started. Subclasses define the order by implementing the key() method:
+    executions with lower keys are started first.
+    """
+    def __init__(self):
+        self._heap = IndexedHeap()
+        self._counter = 0
+
+    def key(self, execution: Execution, sequence: int):
+        """
+        Returns the sort key of an execution entering the queue.
+        :param execution: the execution
+        :param sequence: a counter incremented at each insertion, used to break ties in FIFO order
+        """
+        raise NotImplementedError
+
+    def push(self, execution: Execution):
+        self._counter += 1
+        self._heap.push(self.key(execution, self._counter), execution.id, execution)
+
+    def peek(self) -> Execution:
+        """Returns the execution that should be started next, without removing it from the queue, or None."""
+        return self._heap.peek()
+
+    def pop(self) -> Execution:
+        """Removes and returns the execution that should be started next, or None if the queue is empty."""
+        return self._heap.pop()
+
+    def remove(self, execution: Execution) -> bool:
+        """Removes an execution from the queue, returns False if it was not queued."""
+        return self._heap.remove(execution.id) is not None
+
+    def account(self, execution: Execution, memory_seconds: float, now: float):
+        """
+        Called by the scheduler to charge the user of an execution for the resources it used, policies that order
+        executions by past consumption override it.
+        :param execution: the execution
+        :param memory_seconds: the consumption, may be negative to correct a previous charge
+        :param now: the current time, as a UNIX timestamp
+        """
+        pass
+
+    def ordered(self) -> list:
+        """Returns the queued executions in the order they would be started."""
+        return self._heap.ordered()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, execution: Execution):
+        return execution.id in self._heap
@@ -0,0 +1,145 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from zoe_lib.sql_manager import Execution
+
+from zoe_master.scheduler_policies.base import BaseSchedulerPolicy, IndexedHeap
+
+
+def execution_memory(execution: Execution) -> int:
+    """The memory required by all the services of an execution, from its description."""
+    return sum(int(s['required_resources']['memory']) * int(s['total_count']) for s in execution.description['services'])
+
+
+class FairSharePolicy(BaseSchedulerPolicy):
+    """
+    The next execution to start belongs to the user with the lowest recent resource consumption, executions of the same
+    user are started in FIFO order.
+
+    Consumption is measured in memory-seconds and decays exponentially with the given half-life. Since all users decay at
+    the same rate, usage is stored scaled up by the decay accumulated since a reference time: the order of users does not
+    change over time and only the user being charged needs to be moved in the heap of users.
+    Executions are kept in one queue per user, and the users with queued executions in a heap keyed by their usage, so
+    choosing the next execution is O(log users).
+    """
+    RESCALE_HALF_LIVES = 64  # move the reference time forward after this many half-lives, to keep the scaled values in range
+
+    def __init__(self, half_life: float):
+        super().__init__()
+        self.half_life = half_life
+        self._reference_time = None
+        self._usage = {}  # user ID -> scaled usage
+        self._user_queues = {}  # user ID -> IndexedHeap of the queued executions of the user
+        self._users = IndexedHeap()  # users with queued executions, keyed by (scaled usage, sequence of their first execution)
+        self._length = 0
+
+    def key(self, execution: Execution, sequence: int):
+        return sequence
+
+    def _scale(self, now: float) -> float:
+        if self._reference_time is None:
+            self._reference_time = now
+        elif now - self._reference_time > self.RESCALE_HALF_LIVES * self.half_life:
+            self._rescale(now)
+        return 2 ** ((now - self._reference_time) / self.half_life)
+
+    def _rescale(self, now: float):
+        factor = 2 ** (-(now - self._reference_time) / self.half_life)
+        self._reference_time = now
+        for user_id in list(self._usage):
+            self._usage[user_id] *= factor
+            if self._usage[user_id] < 1:
+                del self._usage[user_id]
+        for user_id in list(self._user_queues):
+            self._update_user(user_id)
+
+    def usage(self, user_id, now: float) -> float:
+        """The decayed consumption of a user at the given time, in memory-seconds."""
+        scale = self._scale(now)
+        return self._usage.get(user_id, 0) / scale
+
+    def account(self, execution: Execution, memory_seconds: float, now: float):
+        scale = self._scale(now)  # it may move the reference time, rescaling the stored usage
+        usage = self._usage.get(execution.user_id, 0) + memory_seconds * scale
+        self._usage[execution.user_id] = max(usage, 0)  # corrections of provisional charges may overshoot
+        if execution.user_id in self._user_queues:
+            self._update_user(execution.user_id)
+
+    def load_history(self, executions: list, now: float):
+        """
+        Charges the users for the executions that ran in the past.
+        :param executions: executions with a start and end time
+        :param now: the current time, as a UNIX timestamp
+        """
+        for e in executions:
+            if e.time_start is None or e.time_end is None:
+                continue
+            runtime = (e.time_end - e.time_start).total_seconds()
+            scale = self._scale(e.time_end.timestamp())
+            self._usage[e.user_id] = self._usage.get(e.user_id, 0) + execution_memory(e) * runtime * scale
+        self._scale(now)
+
+    def _update_user(self, user_id):
+        self._users.remove(user_id)
+        queue = self._user_queues[user_id]
+        if len(queue) == 0:
+            del self._user_queues[user_id]
+        else:
+            self._users.push((self._usage.get(user_id, 0), queue.peek_key()), user_id, user_id)
+
+    def push(self, execution: Execution):
+        self._counter += 1
+        if execution.user_id not in self._user_queues:
+            self._user_queues[execution.user_id] = IndexedHeap()
+        self._user_queues[execution.user_id].push(self.key(execution, self._counter), execution.id, execution)
+        self._length += 1
+        self._update_user(execution.user_id)
+
+    def peek(self) -> Execution:
+        user_id = self._users.peek()
+        if user_id is None:
+            return None
+        return self._user_queues[user_id].peek()
+
+    def pop(self) -> Execution:
+        user_id = self._users.peek()
+        if user_id is None:
+            return None
+        execution = self._user_queues[user_id].pop()
+        self._length -= 1
+        self._update_user(user_id)
+        return execution
+
+    def remove(self, execution: Execution) -> bool:
+        queue = self._user_queues.get(execution.user_id)
+        if queue is None or queue.remove(execution.id) is None:
+            return False
+        self._length -= 1
+        self._update_user(execution.user_id)
+        return True
+
+    def ordered(self) -> list:
+        """Returns the queued executions in the order they would be started, if no usage was charged in the meantime."""
+        ret = []
+        for user_id in self._users.ordered():
+            ret += self._user_queues[user_id].ordered()
+        return ret
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, execution: Execution):
+        queue = self._user_queues.get(execution.user_id)
+        return queue is not None and execution.id in queue
@@ -0,0 +1,24 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from zoe_lib.sql_manager import Execution
+
+from zoe_master.scheduler_policies.base import BaseSchedulerPolicy
+
+
+class FIFOPolicy(BaseSchedulerPolicy):
+    """Executions are started in the order they enter the queue."""
+    def key(self, execution: Execution, sequence: int):
+        return sequence
@@ -0,0 +1,44 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from zoe_lib.sql_manager import Execution
+
+from zoe_master.scheduler_policies.base import BaseSchedulerPolicy
+
+
+class PriorityPolicy(BaseSchedulerPolicy):
+    """
+    Executions with a higher application priority are started first, ties are broken in FIFO order.
+
+    Interactive executions (will_end set to False) get a fixed priority boost over batch ones. The effective priority of
+    a waiting execution grows by aging_rate points per second since submission, so that low priority work cannot starve.
+    Since all executions age at the same rate, the aging term reduces to a constant offset computed at insertion time.
+    """
+    INTERACTIVE_BOOST = 256
+
+    def __init__(self, aging_rate: float):
+        super().__init__()
+        self.aging_rate = aging_rate
+
+    def key(self, execution: Execution, sequence: int):
+        return -effective_priority(execution) + self.aging_rate * execution.time_submit.timestamp(), sequence
+
+
+def effective_priority(execution: Execution) -> int:
+    """The application priority, with the boost for interactive executions."""
+    priority = int(execution.description['priority'])
+    if not execution.description['will_end']:
+        priority += PriorityPolicy.INTERACTIVE_BOOST
+    return priority
@@ -0,0 +1,555 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Discrete-event simulator for the Zoe scheduler.
+
+A trace of execution submissions is replayed against a virtual Swarm cluster, while the real ZoeScheduler code takes all
+the scheduling decisions. Time is virtual: Docker API calls take a latency drawn from a simple model and executions run
+for the time given in the trace, then they are terminated, as the observer or a user would do.
+
+Trace files contain one JSON object per line, for example::
+
+    {"time": 0, "name": "spark-wordcount", "user": "alice", "priority": 512, "will_end": true, "runtime": 600,
+     "services": [{"name": "spark-master", "memory": 2147483648, "count": 1, "essential_count": 1, "startup_order": 0},
+                  {"name": "spark-worker", "memory": 8589934592, "count": 8, "essential_count": 2, "startup_order": 1}]}
+
+``time`` is the submission time in seconds from the start of the trace, ``runtime`` how long the execution runs once it
+is started.
+"""
+
+from concurrent.futures import Future
+import contextlib
+import datetime
+import heapq
+import json
+import logging
+import math
+import random
+
+import humanfriendly
+
+from zoe_lib.configargparse import ArgumentParser, Namespace, FileType
+from zoe_lib.sql_manager import Execution, Service
+
+import zoe_master.config as config
+import zoe_master.scheduler
+from zoe_master.exceptions import ZoeStartExecutionRetryException, ZoeStartExecutionCancelledException
+from zoe_master.execution_manager import _digest_application_description
+from zoe_master.scheduler import ZoeScheduler
+from zoe_master.stats import SwarmStats, SwarmNodeStats
+
+log = logging.getLogger(__name__)
+
+SIMULATION_EPOCH = 1451606400  # virtual time starts at 2016-01-01, so that timestamps look like real ones
+
+
+class SimulatedSQLManager:
+    """
+    Keeps executions and services in memory and tells the simulation when an execution changes status.
+    """
+    def __init__(self, sim):
+        self.sim = sim
+        self.executions = {}
+        self.services = {}
+        self._last_id = 0
+
+    def _new_id(self):
+        self._last_id += 1
+        return self._last_id
+
+    @staticmethod
+    def _filter(rows, only_one, kwargs):
+        ret = [r for r in rows if all(r[k] == v for k, v in kwargs.items())]
+        if only_one:
+            return ret[0] if len(ret) > 0 else None
+        return ret
+
+    def execution_new(self, name, user_id, description):
+        exec_id = self._new_id()
+        self.executions[exec_id] = {
+            'id': exec_id,
+            'name': name,
+            'user_id': user_id,
+            'description': description,
+            'status': Execution.SUBMIT_STATUS,
+            'time_submit': datetime.datetime.fromtimestamp(self.sim.now()),
+            'time_start': None,
+            'time_end': None,
+            'error_message': None
+        }
+        return exec_id
+
+    def execution_list(self, only_one=False, **kwargs):
+        ret = self._filter(self.executions.values(), only_one, kwargs)
+        if only_one:
+            return Execution.from_dict(ret, self) if ret is not None else None
+        return [Execution.from_dict(r, self) for r in ret]
+
+    def execution_list_ended_after(self, time_end: datetime.datetime):
+        return [Execution.from_dict(r, self) for r in self.executions.values() if r['time_start'] is not None and r['time_end'] is not None and r['time_end'] >= time_end]
+
+    def execution_update(self, exec_id, **kwargs):
+        self.executions[exec_id].update(kwargs)
+        if 'status' in kwargs:
+            self.sim.execution_status_changed(exec_id, kwargs['status'])
+
+    def service_new(self, execution_id, name, service_group, description):
+        service_id = self._new_id()
+        self.services[service_id] = {
+            'id': service_id,
+            'name': name,
+            'status': 'created',
+            'error_message': None,
+            'execution_id': execution_id,
+            'description': description,
+            'service_group': service_group,
+            'docker_id': None
+        }
+        return service_id
+
+    def services_new(self, execution_id, services: list) -> list:
+        return [self.service_new(execution_id, name, service_group, description) for name, service_group, description in services]
+
+    def service_list(self, only_one=False, **kwargs):
+        ret = self._filter(self.services.values(), only_one, kwargs)
+        if only_one:
+            return Service.from_dict(ret, self) if ret is not None else None
+        return [Service.from_dict(r, self) for r in ret]
+
+    def service_update(self, service_id, **kwargs):
+        self.services[service_id].update(kwargs)
+
+
+class VirtualCluster:
+    """
+    A set of Swarm nodes with a fixed amount of memory. It keeps track of the memory reserved over time.
+    """
+    def __init__(self, node_count: int, node_memory: int, clock):
+        self.clock = clock
+        self.memory_total = {'node{}'.format(i): node_memory for i in range(node_count)}
+        self.memory_reserved = {node: 0 for node in self.memory_total}
+        self.containers = {}  # service ID -> (node, memory)
+        self.reserved_area = 0  # integral of the reserved memory over time, in byte-seconds
+        self._last_change = clock()
+
+    def _account(self):
+        now = self.clock()
+        self.reserved_area += sum(self.memory_reserved.values()) * (now - self._last_change)
+        self._last_change = now
+
+    def stats(self) -> SwarmStats:
+        stats = SwarmStats()
+        for node, memory in self.memory_total.items():
+            ns = SwarmNodeStats(node)
+            ns.status = 'Healthy'
+            ns.memory_total = memory
+            ns.memory_reserved = self.memory_reserved[node]
+            ns.container_count = len([c for c in self.containers.values() if c[0] == node])
+            stats.nodes.append(ns)
+        stats.memory_total = sum(self.memory_total.values())
+        stats.container_count = len(self.containers)
+        stats.timestamp = self.clock()
+        return stats
+
+    def spawn(self, service: Service, node: str):
+        memory = int(service.description['required_resources']['memory'])
+        if node is None:  # no placement, Swarm spreads the containers
+            node = max(self.memory_total, key=lambda n: self.memory_total[n] - self.memory_reserved[n])
+        if self.memory_total[node] - self.memory_reserved[node] < memory:
+            raise ZoeStartExecutionRetryException('not enough memory on node {}'.format(node))
+        self._account()
+        self.memory_reserved[node] += memory
+        self.containers[service.id] = (node, memory)
+
+    def remove(self, service: Service):
+        if service.id not in self.containers:
+            return
+        self._account()
+        node, memory = self.containers.pop(service.id)
+        self.memory_reserved[node] -= memory
+
+
+class DockerLatencyModel:
+    """
+    Spawning a container takes an exponentially distributed time, plus the time to pull the image with some probability.
+    Services of the same startup order are spawned in parallel, as in zapp_to_docker.
+    """
+    def __init__(self, rng: random.Random, spawn_latency=3.0, remove_latency=1.0, pull_probability=0.05, pull_latency=60.0, parallel_spawns=8, parallel_removals=8):
+        self.rng = rng
+        self.spawn_latency = spawn_latency
+        self.remove_latency = remove_latency
+        self.pull_probability = pull_probability
+        self.pull_latency = pull_latency
+        self.parallel_spawns = parallel_spawns
+        self.parallel_removals = parallel_removals
+
+    def spawn(self):
+        latency = self.rng.expovariate(1 / self.spawn_latency)
+        if self.rng.random() < self.pull_probability:
+            latency += self.pull_latency
+        return latency
+
+    def spawn_services(self, services: list):
+        tiers = {}
+        for service in services:
+            tiers.setdefault(service.description['startup_order'], []).append(service)
+        latency = 0
+        for tier in tiers.values():
+            for batch_start in range(0, len(tier), self.parallel_spawns):
+                batch = tier[batch_start:batch_start + self.parallel_spawns]
+                latency += max(self.spawn() for _ in batch)
+        return latency
+
+    def remove_services(self, count: int):
+        return self.remove_latency * math.ceil(count / self.parallel_removals)
+
+    def job_latency(self, fn, args):
+        """The time taken by a job the scheduler submits to one of its thread pools."""
+        name = fn.__name__
+        if name == '_start_execution':
+            job = args[0]
+            services = job.services if job.services is not None else ZoeScheduler._essential_services(job.execution)
+            return self.spawn_services(services)
+        elif name == '_grow_services':
+            return self.spawn_services(args[1])
+        elif name == '_shrink_services':
+            return self.remove_services(len(args[1]))
+        elif name == '_terminate_execution':
+            running_job = args[3]  # the containers are counted without loading the services, the scheduler holds its lock
+            return self.remove_services(len(running_job.services) + len(running_job.elastic_active) if running_job is not None else 0)
+        return 0
+
+
+class SimulatedExecutor:
+    """Runs the jobs submitted by the scheduler in virtual time, after the latency given by the latency model."""
+    def __init__(self, sim):
+        self.sim = sim
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            pending = [a for a in args if isinstance(a, Future) and not a.done()]
+            if len(pending) > 0:  # the job would wait for another one, for example a termination for the start it cancelled
+                pending[0].add_done_callback(lambda f: self.sim.schedule(0, run))
+                return
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                log.exception('Simulated job {} failed'.format(fn.__name__))
+                future.set_exception(e)
+
+        self.sim.schedule(self.sim.latency.job_latency(fn, args), run)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class SimulatedScheduler(ZoeScheduler):
+    """The real scheduler, driven by the event loop of the simulation instead of its own thread and pools."""
+    def __init__(self, sim):
+        super().__init__(clock=sim.now)
+        self.start_pool.shutdown()
+        self.termination_pool.shutdown()
+        self.sim = sim
+        self.start_pool = SimulatedExecutor(sim)
+        self.termination_pool = SimulatedExecutor(sim)
+
+    def loop_start_th(self):
+        return  # the simulation calls the scheduler from its event loop
+
+    def trigger(self):
+        self.sim.triggered = True
+
+    def _swarm_stats(self):
+        return self.sim.cluster.stats()
+
+
+class SimulationResult:
+    def __init__(self, label):
+        self.label = label
+        self.makespan = 0
+        self.waits = []
+        self.utilization = 0
+        self.completed = 0
+        self.errors = 0
+        self.preemptions = 0
+
+    def wait_percentile(self, percentile):
+        if len(self.waits) == 0:
+            return float('nan')
+        ordered = sorted(self.waits)
+        rank = max(int(math.ceil(percentile / 100 * len(ordered))) - 1, 0)
+        return ordered[rank]
+
+
+class Simulation:
+    """
+    Replays a trace against the scheduler with a given configuration, see load_configuration() in zoe_master.config for the options.
+    """
+    def __init__(self, trace: list, conf: Namespace, node_count: int, node_memory: int, latency: DockerLatencyModel):
+        self.trace = sorted(trace, key=lambda x: x['time'])
+        self.conf = conf
+        self.latency = latency
+        self.time = SIMULATION_EPOCH
+        self.events = []
+        self._seq = 0
+        self.triggered = False
+        self._tick_pending = False
+        self.sql = SimulatedSQLManager(self)
+        self.cluster = VirtualCluster(node_count, node_memory, self.now)
+        self.scheduler = None
+        self.runtimes = {}  # execution ID -> runtime from the trace
+        self.time_submit = {}
+        self.time_start = {}
+        self.time_end = {}
+        self.failed = set()
+        self.starts = {}  # execution ID -> number of times it started, more than one if it was preempted
+
+    def now(self):
+        return self.time
+
+    def schedule(self, delay: float, callback):
+        self._seq += 1
+        heapq.heappush(self.events, (self.time + delay, self._seq, callback))
+
+    @contextlib.contextmanager
+    def _virtual_docker(self):
+        """Replace the Docker-facing functions used by the scheduler with virtual ones."""
+        saved = (zoe_master.scheduler.execution_to_containers, zoe_master.scheduler.terminate_execution, zoe_master.scheduler.terminate_service, zoe_master.scheduler.remove_containers)
+        zoe_master.scheduler.execution_to_containers = self._execution_to_containers
+        zoe_master.scheduler.terminate_execution = self._terminate_execution
+        zoe_master.scheduler.terminate_service = self._terminate_service
+        zoe_master.scheduler.remove_containers = self._remove_containers
+        try:
+            yield
+        finally:
+            zoe_master.scheduler.execution_to_containers, zoe_master.scheduler.terminate_execution, zoe_master.scheduler.terminate_service, zoe_master.scheduler.remove_containers = saved
+
+    def _execution_to_containers(self, execution, cancel_event=None, placement=None, services=None):
+        if services is None:
+            services = execution.services
+        for service in services:
+            if cancel_event is not None and cancel_event.is_set():
+                raise ZoeStartExecutionCancelledException('execution {} terminated while starting'.format(execution.id))
+            service.set_starting()
+            self.cluster.spawn(service, placement.get(service.id) if placement is not None else None)
+            service.set_active('sim-{}'.format(service.id))
+
+    def _terminate_service(self, service):
+        if service.docker_id is None:
+            return
+        self.cluster.remove(service)
+        service.set_inactive()
+
+    def _remove_containers(self, execution):
+        for service in execution.services:
+            self._terminate_service(service)
+
+    def _terminate_execution(self, execution):
+        execution.set_cleaning_up()
+        self._remove_containers(execution)
+        execution.set_terminated()
+
+    def execution_status_changed(self, exec_id, status):
+        if status == Execution.RUNNING_STATUS:
+            if exec_id not in self.time_start:
+                self.time_start[exec_id] = self.now()
+            self.starts[exec_id] = self.starts.get(exec_id, 0) + 1
+            start = self.starts[exec_id]
+            self.schedule(self.runtimes[exec_id], lambda: self._finish(exec_id, start))
+        elif status == Execution.ERROR_STATUS:
+            self.failed.add(exec_id)
+            self.time_end[exec_id] = self.now()
+        elif status == Execution.TERMINATED_STATUS and exec_id in self.time_start:
+            self.time_end[exec_id] = self.now()
+
+    def _submit(self, item):
+        description = {
+            'name': item['name'],
+            'priority': item.get('priority', 512),
+            'will_end': item.get('will_end', True),
+            'services': []
+        }
+        for s in item['services']:
+            description['services'].append({
+                'name': s['name'],
+                'required_resources': {'memory': s['memory']},
+                'total_count': s.get('count', 1),
+                'essential_count': s.get('essential_count', s.get('count', 1)),
+                'startup_order': s.get('startup_order', 0)
+            })
+        exec_id = self.sql.execution_new(item['name'], item.get('user', 'user'), description)
+        self.runtimes[exec_id] = item['runtime']
+        self.time_submit[exec_id] = self.now()
+        execution = self.sql.execution_list(id=exec_id, only_one=True)
+        _digest_application_description(execution)
+        execution.set_scheduled()
+        self.scheduler.incoming(execution)
+
+    def _finish(self, exec_id, start):
+        execution = self.sql.execution_list(id=exec_id, only_one=True)
+        if self.starts[exec_id] != start or execution.status != Execution.RUNNING_STATUS:
+            return  # the execution has been preempted, it will run again from the beginning
+        if exec_id in self.scheduler.starting or exec_id in self.scheduler.resizing:
+            self.schedule(1, lambda: self._finish(exec_id, start))  # the scheduler would wait for the jobs in progress
+            return
+        execution.set_cleaning_up()
+        self.scheduler.terminate(execution)
+
+    def _run_scheduler(self):
+        while self.triggered:
+            self.triggered = False
+            self.scheduler._requeue_due_retries()
+            self.scheduler._dispatch_starts()
+        if len(self.scheduler.retry_wheel) > 0 and not self._tick_pending:
+            self._tick_pending = True
+            self.schedule(self.scheduler.retry_wheel.tick, self._retry_tick)
+
+    def _retry_tick(self):
+        self._tick_pending = False
+        self.triggered = True
+
+    @contextlib.contextmanager
+    def running(self):
+        """Sets up the configuration, the virtual Docker functions and the scheduler, events can be processed in the block."""
+        config.load_configuration(test_conf=self.conf)
+        config.singletons['sql_manager'] = self.sql
+        with self._virtual_docker():
+            self.scheduler = SimulatedScheduler(self)
+            try:
+                yield self.scheduler
+            finally:
+                self.scheduler.quit()
+
+    def run_events(self, until=float('inf')):
+        """Processes the events up to the given virtual time, or until there are no more events."""
+        self._run_scheduler()
+        while len(self.events) > 0 and self.events[0][0] <= until:
+            self.time, seq, callback = heapq.heappop(self.events)
+            callback()
+            self._run_scheduler()
+        if until != float('inf'):
+            self.time = max(self.time, until)
+
+    def run(self, label: str) -> SimulationResult:
+        with self.running():
+            for item in self.trace:
+                self.schedule(item['time'], lambda x=item: self._submit(x))
+            self.run_events()
+        return self._result(label)
+
+    def _result(self, label) -> SimulationResult:
+        result = SimulationResult(label)
+        result.waits = [self.time_start[e] - self.time_submit[e] for e in self.time_start]
+        result.completed = len(self.time_start)
+        result.errors = len(self.failed)
+        result.preemptions = sum(self.starts.values()) - len(self.starts)
+        if len(self.time_end) > 0:
+            result.makespan = max(self.time_end.values()) - min(self.time_submit.values())
+        if result.makespan > 0:
+            result.utilization = self.cluster.reserved_area / (sum(self.cluster.memory_total.values()) * result.makespan)
+        return result
+
+
+def synthetic_trace(count: int, rng: random.Random, mean_interarrival=60.0) -> list:
+    """A mix of interactive notebooks and batch Spark jobs of various sizes, arriving as a Poisson process."""
+    gb = 1024 ** 3
+    trace = []
+    t = 0
+    for i in range(count):
+        t += rng.expovariate(1 / mean_interarrival)
+        workers = rng.choice([2, 4, 8, 16])
+        if rng.random() < 0.3:
+            item = {'name': 'notebook', 'priority': 512, 'will_end': False, 'runtime': rng.uniform(1800, 7200)}
+            notebook_service = {'name': 'jupyter', 'memory': 4 * gb, 'count': 1, 'startup_order': 1}
+        else:
+            item = {'name': 'spark-batch-{}'.format(workers), 'priority': 256, 'will_end': True, 'runtime': rng.uniform(300, 3600)}
+            notebook_service = {'name': 'spark-submit', 'memory': 2 * gb, 'count': 1, 'startup_order': 2}
+        item['time'] = t
+        item['user'] = 'user{}'.format(rng.randint(1, 10))
+        item['services'] = [
+            {'name': 'spark-master', 'memory': 2 * gb, 'count': 1, 'startup_order': 0},
+            {'name': 'spark-worker', 'memory': 8 * gb, 'count': workers, 'essential_count': 2, 'startup_order': 1},
+            notebook_service
+        ]
+        trace.append(item)
+    return trace
+
+
+def scheduler_conf(args, policy: str) -> Namespace:
+    """Builds the master configuration for one of the policies to compare, in the form POLICY[+backfill][+preemption]."""
+    options = policy.split('+')
+    conf = Namespace()
+    conf.deployment_name = 'simulation'
+    conf.scheduler_policy = options[0]
+    conf.backfill = 'backfill' in options
+    conf.preemption = 'preemption' in options
+    conf.preemption_priority_gap = args.preemption_priority_gap
+    conf.preemption_min_runtime = args.preemption_min_runtime
+    conf.placement_policy = args.placement_policy
+    conf.priority_aging_rate = args.priority_aging_rate
+    conf.fair_share_half_life = args.fair_share_half_life
+    conf.max_concurrent_starts = args.max_concurrent_starts
+    conf.max_parallel_spawns = args.max_parallel_spawns
+    conf.max_concurrent_terminations = args.max_concurrent_terminations
+    conf.start_retry_max_attempts = 8
+    conf.start_retry_base_delay = 5
+    return conf
+
+
+def load_arguments():
+    argparser = ArgumentParser(description="Zoe scheduler simulator - replays a trace of executions against a virtual cluster to compare scheduler policies")
+    argparser.add_argument('--debug', action='store_true', help='Enable debug output')
+    argparser.add_argument('--trace', type=FileType('r'), help='Trace file, one JSON object per line')
+    argparser.add_argument('--synthetic', type=int, help='Generate a random trace with this number of executions', default=200)
+    argparser.add_argument('--seed', type=int, help='Seed for the random number generators', default=42)
+    argparser.add_argument('--policies', help='Comma separated list of scheduler policies to compare, add +backfill and +preemption to enable backfilling and preemption', default='FIFO,PRIORITY,FAIR,FIFO+backfill,PRIORITY+backfill,FAIR+backfill,PRIORITY+preemption')
+    argparser.add_argument('--nodes', type=int, help='Number of nodes in the virtual cluster', default=10)
+    argparser.add_argument('--node-memory', help='Memory of each node in the virtual cluster', default='64GiB')
+    argparser.add_argument('--placement-policy', choices=['binpack', 'spread'], help='Placement policy', default='binpack')
+    argparser.add_argument('--priority-aging-rate', type=float, help='Priority points gained per second of waiting (PRIORITY policy)', default=0.1)
+    argparser.add_argument('--fair-share-half-life', type=float, help='Half-life in seconds of the resource consumption of users (FAIR policy)', default=86400)
+    argparser.add_argument('--preemption-priority-gap', type=int, help='Minimum priority difference between an execution and the executions it can preempt', default=128)
+    argparser.add_argument('--preemption-min-runtime', type=int, help='Executions that started less than this number of seconds ago cannot be preempted', default=30)
+    argparser.add_argument('--max-concurrent-starts', type=int, help='Maximum number of executions started at the same time', default=4)
+    argparser.add_argument('--max-parallel-spawns', type=int, help='Maximum number of services spawned in parallel for an execution', default=8)
+    argparser.add_argument('--max-parallel-removals', type=int, help='Maximum number of containers removed in parallel for an execution', default=8)
+    argparser.add_argument('--max-concurrent-terminations', type=int, help='Maximum number of executions terminated at the same time', default=4)
+    argparser.add_argument('--spawn-latency', type=float, help='Mean time in seconds to create and start a container', default=3.0)
+    argparser.add_argument('--remove-latency', type=float, help='Time in seconds to remove a container', default=1.0)
+    argparser.add_argument('--pull-probability', type=float, help='Probability that spawning a container requires pulling its image', default=0.05)
+    argparser.add_argument('--pull-latency', type=float, help='Time in seconds to pull an image', default=60.0)
+    return argparser.parse_args()
+
+
+def main():
+    args = load_arguments()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+
+    if args.trace is not None:
+        trace = [json.loads(line) for line in args.trace if len(line.strip()) > 0]
+    else:
+        trace = synthetic_trace(args.synthetic, random.Random(args.seed))
+
+    print('{:<20} {:>10} {:>10} {:>10} {:>10} {:>8} {:>7} {:>8}'.format('policy', 'makespan', 'wait p50', 'wait p90', 'wait p99', 'util', 'errors', 'preempt'))
+    for policy in args.policies.split(','):
+        latency = DockerLatencyModel(random.Random(args.seed), args.spawn_latency, args.remove_latency, args.pull_probability, args.pull_latency, args.max_parallel_spawns, args.max_parallel_removals)
+        sim = Simulation(trace, scheduler_conf(args, policy), args.nodes, humanfriendly.parse_size(args.node_memory), latency)
+        r = sim.run(policy)
+        print('{:<20} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.0f} {:>7.1f}% {:>7} {:>8}'.format(r.label, r.makespan, r.wait_percentile(50), r.wait_percentile(90), r.wait_percentile(99), r.utilization * 100, r.errors, r.preemptions))
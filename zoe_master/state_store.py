@@ -0,0 +1,296 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The in-memory state of the master.
+"""
+
+import logging
+import queue
+import threading
+import time
+import weakref
+
+from zoe_lib.sql_manager import SQLManager, Execution, Service
+from zoe_master.exceptions import ZoeException
+
+log = logging.getLogger(__name__)
+
+# executions in these states can still change, the master keeps them in memory
+LIVE_STATUSES = (Execution.SUBMIT_STATUS, Execution.SCHEDULED_STATUS, Execution.STARTING_STATUS, Execution.RUNNING_STATUS, Execution.CLEANING_UP_STATUS)
+
+
+class _FlushRequest:
+    """Queued by flush(), the writer sets the event once the state changes queued before it have been written."""
+    __slots__ = ('done',)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class StateStore:
+    """
+    The master is the only writer of the state of executions and services, so it keeps the executions that are not
+    finished, and their services, in memory. It has the same interface as SQLManager and can replace it in the master.
+
+    There is a single Execution and Service object for each ID: lookups by ID, and by status for live executions, are
+    answered from memory. State changes made through the objects are written to the database asynchronously, in the
+    order they were made, by a writer thread that groups the changes made within write_delay seconds in one
+    transaction. Executions are dropped from memory once their final state has been written. Other queries wait for
+    the pending writes and go to the database.
+
+    A batch that cannot be written is retried, with an exponential backoff, until it succeeds or the store is stopped:
+    later changes are not written before it, not to change their order. Meanwhile flush() fails after flush_timeout
+    seconds with the error.
+    """
+    WRITE_RETRY_DELAY = 0.5  # seconds, doubled at each failed attempt
+    MAX_WRITE_RETRY_DELAY = 30
+    QUIT_TIMEOUT = 10  # seconds quit() waits for the pending state changes to be written
+
+    def __init__(self, sql_manager: SQLManager, write_delay=0.005, write_batch_size=1000, flush_timeout=60):
+        """
+        :param write_delay: seconds the writer waits for more state changes to group in the same transaction
+        :param write_batch_size: maximum number of state changes written in one transaction
+        :param flush_timeout: seconds flush() waits for the pending state changes to be written
+        """
+        self.sql = sql_manager
+        self.write_delay = write_delay
+        self.write_batch_size = write_batch_size
+        self.flush_timeout = flush_timeout
+        self._write_error = None  # the error of the last failed write, until a write succeeds
+        self._executions = {}  # execution ID -> live Execution
+        self._services = {}  # service ID -> Service of a live execution
+        self._known = weakref.WeakValueDictionary()  # execution ID -> Execution, for all the objects still referenced
+        self._lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._stop = threading.Event()  # set by quit() to abandon a batch that cannot be written
+        self._writer = threading.Thread(target=self._write_loop, name='state-writer', daemon=True)
+        self._writer.start()
+
+    def load(self):
+        """Loads the live executions and their services."""
+        executions = self.sql.execution_list(include_services=True, status=list(LIVE_STATUSES))
+        for execution in executions:
+            self._adopt(execution)
+        log.info('Loaded {} live executions and {} services in memory'.format(len(self._executions), len(self._services)))
+
+    def _adopt(self, execution: Execution) -> Execution:
+        """
+        Returns the object of the store for an execution: the one already known, or the given one, that from now on
+        writes through the store. Live executions are kept in memory, with their services.
+        """
+        with self._lock:
+            known = self._known.get(execution.id)
+        if known is None and execution._services is None and execution.status in LIVE_STATUSES:
+            self.sql.load_services([execution])
+        with self._lock:
+            known = self._known.get(execution.id)  # it may have been adopted by another thread in the meantime
+            if known is not None:
+                execution = known
+            else:
+                execution.sql_manager = self
+                self._known[execution.id] = execution
+            if execution.status in LIVE_STATUSES:  # it can be live again, for example after a preemption
+                self._executions[execution.id] = execution
+                if execution._services is not None:
+                    execution._services = [self._index_service(s) for s in execution._services]
+        return execution
+
+    def _index_service(self, service: Service) -> Service:
+        """Returns the object in memory for a service, call with the lock held."""
+        known = self._services.get(service.id)
+        if known is not None:
+            return known
+        service.sql_manager = self
+        self._services[service.id] = service
+        return service
+
+    def _next_batch(self):
+        """Waits for a state change, then collects the ones that follow it within the write delay."""
+        batch = [self._writes.get()]
+        deadline = time.time() + self.write_delay
+        while batch[-1] is not None and not isinstance(batch[-1], _FlushRequest) and len(batch) < self.write_batch_size:
+            remaining = deadline - time.time()
+            try:
+                batch.append(self._writes.get(timeout=remaining) if remaining > 0 else self._writes.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        while True:
+            batch = self._next_batch()
+            updates = [write for write in batch if isinstance(write, tuple)]
+            attempt = 0
+            while len(updates) > 0:
+                try:
+                    self.sql.update_many(updates)
+                    self._write_error = None
+                    break
+                except Exception as e:
+                    self._write_error = e
+                    delay = min(self.WRITE_RETRY_DELAY * 2 ** attempt, self.MAX_WRITE_RETRY_DELAY)
+                    log.exception('Error writing {} state changes, retrying in {} seconds'.format(len(updates), delay))
+                    if self._stop.wait(delay):  # retry the same batch, to keep the order
+                        log.error('State store stopped, {} state changes have not been written'.format(len(updates) + self._writes.qsize()))
+                        return
+                    attempt += 1
+            for table, row_id, kwargs in updates:
+                if table == 'execution' and kwargs.get('status') is not None and kwargs['status'] not in LIVE_STATUSES:
+                    self._evict(row_id)
+            if isinstance(batch[-1], _FlushRequest):
+                batch[-1].done.set()
+            elif batch[-1] is None:
+                break
+
+    def _evict(self, exec_id):
+        with self._lock:
+            execution = self._executions.get(exec_id)
+            if execution is None or execution.status in LIVE_STATUSES:
+                return  # restarted in the meantime
+            del self._executions[exec_id]
+            for service in execution._services if execution._services is not None else []:
+                self._services.pop(service.id, None)
+
+    def flush(self):
+        """
+        Waits until all the state changes made so far have been written to the database. Changes made by other threads
+        in the meantime are not waited for.
+        Raises ZoeException if they could not be written within flush_timeout seconds.
+        """
+        request = _FlushRequest()
+        self._writes.put(request)
+        if not request.done.wait(self.flush_timeout):
+            raise ZoeException('State changes not written to the database after {} seconds: {}'.format(self.flush_timeout, self._write_error))
+
+    def pending_writes(self) -> int:
+        return self._writes.qsize()
+
+    def quit(self, timeout=QUIT_TIMEOUT):
+        """Writes the pending state changes and stops the writer, the changes not written within timeout seconds are lost."""
+        self._writes.put(None)
+        self._writer.join(timeout)
+        if self._writer.is_alive():
+            self._stop.set()
+            self._writer.join(timeout)
+
+    def pool_stats(self) -> dict:
+        return self.sql.pool_stats()
+
+    def execution_list(self, only_one=False, **kwargs):
+        if list(kwargs.keys()) == ['id'] and not isinstance(kwargs['id'], (list, tuple, set)):
+            with self._lock:
+                execution = self._executions.get(kwargs['id'], self._known.get(kwargs['id']))
+            if execution is None:
+                self.flush()
+                execution = self.sql.execution_list(only_one=True, include_services=True, id=kwargs['id'])
+            if execution is not None:
+                execution = self._adopt(execution)
+            if only_one:
+                return execution
+            return [execution] if execution is not None else []
+        elif list(kwargs.keys()) == ['status']:
+            statuses = kwargs['status'] if isinstance(kwargs['status'], (list, tuple, set)) else [kwargs['status']]
+            if all(status in LIVE_STATUSES for status in statuses):
+                with self._lock:
+                    executions = sorted((e for e in self._executions.values() if e.status in statuses), key=lambda e: e.id)
+                if only_one:
+                    return executions[0] if len(executions) > 0 else None
+                return executions
+
+        self.flush()
+        ret = self.sql.execution_list(only_one=only_one, **kwargs)
+        if only_one:
+            return self._adopt(ret) if ret is not None else None
+        return [self._adopt(e) for e in ret]
+
+    def archive_executions(self, ended_before, batch_size: int) -> int:
+        """Archives a batch of finished executions once their final states have been written."""
+        self.flush()
+        return self.sql.archive_executions(ended_before, batch_size)
+
+    def execution_list_ended_after(self, time_end):
+        self.flush()
+        return self.sql.execution_list_ended_after(time_end)
+
+    def execution_update(self, exec_id, **kwargs):
+        self._writes.put(('execution', exec_id, kwargs))
+
+    def execution_delete(self, exec_id):
+        """Deletes an execution and its services from the database, and forgets their objects."""
+        self.flush()
+        self.sql.execution_delete(exec_id)
+        with self._lock:
+            self._executions.pop(exec_id, None)
+            self._known.pop(exec_id, None)
+            for service_id in [s.id for s in self._services.values() if s.execution_id == exec_id]:
+                del self._services[service_id]
+
+    def load_services(self, executions: list):
+        for execution in executions:
+            execution._services = self.service_list(execution_id=execution.id)
+
+    def service_list(self, only_one=False, **kwargs):
+        services = None
+        if list(kwargs.keys()) == ['id'] and not isinstance(kwargs['id'], (list, tuple, set)):
+            with self._lock:
+                service = self._services.get(kwargs['id'])
+            if service is not None:
+                services = [service]
+        elif list(kwargs.keys()) == ['execution_id'] and not isinstance(kwargs['execution_id'], (list, tuple, set)):
+            with self._lock:
+                execution = self._executions.get(kwargs['execution_id'])
+            if execution is not None:
+                if execution._services is None:  # invalidated
+                    self.flush()
+                    loaded = self.sql.service_list(execution_id=execution.id)
+                    with self._lock:
+                        execution._services = [self._index_service(s) for s in loaded]
+                services = list(execution._services)
+
+        if services is None:
+            self.flush()
+            services = self.sql.service_list(**kwargs)
+            for service in services:
+                service.sql_manager = self
+        if only_one:
+            return services[0] if len(services) > 0 else None
+        return services
+
+    def service_update(self, service_id, **kwargs):
+        self._writes.put(('service', service_id, kwargs))
+
+    def services_new(self, execution_id, services: list) -> list:
+        """Creates the services synchronously, the IDs are needed right away."""
+        self.flush()
+        ids = self.sql.services_new(execution_id, services)
+        with self._lock:
+            execution = self._executions.get(execution_id)
+            if execution is not None:
+                created = []
+                for service_id, (name, service_group, description) in zip(ids, services):
+                    created.append(self._index_service(Service.from_dict({
+                        'id': service_id,
+                        'name': name,
+                        'status': 'created',
+                        'error_message': None,
+                        'execution_id': execution_id,
+                        'description': description,
+                        'service_group': service_group,
+                        'docker_id': None
+                    }, self)))
+                if execution._services is not None:
+                    execution._services = execution._services + created
+        return ids
@@ -13,6 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import bisect
+import collections
+
+from zoe_lib.sql_manager import Execution
+
 
 class Stats:
     def __init__(self):
@@ -29,6 +34,7 @@ class SwarmNodeStats(Stats):
         super().__init__()
         self.name = name
         self.docker_endpoint = None
+        self.status = None
         self.container_count = 0
         self.cores_total = 0
         self.cores_reserved = 0
@@ -65,8 +71,90 @@ class SwarmStats(Stats):
         return ret
 
 
+class Histogram:
+    """Counts of observed durations in fixed buckets, cheap to update and to serialize."""
+    BUCKETS = [1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200]  # upper bounds in seconds, the last bucket is unbounded
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> dict:
+        return {
+            'buckets': self.BUCKETS + [None],
+            'counts': list(self.counts),
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max
+        }
+
+
 class SchedulerStats(Stats):
+    """Live counters kept by the scheduler, updated incrementally so that they can be polled often."""
+    THROUGHPUT_WINDOW = 60  # seconds
+
     def __init__(self):
         super().__init__()
         self.count_waiting = 0
-        self.waiting_list = []
+        self.count_starting = 0
+        self.count_running = 0
+        self.count_terminating = 0
+        self.count_retry_waiting = 0
+        self.queue_depth = {}  # application priority -> number of queued executions
+        self.wait_time = {
+            'queue': Histogram(),  # from entering the queue to being handed to the start pool
+            'start': Histogram(),  # from being handed to the start pool to running, or to a start failure
+            'termination': Histogram()  # from the termination request to all containers removed
+        }
+        self.starts_total = 0
+        self.starts_failed = 0
+        self.retries_total = 0
+        self.retries_given_up = 0
+        self.preemptions_total = 0
+        self._recent_starts = collections.deque()
+
+    def queue_changed(self, execution: Execution, delta: int):
+        priority = int(execution.description['priority'])
+        self.queue_depth[priority] = self.queue_depth.get(priority, 0) + delta
+        if self.queue_depth[priority] == 0:
+            del self.queue_depth[priority]
+
+    def started(self, now: float):
+        self.starts_total += 1
+        self._recent_starts.append(now)
+        self._trim_recent_starts(now)  # the stats may never be polled
+
+    def _trim_recent_starts(self, now: float):
+        while len(self._recent_starts) > 0 and self._recent_starts[0] < now - self.THROUGHPUT_WINDOW:
+            self._recent_starts.popleft()
+
+    def start_throughput(self, now: float) -> float:
+        """Executions started per minute, over the last THROUGHPUT_WINDOW seconds."""
+        self._trim_recent_starts(now)
+        return len(self._recent_starts) * 60 / self.THROUGHPUT_WINDOW
+
+    def to_dict(self) -> dict:
+        return {
+            'timestamp': self.timestamp,
+            'count_waiting': self.count_waiting,
+            'count_starting': self.count_starting,
+            'count_running': self.count_running,
+            'count_terminating': self.count_terminating,
+            'count_retry_waiting': self.count_retry_waiting,
+            'queue_depth': {str(priority): count for priority, count in self.queue_depth.items()},
+            'wait_time': {phase: h.to_dict() for phase, h in self.wait_time.items()},
+            'starts_total': self.starts_total,
+            'starts_failed': self.starts_failed,
+            'start_throughput': self.start_throughput(self.timestamp),
+            'retries_total': self.retries_total,
+            'retries_given_up': self.retries_given_up,
+            'preemptions_total': self.preemptions_total
+        }
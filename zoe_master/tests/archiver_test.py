@@ -0,0 +1,120 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import datetime
+import os
+import uuid
+
+import psycopg2
+import pytest
+
+from zoe_api import db_init
+from zoe_lib.sql_manager import SQLManager
+from zoe_master.archiver import ExecutionArchiver
+
+
+class FakeSQLManager:
+    def __init__(self, pending):
+        self.pending = pending
+        self.calls = []
+
+    def archive_executions(self, ended_before, batch_size):
+        count = min(self.pending, batch_size)
+        self.pending -= count
+        self.calls.append(count)
+        return count
+
+
+def test_archive_in_batches():
+    sql = FakeSQLManager(25)
+    archiver = ExecutionArchiver(sql, retention=30, interval=3600, batch_size=10)
+    assert archiver.archive() == 25
+    assert sql.calls == [10, 10, 5]
+
+    sql = FakeSQLManager(20)
+    archiver = ExecutionArchiver(sql, retention=30, interval=3600, batch_size=10)
+    assert archiver.archive() == 20
+    assert sql.calls == [10, 10, 0]
+
+
+@pytest.fixture
+def sql_manager():
+    """A SQLManager on a new schema of a real PostgreSQL database, set by the ZOE_TEST_DB* environment variables."""
+    if 'ZOE_TEST_DBHOST' not in os.environ:
+        pytest.skip('no PostgreSQL database to test on, set ZOE_TEST_DBHOST')
+    conf = argparse.Namespace(dbhost=os.environ['ZOE_TEST_DBHOST'],
+                              dbport=int(os.environ.get('ZOE_TEST_DBPORT', 5432)),
+                              dbname=os.environ.get('ZOE_TEST_DBNAME', 'postgres'),
+                              dbuser=os.environ.get('ZOE_TEST_DBUSER', 'postgres'),
+                              dbpass=os.environ.get('ZOE_TEST_DBPASS', ''),
+                              deployment_name='zoe_test_' + uuid.uuid4().hex[:8],
+                              dbpool_size=2, dbpool_timeout=5)
+    try:
+        conn = psycopg2.connect(dbname=conf.dbname, user=conf.dbuser, password=conf.dbpass, host=conf.dbhost, port=conf.dbport)
+    except psycopg2.OperationalError as e:
+        pytest.skip('cannot connect to PostgreSQL: {}'.format(e))
+    conn.autocommit = True
+    cur = conn.cursor()
+    db_init.version_table(cur)
+    cur.execute('CREATE SCHEMA {}'.format(conf.deployment_name))
+    cur.execute('SET search_path TO {},public'.format(conf.deployment_name))
+    db_init.create_tables(cur)
+    cur.execute("INSERT INTO public.versions (deployment, version) VALUES (%s, %s)", (conf.deployment_name, 0))
+    db_init.migrate(cur, conf.deployment_name, 0)
+    sql = SQLManager(conf)
+    yield sql
+    sql.pool.closeall()
+    cur.execute('DROP SCHEMA {} CASCADE'.format(conf.deployment_name))
+    cur.execute("DELETE FROM public.versions WHERE deployment = %s", (conf.deployment_name,))
+    conn.close()
+
+
+def _finished_execution(sql, name, time_end):
+    description = {'name': name, 'services': []}
+    exec_id = sql.execution_new(name, 'alice', description)
+    sql.services_new(exec_id, [('worker0', 'worker', {'name': 'worker'}), ('worker1', 'worker', {'name': 'worker'})])
+    sql.execution_update(exec_id, status='terminated', time_start=time_end - datetime.timedelta(hours=1), time_end=time_end)
+    return exec_id
+
+
+def test_archived_executions_are_read_back(sql_manager):
+    now = datetime.datetime.now()
+    old = [_finished_execution(sql_manager, 'old{}'.format(i), now - datetime.timedelta(days=40 + i * 20)) for i in range(3)]
+    recent = _finished_execution(sql_manager, 'recent', now - datetime.timedelta(days=1))
+    running = sql_manager.execution_new('running', 'alice', {'name': 'running', 'services': []})
+
+    archiver = ExecutionArchiver(sql_manager, retention=30, interval=3600, batch_size=2)
+    assert archiver.archive() == 3
+    assert archiver.archive() == 0
+    with sql_manager._transaction() as cur:
+        cur.execute('SELECT count(*) FROM execution_archive')
+        assert cur.fetchone()[0] == 3
+        cur.execute('SELECT count(*) FROM service_archive')
+        assert cur.fetchone()[0] == 6
+
+    executions = sql_manager.execution_list(user_id='alice', order_by='id')
+    assert [e.id for e in executions] == sorted(old + [recent, running])
+    assert sql_manager.execution_list(status='terminated', order_by='id', after_id=old[0], limit=2)[0].id == old[1]
+    summaries = sql_manager.execution_list(status='terminated', summary=True)
+    assert sorted(s.service_count for s in summaries) == [2, 2, 2, 2]
+
+    execution = sql_manager.execution_list(id=old[2], only_one=True)
+    assert execution.name == 'old2'
+    assert execution.description == {'name': 'old2', 'services': []}
+    assert [s.name for s in execution.services] == ['worker0', 'worker1']
+    assert sql_manager.service_list(id=execution.services[0].id, only_one=True).description == {'name': 'worker'}
+    executions = sql_manager.execution_list(include_services=True, id=old)
+    assert sorted(len(e.services) for e in executions) == [2, 2, 2]
@@ -17,8 +17,12 @@ import pytest
 import json
 
 from zoe_master.config import load_configuration, get_conf
-from zoe_master.state.manager import StateManager
-from zoe_master.state.blobs.fs import FSBlobs
+try:
+    from zoe_master.state.manager import StateManager
+    from zoe_master.state.blobs.fs import FSBlobs
+except ImportError:  # the state manager has been replaced by the SQL database, its tests cannot run
+    StateManager = None
+    collect_ignore = ['state_applications_test.py', 'state_executions_test.py', 'state_manager_test.py', 'state_service_test.py', 'state_users_test.py']
 
 
 class TestConf:
@@ -0,0 +1,61 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from zoe_lib.sql_manager import Service
+from zoe_master.placement import ClusterState, place_services
+
+GB = 1024 ** 3
+
+
+def _service(service_id, group, index, memory, essential_count):
+    d = {
+        'id': service_id,
+        'name': '{}{}'.format(group, index),
+        'status': 'created',
+        'error_message': None,
+        'execution_id': 1,
+        'description': {'required_resources': {'memory': memory}, 'essential_count': essential_count},
+        'service_group': group,
+        'docker_id': None
+    }
+    return Service.from_dict(d, None)
+
+
+def _services():
+    return [
+        _service(1, 'master', 0, 2 * GB, 1),
+        _service(2, 'worker', 0, 4 * GB, 1),
+        _service(3, 'worker', 1, 4 * GB, 1),
+    ]
+
+
+def test_essential_does_not_fit():
+    cluster = ClusterState({'node1': 5 * GB})
+    assert place_services(_services(), cluster, 'binpack') is None
+    assert cluster.free_memory == {'node1': 5 * GB}
+
+
+def test_binpack():
+    cluster = ClusterState({'node1': 16 * GB, 'node2': 7 * GB})
+    placement = place_services(_services(), cluster, 'binpack')
+    assert placement == {1: 'node2', 2: 'node2', 3: 'node1'}
+    assert cluster.free_memory == {'node1': 12 * GB, 'node2': 1 * GB}
+
+
+def test_spread_skips_elastic():
+    cluster = ClusterState({'node1': 6 * GB, 'node2': 4 * GB})
+    placement = place_services(_services(), cluster, 'spread')
+    assert placement == {1: 'node2', 2: 'node1'}
+    assert cluster.total_free_memory == 4 * GB
@@ -0,0 +1,96 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import random
+
+from zoe_lib.sql_manager import Execution
+from zoe_master.scheduler_policies.base import IndexedHeap
+from zoe_master.scheduler_policies.fair_share import FairSharePolicy
+from zoe_master.scheduler_policies.fifo import FIFOPolicy
+from zoe_master.scheduler_policies.priority import PriorityPolicy
+
+
+def _execution(exec_id, priority=512, will_end=True, time_submit=None, user_id='test'):
+    d = {
+        'id': exec_id,
+        'user_id': user_id,
+        'name': 'test{}'.format(exec_id),
+        'description': {'priority': priority, 'will_end': will_end, 'services': []},
+        'status': Execution.SCHEDULED_STATUS,
+        'time_submit': time_submit if time_submit is not None else datetime.datetime.now(),
+        'time_start': None,
+        'time_end': None,
+        'error_message': None
+    }
+    return Execution.from_dict(d, None)
+
+
+def test_indexed_heap():
+    heap = IndexedHeap()
+    keys = list(range(100))
+    random.shuffle(keys)
+    for k in keys:
+        heap.push(k, k, k)
+    for k in range(0, 100, 3):
+        assert heap.remove(k) == k
+    assert heap.remove(0) is None
+    assert 1 in heap and 3 not in heap
+    out = [heap.pop() for _ in range(len(heap))]
+    assert out == [k for k in range(100) if k % 3 != 0]
+    assert heap.pop() is None
+
+
+def test_fifo_policy():
+    q = FIFOPolicy()
+    for i in range(5):
+        q.push(_execution(i))
+    assert q.remove(_execution(2))
+    assert not q.remove(_execution(2))
+    assert [e.id for e in q.ordered()] == [0, 1, 3, 4]
+    assert q.pop().id == 0
+
+
+def test_priority_policy():
+    now = datetime.datetime.now()
+    q = PriorityPolicy(aging_rate=0)
+    q.push(_execution(1, priority=100, time_submit=now))
+    q.push(_execution(2, priority=600, time_submit=now))
+    q.push(_execution(3, priority=100, will_end=False, time_submit=now))
+    q.push(_execution(4, priority=600, time_submit=now))
+    assert [e.id for e in q.ordered()] == [2, 4, 3, 1]
+
+
+def test_priority_aging():
+    now = datetime.datetime.now()
+    q = PriorityPolicy(aging_rate=1)
+    q.push(_execution(1, priority=1000, time_submit=now))
+    q.push(_execution(2, priority=0, time_submit=now - datetime.timedelta(seconds=2000)))
+    assert q.peek().id == 2
+
+
+def test_fair_share_policy():
+    q = FairSharePolicy(half_life=100)
+    for i in range(4):
+        q.push(_execution(i, user_id='greedy'))
+    q.push(_execution(10, user_id='other'))
+    assert q.pop().id == 0
+    q.account(_execution(0, user_id='greedy'), 1000, now=0)
+    assert q.peek().id == 10
+    assert [e.id for e in q.ordered()] == [10, 1, 2, 3]
+    assert q.remove(_execution(10, user_id='other'))
+    assert q.peek().id == 1 and len(q) == 3
+    assert abs(q.usage('greedy', now=100) - 500) < 1e-6
+    assert abs(q.usage('greedy', now=10000) - 1000 * 2 ** -100) < 1e-6  # the reference time has been moved forward
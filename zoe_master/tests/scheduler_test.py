@@ -0,0 +1,333 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+from zoe_api.api_endpoint import APIEndpoint
+from zoe_lib.configargparse import Namespace
+from zoe_lib.sql_manager import Execution
+
+import zoe_master.scheduler
+from zoe_master.exceptions import ZoeStartExecutionRetryException
+from zoe_master.scheduler import RuntimeEstimator
+from zoe_master.simulator import Simulation, DockerLatencyModel, scheduler_conf
+
+GB = 1024 ** 3
+ARGS = Namespace(placement_policy='binpack', priority_aging_rate=0.1, fair_share_half_life=86400, preemption_priority_gap=128, preemption_min_runtime=30, max_concurrent_starts=4, max_parallel_spawns=8, max_concurrent_terminations=4)
+
+
+class FixedLatency(DockerLatencyModel):
+    """Every container takes the same time to spawn."""
+    def __init__(self, spawn_latency=10.0):
+        super().__init__(random.Random(1), spawn_latency=spawn_latency, pull_probability=0)
+
+    def spawn(self):
+        return self.spawn_latency
+
+
+def _simulation(policy='FIFO', node_memory=64 * GB):
+    """A simulation on one node, that records the status changes of executions and checks that the database is not used with the queue lock held."""
+    sim = Simulation([], scheduler_conf(ARGS, policy), 1, node_memory, FixedLatency())
+    sim.statuses = {}
+    sim.locked_calls = []
+    status_changed = sim.execution_status_changed
+
+    def record(exec_id, status):
+        sim.statuses.setdefault(exec_id, []).append(status)
+        status_changed(exec_id, status)
+    sim.execution_status_changed = record
+
+    for name in ['execution_list', 'execution_update', 'service_list', 'service_update']:
+        def check(*args, __method=getattr(sim.sql, name), __name=name, **kwargs):
+            if sim.scheduler is not None and sim.scheduler.queue_lock.locked():
+                sim.locked_calls.append(__name)
+            return __method(*args, **kwargs)
+        setattr(sim.sql, name, check)
+    return sim
+
+
+def _submit(sim, name='batch', memory=8 * GB, count=1, essential_count=None, priority=512, will_end=True, runtime=3600):
+    """Submits an execution with a single group of services, returns its ID."""
+    sim._submit({'name': name, 'priority': priority, 'will_end': will_end, 'runtime': runtime,
+                 'services': [{'name': 'worker', 'memory': memory, 'count': count, 'essential_count': essential_count if essential_count is not None else count}]})
+    return max(sim.sql.executions)
+
+
+def _execution(sim, exec_id) -> Execution:
+    return sim.sql.execution_list(id=exec_id, only_one=True)
+
+
+def test_terminate_while_starting():
+    sim = _simulation()
+    with sim.running() as scheduler:
+        exec_id = _submit(sim)
+        sim.run_events(until=sim.now() + 1)
+        assert exec_id in scheduler.starting
+
+        execution = _execution(sim, exec_id)
+        execution.set_cleaning_up()
+        scheduler.terminate(execution)
+        assert scheduler.starting[exec_id].cancel_event.is_set()
+        scheduler.terminate(execution)  # the start is still in progress, the second request waits for the same termination
+        sim.run_events()
+
+        assert len(scheduler.starting) == 0 and len(scheduler.terminating) == 0 and exec_id not in scheduler.running
+    assert Execution.RUNNING_STATUS not in sim.statuses[exec_id]
+    assert sim.statuses[exec_id][-1] == Execution.TERMINATED_STATUS
+    assert len(sim.cluster.containers) == 0
+    assert sim.locked_calls == []
+
+
+class MasterRelay:
+    """Hands the termination requests of the API endpoint to the scheduler, like the master API does."""
+    def __init__(self, sim):
+        self.sim = sim
+
+    def execution_terminate(self, exec_id):
+        execution = self.sim.sql.execution_list(id=exec_id, only_one=True)
+        execution.set_cleaning_up()
+        self.sim.scheduler.terminate(execution)
+        return True, ''
+
+
+def test_terminate_starting_execution_through_the_api():
+    sim = _simulation()
+    api = APIEndpoint.__new__(APIEndpoint)
+    api.sql = sim.sql
+    api.master = MasterRelay(sim)
+    with sim.running() as scheduler:
+        exec_id = _submit(sim)
+        sim.run_events(until=sim.now() + 1)
+        assert exec_id in scheduler.starting
+        _execution(sim, exec_id).set_starting()  # simulated start jobs change status only when their latency has elapsed
+
+        assert api.execution_terminate('admin', 'admin', exec_id) == (True, '')
+        assert scheduler.starting[exec_id].cancel_event.is_set()
+        sim.run_events()
+    assert Execution.RUNNING_STATUS not in sim.statuses[exec_id]
+    assert sim.statuses[exec_id][-1] == Execution.TERMINATED_STATUS
+
+
+def test_no_database_calls_with_the_queue_lock():
+    sim = _simulation('PRIORITY+backfill')
+    with sim.running():
+        for i in range(6):
+            _submit(sim, memory=16 * GB, count=2, runtime=100 * (i + 1))
+        sim.run_events()
+    assert all(statuses[-1] == Execution.TERMINATED_STATUS for statuses in sim.statuses.values())
+    assert sim.locked_calls == []
+
+
+def test_runtime_estimator():
+    estimator = RuntimeEstimator(weight=0.5)
+    assert estimator.estimate('app') is None
+    estimator.update('app', 100)
+    estimator.update('app', 200)
+    assert estimator.estimate('app') == 150
+
+
+def test_backfill():
+    sim = _simulation('FIFO+backfill')
+    with sim.running() as scheduler:
+        for name, runtime in [('running', 1000), ('long16', 5000), ('long8', 5000), ('short16', 500)]:
+            scheduler.runtime_estimator.update(name, runtime)
+        running_id = _submit(sim, 'running', memory=40 * GB, runtime=1000)
+        sim.run_events(until=sim.now() + 20)
+        expected_end = scheduler.running[running_id].expected_end
+        assert expected_end == scheduler.running[running_id].time_started + 1000
+
+        head_id = _submit(sim, 'head', memory=56 * GB)
+        long16_id = _submit(sim, 'long16', memory=16 * GB, runtime=5000)
+        long8_id = _submit(sim, 'long8', memory=8 * GB, runtime=5000)
+        short16_id = _submit(sim, 'short16', memory=16 * GB, runtime=500)
+        _submit(sim, 'no-estimate', memory=4 * GB)
+        _submit(sim, 'interactive', memory=4 * GB, will_end=False)
+
+        # the head fits when the running execution ends, leaving 8 GB that backfilled executions can keep after that time
+        cluster = scheduler._cluster_state(scheduler._swarm_stats())
+        shadow_time, extra = scheduler._head_reservation(scheduler.queue.peek(), cluster, sim.now())
+        assert shadow_time == expected_end
+        assert extra.free_memory == {'node0': 8 * GB}
+
+        sim.run_events(until=sim.now())
+        # long16 fits now but would delay the head, long8 uses only the spare memory, short16 ends before the reservation
+        assert set(scheduler.starting.keys()) == {long8_id, short16_id}
+        assert [e.id for e in scheduler.queue.ordered()][:2] == [head_id, long16_id]
+
+        sim.run_events(until=expected_end + 30)
+        assert head_id in scheduler.running
+    assert sim.time_start[head_id] <= expected_end + sim.latency.remove_latency + sim.latency.spawn_latency  # not delayed by the backfilled executions
+    assert sim.locked_calls == []
+
+
+def test_retry_backoff(monkeypatch):
+    monkeypatch.setattr(zoe_master.scheduler.random, 'uniform', lambda a, b: b)  # no jitter
+    sim = _simulation()
+    with sim.running() as scheduler:
+        scheduler.retry_base_delay = 100
+        exec_id = _submit(sim)
+        execution = _execution(sim, exec_id)
+        delays = []
+        scheduler.retry_wheel.schedule = lambda key, delay, item: delays.append(delay)
+        for attempt in range(scheduler.retry_max_attempts):
+            scheduler._retry_later(execution)
+    assert delays == [100, 200, 400, 600, 600, 600, 600]
+    assert sim.statuses[exec_id][-1] == Execution.ERROR_STATUS
+    assert exec_id not in scheduler.retry_attempts
+
+
+def test_retry_give_up():
+    sim = _simulation()
+    attempts = []
+
+    def fail(execution, cancel_event=None, placement=None, services=None):
+        attempts.append(sim.now())
+        raise ZoeStartExecutionRetryException('registry unreachable')
+    sim._execution_to_containers = fail
+    with sim.running() as scheduler:
+        scheduler.retry_max_attempts = 3
+        exec_id = _submit(sim)
+        sim.run_events()
+        assert len(scheduler.retry_wheel) == 0 and len(scheduler.retry_attempts) == 0 and len(scheduler.queue) == 0
+        stats = scheduler.stats_snapshot()
+
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] < attempts[2] - attempts[1]
+    assert stats['retries_total'] == 2 and stats['retries_given_up'] == 1
+    assert sim.statuses[exec_id][-1] == Execution.ERROR_STATUS
+
+    sim = _simulation()
+    sim._execution_to_containers = fail
+    with sim.running() as scheduler:
+        scheduler.retry_max_attempts = 1  # gives up at the first failure
+        exec_id = _submit(sim)
+        sim.run_events()
+        assert len(scheduler.retry_attempts) == 0
+    assert sim.statuses[exec_id][-1] == Execution.ERROR_STATUS
+
+
+def test_elastic_grow_and_shrink():
+    sim = _simulation()
+    with sim.running() as scheduler:
+        elastic_id = _submit(sim, memory=8 * GB, count=7, essential_count=3, priority=256)
+        sim.run_events(until=sim.now() + 15)
+        job = scheduler.running[elastic_id]
+        assert len(job.services) == 3 and len(job.elastic_pending) == 0  # the queue is empty, elastic services are being spawned
+        sim.run_events(until=sim.now() + 15)
+        assert sorted(s.name for s in job.elastic_active) == ['worker3', 'worker4', 'worker5', 'worker6']
+        assert len(sim.cluster.containers) == 7
+
+        # a higher priority execution does not fit, the elastic services with the highest replica numbers make room for it
+        head_id = _submit(sim, memory=8 * GB, count=3)
+        sim.run_events(until=sim.now() + 30)
+        assert head_id in scheduler.running
+        assert sorted(s.name for s in job.elastic_pending) == ['worker5', 'worker6']
+        assert sorted(s.name for s in job.elastic_active) == ['worker3', 'worker4']
+        assert sum(sim.cluster.memory_reserved.values()) == 64 * GB
+
+        # they are spawned again when there is room
+        execution = _execution(sim, head_id)
+        execution.set_cleaning_up()
+        scheduler.terminate(execution)
+        sim.run_events(until=sim.now() + 30)
+        assert len(job.elastic_pending) == 0 and len(job.elastic_active) == 4
+    assert sim.locked_calls == []
+
+
+def test_equal_priorities_do_not_shrink_each_other():
+    sim = _simulation()
+    with sim.running() as scheduler:
+        first_id = _submit(sim, memory=8 * GB, count=7, essential_count=3)
+        sim.run_events(until=sim.now() + 30)
+        job = scheduler.running[first_id]
+        assert len(job.elastic_active) == 4
+
+        second_id = _submit(sim, memory=8 * GB, count=7, essential_count=3)
+        sim.run_events(until=sim.now() + 30)
+        assert second_id not in scheduler.running and second_id not in scheduler.starting
+        assert len(job.elastic_active) == 4 and len(job.elastic_pending) == 0
+
+        execution = _execution(sim, first_id)
+        execution.set_cleaning_up()
+        scheduler.terminate(execution)
+        sim.run_events(until=sim.now() + 30)
+        assert second_id in scheduler.running
+    assert sim.locked_calls == []
+
+
+def test_terminations_are_merged():
+    sim = _simulation()
+    terminations = []
+    terminate_execution = sim._terminate_execution
+
+    def count(execution):
+        terminations.append(execution.id)
+        terminate_execution(execution)
+    sim._terminate_execution = count
+    with sim.running() as scheduler:
+        exec_id = _submit(sim, count=4)
+        sim.run_events(until=sim.now() + 20)
+        assert exec_id in scheduler.running
+
+        execution = _execution(sim, exec_id)
+        execution.set_cleaning_up()
+        scheduler.terminate(execution)
+        future = scheduler.terminating[exec_id]
+        sim.run_events(until=sim.now() + 0.5)  # removing the containers takes a second
+        scheduler.terminate(_execution(sim, exec_id))
+        assert scheduler.terminating[exec_id] is future
+        sim.run_events()
+        assert len(scheduler.terminating) == 0
+        stats = scheduler.stats_snapshot()
+    assert terminations == [exec_id]
+    assert sum(stats['wait_time']['termination']['counts']) == 1
+    assert len(sim.cluster.containers) == 0
+
+
+def test_preempted_execution_is_requeued():
+    sim = _simulation('PRIORITY+preemption')
+    with sim.running() as scheduler:
+        victim_id = _submit(sim, memory=48 * GB, priority=256, runtime=600)
+        sim.run_events(until=sim.now() + 60)
+        preemptor_id = _submit(sim, memory=32 * GB, priority=512, runtime=100)
+        sim.run_events(until=sim.now() + 5)
+        assert sim.statuses[victim_id][-1] == Execution.SCHEDULED_STATUS
+        assert sim.sql.executions[victim_id]['time_end'] is None
+        assert preemptor_id in scheduler.starting
+        sim.run_events()
+    assert sim.statuses[victim_id][:6] == [Execution.SCHEDULED_STATUS, Execution.STARTING_STATUS, Execution.RUNNING_STATUS,
+                                           Execution.SCHEDULED_STATUS, Execution.STARTING_STATUS, Execution.RUNNING_STATUS]
+    assert sim.statuses[victim_id].index(Execution.TERMINATED_STATUS) == len(sim.statuses[victim_id]) - 1  # only when it ends
+    victim = sim.sql.executions[victim_id]
+    assert victim['time_end'] > victim['time_start']
+    assert sim.locked_calls == []
+
+
+def test_terminate_while_preempting():
+    sim = _simulation('PRIORITY+preemption')
+    with sim.running() as scheduler:
+        victim_id = _submit(sim, memory=48 * GB, priority=256, runtime=600)
+        sim.run_events(until=sim.now() + 60)
+        _submit(sim, memory=32 * GB, priority=512, runtime=100)
+        sim.run_events(until=sim.now())
+        assert victim_id in scheduler.preempted
+
+        execution = _execution(sim, victim_id)
+        execution.set_cleaning_up()
+        scheduler.terminate(execution)
+        sim.run_events()
+        assert len(scheduler.queue) == 0 and victim_id not in scheduler.running
+    assert sim.statuses[victim_id][-2:] == [Execution.CLEANING_UP_STATUS, Execution.TERMINATED_STATUS]
+    assert sim.starts[victim_id] == 1
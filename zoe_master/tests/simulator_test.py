@@ -0,0 +1,57 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+
+from zoe_lib.configargparse import Namespace
+
+from zoe_master.simulator import Simulation, DockerLatencyModel, synthetic_trace, scheduler_conf
+
+
+ARGS = Namespace(placement_policy='binpack', priority_aging_rate=0.1, fair_share_half_life=86400, preemption_priority_gap=128, preemption_min_runtime=30, max_concurrent_starts=4, max_parallel_spawns=8, max_concurrent_terminations=4)
+
+
+def test_simulation():
+    trace = synthetic_trace(20, random.Random(1))
+    for policy in ['FIFO', 'PRIORITY+backfill', 'FAIR']:
+        sim = Simulation(trace, scheduler_conf(ARGS, policy), 2, 64 * 1024 ** 3, DockerLatencyModel(random.Random(1)))
+        result = sim.run(policy)
+        assert result.completed == 20
+        assert result.errors == 0
+        assert len(sim.cluster.containers) == 0
+        assert 0 < result.utilization <= 1
+        assert result.wait_percentile(50) <= result.wait_percentile(99)
+        stats = sim.scheduler.stats_snapshot()
+        assert stats['starts_total'] == 20 and stats['count_waiting'] == 0 and stats['queue_depth'] == {}
+        assert stats['wait_time']['queue']['count'] == 20 and sum(stats['wait_time']['termination']['counts']) == 20
+
+
+@pytest.mark.parametrize('policy', ['FIFO+preemption', 'PRIORITY+preemption'])
+def test_preemption(policy):
+    gb = 1024 ** 3
+    batch = {'name': 'batch', 'priority': 512, 'will_end': True, 'runtime': 3600,
+             'services': [{'name': 'worker', 'memory': 16 * gb, 'count': 2}]}
+    lab = {'name': 'lab', 'priority': 512, 'will_end': False, 'runtime': 600,
+           'services': [{'name': 'notebook', 'memory': 4 * gb}]}
+    trace = [dict(batch, time=i) for i in range(10)] + [dict(lab, time=300 + 60 * i) for i in range(5)]
+    sim = Simulation(trace, scheduler_conf(ARGS, policy), 2, 64 * 1024 ** 3, DockerLatencyModel(random.Random(1), pull_probability=0))
+    result = sim.run(policy)
+    assert result.completed == 15
+    assert 0 < result.preemptions <= 5
+    for exec_id, runtime in sim.runtimes.items():
+        if runtime == 600:
+            assert sim.time_start[exec_id] - sim.time_submit[exec_id] < 60
@@ -0,0 +1,290 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import threading
+import time
+
+import pytest
+
+from zoe_lib.sql_manager import Execution, Service
+from zoe_master.exceptions import ZoeException
+from zoe_master.state_store import StateStore
+
+
+class FakeSQLManager:
+    """Keeps rows in dictionaries and builds new objects at each query, like SQLManager."""
+    def __init__(self):
+        self.executions = {}
+        self.services = {}
+        self.queries = 0
+        self.transactions = 0
+
+    def add_execution(self, exec_id, status):
+        self.executions[exec_id] = {'id': exec_id, 'name': 'e', 'user_id': 'u', 'description': {'services': []}, 'status': status,
+                                    'time_submit': datetime.datetime.now(), 'time_start': None, 'time_end': None, 'error_message': None}
+
+    def execution_list(self, only_one=False, include_services=False, **kwargs):
+        self.queries += 1
+        statuses = kwargs.get('status', [])
+        rows = [r for r in self.executions.values() if ('id' not in kwargs or r['id'] == kwargs['id']) and ('status' not in kwargs or r['status'] in statuses)]
+        executions = [Execution.from_dict(r, self) for r in rows]
+        if include_services:
+            self.load_services(executions)
+        if only_one:
+            return executions[0] if len(executions) > 0 else None
+        return executions
+
+    def load_services(self, executions):
+        for e in executions:
+            e._services = self.service_list(execution_id=e.id)
+
+    def execution_update(self, exec_id, **kwargs):
+        self.executions[exec_id].update(kwargs)
+
+    def service_list(self, only_one=False, **kwargs):
+        self.queries += 1
+        ret = [Service.from_dict(r, self) for r in self.services.values() if all(r[k] == v for k, v in kwargs.items())]
+        if only_one:
+            return ret[0] if len(ret) > 0 else None
+        return ret
+
+    def service_update(self, service_id, **kwargs):
+        self.services[service_id].update(kwargs)
+
+    def update_many(self, updates):
+        self.transactions += 1
+        for table, row_id, kwargs in updates:
+            if table == 'execution':
+                self.execution_update(row_id, **kwargs)
+            else:
+                self.service_update(row_id, **kwargs)
+
+    def execution_delete(self, exec_id):
+        del self.executions[exec_id]
+        for service_id in [i for i, r in self.services.items() if r['execution_id'] == exec_id]:
+            del self.services[service_id]
+
+    def services_new(self, execution_id, services):
+        ids = []
+        for name, service_group, description in services:
+            service_id = 100 + len(self.services)
+            self.services[service_id] = {'id': service_id, 'name': name, 'status': 'created', 'error_message': None, 'execution_id': execution_id,
+                                         'description': description, 'service_group': service_group, 'docker_id': None}
+            ids.append(service_id)
+        return ids
+
+
+def test_reads_from_memory():
+    sql = FakeSQLManager()
+    sql.add_execution(1, Execution.SCHEDULED_STATUS)
+    sql.add_execution(2, Execution.TERMINATED_STATUS)
+    store = StateStore(sql)
+    store.load()
+
+    execution = store.execution_list(id=1, only_one=True)
+    queries = sql.queries
+    assert store.execution_list(id=1, only_one=True) is execution
+    assert store.execution_list(status=Execution.SCHEDULED_STATUS) == [execution]
+    assert sql.queries == queries
+
+    execution.set_running()
+    store.flush()
+    assert sql.executions[1]['status'] == Execution.RUNNING_STATUS
+    store.quit()
+
+
+def test_finished_executions_leave_memory():
+    sql = FakeSQLManager()
+    sql.add_execution(1, Execution.RUNNING_STATUS)
+    store = StateStore(sql)
+    store.load()
+
+    execution = store.execution_list(id=1, only_one=True)
+    execution.set_terminated()
+    store.flush()
+    assert sql.executions[1]['status'] == Execution.TERMINATED_STATUS
+    assert store.execution_list(status=Execution.RUNNING_STATUS) == []
+    assert store.execution_list(id=1, only_one=True) is execution  # still referenced, it is the same object
+
+    execution.set_scheduled()  # for example a preempted execution that goes back in the queue
+    assert store.execution_list(id=1, only_one=True) is execution
+    assert store.execution_list(status=Execution.SCHEDULED_STATUS) == [execution]
+    store.quit()
+
+
+def test_new_services():
+    sql = FakeSQLManager()
+    sql.add_execution(1, Execution.SUBMIT_STATUS)
+    store = StateStore(sql)
+    store.load()
+
+    execution = store.execution_list(id=1, only_one=True)
+    ids = store.services_new(1, [('worker0', 'worker', {}), ('worker1', 'worker', {})])
+    execution.invalidate_services()
+    services = execution.services
+    assert [s.id for s in services] == ids
+    assert store.service_list(id=ids[0], only_one=True) is services[0]
+
+    services[0].set_active('abc')
+    store.flush()
+    assert sql.services[ids[0]]['docker_id'] == 'abc'
+    store.quit()
+
+
+def test_writes_are_grouped():
+    sql = FakeSQLManager()
+    sql.add_execution(1, Execution.RUNNING_STATUS)
+    store = StateStore(sql, write_delay=0.5)
+    store.load()
+
+    execution = store.execution_list(id=1, only_one=True)
+    ids = store.services_new(1, [('worker{}'.format(i), 'worker', {}) for i in range(10)])
+    execution.invalidate_services()
+    start = time.time()
+    for service in execution.services:
+        service.set_terminating()
+        service.set_inactive()
+    execution.set_terminated()
+    store.flush()
+    assert time.time() - start < 0.5  # flush does not wait for the delay
+    assert sql.transactions == 1
+    assert all(sql.services[i]['status'] == Service.INACTIVE_STATUS for i in ids)
+    assert sql.executions[1]['status'] == Execution.TERMINATED_STATUS
+    store.quit()
+
+
+def test_deleted_executions_are_forgotten():
+    sql = FakeSQLManager()
+    sql.add_execution(1, Execution.TERMINATED_STATUS)
+    store = StateStore(sql)
+    store.load()
+
+    execution = store.execution_list(id=1, only_one=True)
+    store.services_new(1, [('worker0', 'worker', {})])
+    service = store.service_list(execution_id=1, only_one=True)
+    store.execution_delete(1)
+    assert 1 not in sql.executions and len(sql.services) == 0
+    assert store.execution_list(id=1, only_one=True) is None  # the object is still referenced, but not returned
+    assert store.service_list(id=service.id, only_one=True) is None
+    assert execution.id == 1
+    store.quit()
+
+
+def test_flush_timeout():
+    sql = FakeSQLManager()
+    sql.add_execution(1, Execution.RUNNING_STATUS)
+    store = StateStore(sql, flush_timeout=0.2)
+    store.WRITE_RETRY_DELAY = 0.05
+    store.load()
+
+    def broken(updates):
+        raise RuntimeError('database down')
+    working = sql.update_many
+    sql.update_many = broken
+    store.execution_list(id=1, only_one=True).set_terminated()
+    with pytest.raises(ZoeException) as e:
+        store.flush()
+    assert 'database down' in str(e.value)
+
+    sql.update_many = working
+    store.flush()
+    assert sql.executions[1]['status'] == Execution.TERMINATED_STATUS
+    store.quit()
+
+
+def test_concurrent_writers_do_not_starve_flush():
+    sql = FakeSQLManager()
+    for exec_id in range(4):
+        sql.add_execution(exec_id, Execution.RUNNING_STATUS)
+    store = StateStore(sql, write_delay=0.01, write_batch_size=10, flush_timeout=5)
+    store.load()
+    stop = threading.Event()
+
+    def writer(exec_id):
+        count = 0
+        while not stop.is_set():
+            store.execution_update(exec_id, error_message=str(count))
+            count += 1
+            time.sleep(0.0001)
+
+    threads = [threading.Thread(target=writer, args=(exec_id,)) for exec_id in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        time.sleep(0.1)
+        for _ in range(5):
+            start = time.time()
+            store.flush()  # the queue is never empty, flush waits only for the changes queued before it
+            assert time.time() - start < 1
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    store.quit()
+
+
+def test_failed_batches_are_retried_in_order():
+    sql = FakeSQLManager()
+    sql.add_execution(1, Execution.RUNNING_STATUS)
+    store = StateStore(sql, write_delay=0, write_batch_size=5)
+    store.WRITE_RETRY_DELAY = 0.01
+    store.load()
+    written = []
+    failures = [3]
+
+    def flaky(updates):
+        if failures[0] > 0:
+            failures[0] -= 1
+            raise RuntimeError('connection lost')
+        written.extend(kwargs['error_message'] for table, row_id, kwargs in updates)
+
+    sql.update_many = flaky
+    for i in range(50):
+        store.execution_update(1, error_message=str(i))
+    store.flush()
+    assert failures[0] == 0
+    assert written == [str(i) for i in range(50)]
+    store.quit()
+
+
+def test_quit_with_the_database_down():
+    sql = FakeSQLManager()
+    sql.add_execution(1, Execution.RUNNING_STATUS)
+    store = StateStore(sql)
+    store.load()
+
+    def broken(updates):
+        raise RuntimeError('database down')
+    sql.update_many = broken
+    store.execution_list(id=1, only_one=True).set_terminated()
+    start = time.time()
+    store.quit(timeout=0.2)
+    assert time.time() - start < 1
+    assert not store._writer.is_alive()
+
+
+def test_archive_after_pending_writes():
+    sql = FakeSQLManager()
+    sql.add_execution(1, Execution.RUNNING_STATUS)
+    store = StateStore(sql, write_delay=0.5)
+    store.load()
+
+    def archive_executions(ended_before, batch_size):
+        return len([r for r in sql.executions.values() if r['status'] == Execution.TERMINATED_STATUS])
+    sql.archive_executions = archive_executions
+    store.execution_list(id=1, only_one=True).set_terminated()
+    assert store.archive_executions(datetime.datetime.now(), 10) == 1
+    store.quit()
@@ -0,0 +1,25 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from zoe_master.stats import SchedulerStats
+
+
+def test_recent_starts_are_trimmed_without_polling():
+    stats = SchedulerStats()
+    for now in range(1000):
+        stats.started(float(now))
+    assert len(stats._recent_starts) == SchedulerStats.THROUGHPUT_WINDOW + 1
+    assert stats.start_throughput(999.0) == SchedulerStats.THROUGHPUT_WINDOW + 1
+    assert stats.start_throughput(2000.0) == 0
@@ -0,0 +1,31 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from zoe_master.timer_wheel import TimerWheel
+
+
+def test_timer_wheel():
+    wheel = TimerWheel(tick=1, slots=8)
+    now = wheel.last_tick
+    wheel.schedule('a', 2, 'a')
+    wheel.schedule('b', 20, 'b')  # more than a full turn of the wheel
+    wheel.schedule('c', 3, 'c')
+    assert wheel.cancel('c') == 'c'
+    assert len(wheel) == 2
+    assert wheel.advance(now + 1) == []
+    assert wheel.advance(now + 4) == ['a']
+    assert wheel.advance(now + 12) == []
+    assert wheel.advance(now + 100) == ['b']
+    assert len(wheel) == 0
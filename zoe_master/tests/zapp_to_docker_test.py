@@ -0,0 +1,104 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+import pytest
+
+from zoe_lib.configargparse import Namespace
+from zoe_lib.exceptions import ZoeException
+from zoe_lib.sql_manager import Execution, Service
+
+import zoe_master.config as config
+import zoe_master.zapp_to_docker
+from zoe_master.exceptions import ZoeStartExecutionFatalException, ZoeStartExecutionRetryException
+from zoe_master.zapp_to_docker import execution_to_containers
+
+
+class StubSwarmClient:
+    """Spawns containers instantly, images called 'unreachable' cannot be pulled."""
+    spawned = []
+    removed = []
+    lock = threading.Lock()
+
+    def __init__(self, conf):
+        pass
+
+    def spawn_container(self, image, options):
+        if image == 'unreachable':
+            raise ZoeException('cannot pull image {}'.format(image))
+        with self.lock:
+            self.spawned.append(options.name)
+        return {'docker_id': options.name}
+
+    def terminate_container(self, docker_id, delete=False):
+        with self.lock:
+            self.removed.append(docker_id)
+
+
+class FakeSQLManager:
+    def execution_update(self, exec_id, **kwargs):
+        pass
+
+    def service_update(self, service_id, **kwargs):
+        pass
+
+
+@pytest.fixture
+def swarm(monkeypatch):
+    config.load_configuration(test_conf=Namespace(deployment_name='test', gelf_address='', overlay_network_name='zoe', max_parallel_spawns=8, max_parallel_removals=8))
+    monkeypatch.setattr(zoe_master.zapp_to_docker, 'SwarmClient', StubSwarmClient)
+    StubSwarmClient.spawned = []
+    StubSwarmClient.removed = []
+    return StubSwarmClient
+
+
+def _execution(services: list) -> Execution:
+    """An execution with one service for each (name, startup order, image, environment) tuple."""
+    sql = FakeSQLManager()
+    execution = Execution.from_dict({'id': 1, 'name': 'test', 'user_id': 'alice', 'description': {}, 'status': Execution.STARTING_STATUS,
+                                     'time_submit': 0, 'time_start': None, 'time_end': None, 'error_message': None}, sql)
+    execution._services = []
+    for service_id, (name, startup_order, image, environment) in enumerate(services):
+        description = {'name': name, 'startup_order': startup_order, 'docker_image': image, 'environment': environment, 'monitor': False,
+                       'ports': [], 'required_resources': {'memory': 1024 ** 3}, 'essential_count': 1, 'total_count': 1}
+        execution._services.append(Service.from_dict({'id': service_id, 'name': name, 'status': 'created', 'error_message': None, 'execution_id': 1,
+                                                      'description': description, 'service_group': name, 'docker_id': None}, sql))
+    return execution
+
+
+def test_spawn_tiers(swarm):
+    execution = _execution([('master', 0, 'image', []), ('worker0', 1, 'image', []), ('worker1', 1, 'image', [])])
+    execution_to_containers(execution)
+    assert swarm.spawned[0] == 'master-1-test' and sorted(swarm.spawned[1:]) == ['worker0-1-test', 'worker1-1-test']
+    assert all(s.status == Service.ACTIVE_STATUS for s in execution.services)
+
+
+def test_fatal_errors_win(swarm):
+    execution = _execution([('master', 0, 'image', []), ('ok', 1, 'image', []), ('pull', 1, 'unreachable', []), ('env', 1, 'image', [['X', '{unknown}']])])
+    with pytest.raises(ZoeStartExecutionFatalException):
+        execution_to_containers(execution)
+    # the containers of the failed tier and of the previous tiers are removed
+    assert sorted(swarm.removed) == ['master-1-test', 'ok-1-test']
+    assert all(s.docker_id is None for s in execution.services)
+
+
+def test_temporary_error(swarm):
+    execution = _execution([('ok', 0, 'image', []), ('pull', 0, 'unreachable', []), ('never', 1, 'image', [])])
+    with pytest.raises(ZoeStartExecutionRetryException):
+        execution_to_containers(execution)
+    assert swarm.removed == ['ok-1-test']
+    assert 'never-1-test' not in swarm.spawned
+    assert all(s.docker_id is None for s in execution.services)
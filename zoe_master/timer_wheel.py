@@ -0,0 +1,68 @@
+# Copyright (c) 2016, Daniele Venzano
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+
+class TimerWheel:
+    """
+    A hashed timer wheel. Time is divided in ticks, each timer goes in the slot of the tick it is due at, modulo the
+    number of slots. Scheduling and cancelling are O(1), advancing the wheel only looks at the slots of elapsed ticks.
+    Timers are identified by a key, scheduling a key again replaces its timer.
+    """
+    def __init__(self, tick=1.0, slots=256, clock=time.time):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [{} for _ in range(slots)]  # key -> (due tick, item)
+        self.slot_of = {}  # key -> slot index
+        self.last_tick = self._tick_of(self.clock())
+
+    def _tick_of(self, timestamp):
+        return int(timestamp / self.tick)
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, key):
+        return key in self.slot_of
+
+    def schedule(self, key, delay: float, item):
+        self.cancel(key)
+        due_tick = max(self._tick_of(self.clock() + delay), self.last_tick + 1)
+        idx = due_tick % len(self.slots)
+        self.slots[idx][key] = (due_tick, item)
+        self.slot_of[key] = idx
+
+    def cancel(self, key):
+        """Removes a timer, returns its item or None if the key is not in the wheel."""
+        idx = self.slot_of.pop(key, None)
+        if idx is None:
+            return None
+        return self.slots[idx].pop(key)[1]
+
+    def advance(self, now=None) -> list:
+        """Returns the items of all the timers that are due, removing them from the wheel."""
+        if now is None:
+            now = self.clock()
+        now_tick = self._tick_of(now)
+        due = []
+        first_tick = max(self.last_tick + 1, now_tick - len(self.slots) + 1)
+        for t in range(first_tick, now_tick + 1):
+            slot = self.slots[t % len(self.slots)]
+            for key in [k for k, v in slot.items() if v[0] <= now_tick]:
+                due.append(slot.pop(key)[1])
+                del self.slot_of[key]
+        self.last_tick = max(self.last_tick, now_tick)
+        return due
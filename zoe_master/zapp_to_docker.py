@@ -13,19 +13,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import logging
+import threading
 
 from zoe_lib.sql_manager import Execution, Service
-from zoe_master.exceptions import ZoeStartExecutionRetryException, ZoeStartExecutionFatalException, ZoeException
+from zoe_master.exceptions import ZoeStartExecutionRetryException, ZoeStartExecutionFatalException, ZoeStartExecutionCancelledException, ZoeException
 from zoe_master.config import get_conf, singletons
 from zoe_lib.swarm_client import DockerContainerOptions, SwarmClient
+import zoe_lib.exceptions
 import zoe_master.workspace.base
 
 log = logging.getLogger(__name__)
 
 
-def execution_to_containers(execution: Execution):
-    ordered_service_list = sorted(execution.services, key=lambda x: x.description['startup_order'])
+def execution_to_containers(execution: Execution, cancel_event: threading.Event=None, placement: dict=None, services: list=None):
+    """
+    Spawn the containers of the services of an execution, following their startup order.
+    :param execution: the execution to start
+    :param cancel_event: if set while services are being spawned, the start is abandoned before the next service
+    :param placement: service ID -> Swarm node name, services that are not in the dictionary are placed by Swarm
+    :param services: the services to spawn, all the services of the execution if None
+    :return: None
+    """
+    all_services = execution.services
+    if services is None:
+        services = all_services
+    ordered_service_list = sorted(services, key=lambda x: x.description['startup_order'])
 
     env_subst_dict = {
         "execution_name": execution.name,
@@ -33,17 +48,64 @@ def execution_to_containers(execution: Execution):
         'deployment_name': get_conf().deployment_name,
     }
 
-    for service in ordered_service_list:
+    for service in all_services:
         env_subst_dict['dns_name#' + service.name] = service.dns_name
 
-    for service in ordered_service_list:
-        env_subst_dict['dns_name#self'] = service.dns_name
-        service.set_starting()
-        _spawn_service(execution, service, env_subst_dict)
+    spawned = []
+    for startup_order, tier in itertools.groupby(ordered_service_list, key=lambda x: x.description['startup_order']):
+        if cancel_event is not None and cancel_event.is_set():
+            _rollback(spawned)
+            raise ZoeStartExecutionCancelledException('execution {} terminated while starting'.format(execution.id))
+        tier = list(tier)
+        for service in tier:
+            service.set_starting()
+        try:
+            _spawn_tier(execution, tier, env_subst_dict, placement)
+        except Exception:
+            _rollback(spawned)
+            raise
+        spawned += tier  # services with a higher startup order are spawned only when all the services of this tier are up
+
+
+def _spawn_tier(execution: Execution, tier: list, env_subst_dict: dict, placement: dict):
+    """
+    Spawn concurrently services that share the same startup order. If any of them fails, the ones that were spawned are
+    terminated and the exception is raised again, fatal errors taking precedence over temporary ones.
+    """
+    def spawn(service):
+        service_env = dict(env_subst_dict)
+        service_env['dns_name#self'] = service.dns_name
+        node = placement.get(service.id) if placement is not None else None
+        _spawn_service(execution, service, service_env, node)
+
+    if len(tier) == 1:
+        errors = []
+        try:
+            spawn(tier[0])
+        except Exception as e:
+            errors.append(e)
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(tier), get_conf().max_parallel_spawns)) as pool:
+            futures = [pool.submit(spawn, service) for service in tier]
+        errors = [f.exception() for f in futures if f.exception() is not None]
+    if len(errors) == 0:
+        return
+    _rollback([s for s in tier if s.docker_id is not None])
+    fatal = [e for e in errors if not isinstance(e, ZoeStartExecutionRetryException)]
+    raise fatal[0] if len(fatal) > 0 else errors[0]
+
+
+def _rollback(services: list):
+    for service in services:
+        try:
+            terminate_service(service)
+        except Exception:
+            log.exception('Error rolling back service {}'.format(service.name))
 
 
-def _spawn_service(execution: Execution, service: Service, env_subst_dict: dict):
+def _spawn_service(execution: Execution, service: Service, env_subst_dict: dict, node: str=None):
     copts = DockerContainerOptions()
+    copts.node_constraint = node
     copts.gelf_log_address = get_conf().gelf_address
     copts.name = service.dns_name
     copts.set_memory_limit(service.description['required_resources']['memory'])
@@ -96,7 +158,7 @@ def _spawn_service(execution: Execution, service: Service, env_subst_dict: dict)
 
     try:
         cont_info = swarm.spawn_container(service.description['docker_image'], copts)
-    except ZoeException as e:
+    except (ZoeException, zoe_lib.exceptions.ZoeException) as e:  # the Swarm client raises the zoe_lib exception
         raise ZoeStartExecutionRetryException(str(e))
 
     service.set_active(cont_info["docker_id"])
@@ -111,14 +173,29 @@ def _spawn_service(execution: Execution, service: Service, env_subst_dict: dict)
     return
 
 
+def terminate_service(service: Service) -> None:
+    """Remove the container of a single service, the service can be spawned again later."""
+    if service.docker_id is None:
+        return
+    swarm = SwarmClient(get_conf())
+    service.set_terminating()
+    swarm.terminate_container(service.docker_id, delete=True)
+    service.set_inactive()
+    log.debug('Service {} terminated'.format(service.name))
+
+
 def terminate_execution(execution: Execution) -> None:
+    """Remove the containers of all the services of an execution and set it in the terminated state."""
     execution.set_cleaning_up()
-    swarm = SwarmClient(get_conf())
-    for s in execution.services:
-        assert isinstance(s, Service)
-        if s.docker_id is not None:
-            s.set_terminating()
-            swarm.terminate_container(s.docker_id, delete=True)
-            s.set_inactive()
-            log.debug('Service {} terminated'.format(s.name))
+    remove_containers(execution)
     execution.set_terminated()
+
+
+def remove_containers(execution: Execution) -> None:
+    """Remove the containers of all the services of an execution, in parallel, without changing its state."""
+    services = [s for s in execution.services if s.docker_id is not None]
+    if len(services) > 0:
+        with ThreadPoolExecutor(max_workers=min(len(services), get_conf().max_parallel_removals)) as pool:
+            for f in [pool.submit(terminate_service, s) for s in services]:
+                if f.exception() is not None:
+                    log.error('Error terminating a service of execution {}: {}'.format(execution.id, f.exception()))